@@ -0,0 +1,204 @@
+'''
+Per-chunk context retrieval for parser prompts.
+
+Instead of pasting the whole device list and ontology into every prompt, devices and ontology
+statements are indexed by the words of their names, labels, types, attributes and commands.
+For a chunk of rules the prompt then carries only
+    - the devices / spaces / equipment whose identifying words appear in the rules
+      ("Office 1A" -> office1a -> Office_1A, VAV_1A "VAV for Office 1A", Luminaire_Office_1A, ...)
+    - their one-hop ontology neighbours: what they contain / locate / feed, and the statements
+      that reference them (the floor a room is on, the AHU feeding a VAV, ...)
+Words shared by many entities ("sensor", "office", "temperature") do not select anything on
+their own, unless they carry a digit (room101, office1a name a place or an instance). If a rule matches nothing even with those words, the chunk falls back to the full context.
+
+Usage:
+    retriever = ContextRetriever(device_data, building_data)
+    device_text, ontology_text = retriever.select(rule_text)
+'''
+
+import json
+import re
+from collections import defaultdict
+
+# a word without digits selects entities only if at most max(MIN_SPECIFIC_DF, SPECIFIC_DF_RATIO * #entities) have it
+MIN_SPECIFIC_DF = 3
+SPECIFIC_DF_RATIO = 0.05
+STOPWORDS = {'a', 'an', 'and', 'are', 'at', 'be', 'by', 'for', 'from', 'if', 'in', 'is', 'it', 'of', 'on',
+             'or', 'the', 'then', 'to', 'when', 'with', 'rule'}
+PNAME_PATTERN = re.compile(r'(?:<([^>]*)>|(?<![\w"])([A-Za-z][\w\-]*)?:([\w\-]+))')
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z0-9]+(?:_[A-Za-z0-9]+)+')
+RULE_ID_PATTERN = re.compile(r'^\s*Rule_\d+\s*:')
+LABEL_PATTERN = re.compile(r'(?:rdfs:)?label\s+"([^"]*)"')
+
+# ==============================================================================
+# 1. Tokenization
+# ==============================================================================
+def _stem(word):
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def name_words(text):
+    """
+    words of an identifier or a sentence, lowercased and lightly stemmed, plus every pair of
+    adjacent words joined ("Office 1A" / "Office_1A" -> office, 1a, office1a); stopwords are dropped
+    first. pure numbers only count inside pairs, so "21°C" or "10 minutes" do not match "Floor_1".
+    """
+    segments = [s for s in re.split(r'[^A-Za-z0-9]+', text) if s and s.lower() not in STOPWORDS]
+    words = []
+    for segment in segments:
+        lower = _stem(segment.lower())
+        words.append(lower)
+        # ConfRoom -> conf, room (the joined form is kept as well)
+        parts = re.findall(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+[A-Za-z]*', segment)
+        if len(parts) > 1:
+            words.extend(_stem(p.lower()) for p in parts)
+    pairs = {_stem(a.lower()) + _stem(b.lower()) for a, b in zip(segments, segments[1:])}
+    return {w for w in words if w not in STOPWORDS and not w.isdigit() and len(w) > 1} | pairs
+
+
+def _local(name):
+    return re.split(r'[#/:]', name)[-1].lower()
+
+# ==============================================================================
+# 2. Index
+# ==============================================================================
+def split_statements(text):
+    """
+    split turtle into (header lines, statements); a statement runs until a line ending in '.'
+    """
+    header, statements, current = [], [], []
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if not current and (not stripped or stripped.startswith('#')):
+            continue
+        if not current and re.match(r'(@prefix|@base|PREFIX|BASE)\b', stripped):
+            header.append(line)
+            continue
+        current.append(line)
+        if stripped.endswith('.') and ''.join(current).count('"""') % 2 == 0:
+            statements.append(''.join(current))
+            current = []
+    if current:
+        statements.append(''.join(current))
+    return header, statements
+
+
+class ContextRetriever:
+    def __init__(self, device_data, building_data):
+        devices = json.loads(device_data)
+        # the device list is either a list or {"devices": [...]}; keep the shape for the pruned copy
+        self.device_key = None
+        if isinstance(devices, dict):
+            self.device_key = next((k for k, v in devices.items() if isinstance(v, list)), None)
+            devices = devices[self.device_key] if self.device_key else [devices]
+        self.devices = devices
+        self.full_device_text = device_data
+        self.full_ontology_text = building_data
+
+        self.header, self.statements = split_statements(building_data)
+        # entity (lowercased local name) -> words, statement indexes, referenced entities
+        self.entity_words = defaultdict(set)
+        self.attribute_words = defaultdict(set)
+        self.entity_statements = defaultdict(list)
+        self.device_index = defaultdict(list)
+        statement_refs = []
+        for i, statement in enumerate(self.statements):
+            refs = [iri or local for iri, _, local in PNAME_PATTERN.findall(statement)]
+            refs = [_local(r) for r in refs if r]
+            statement_refs.append(refs)
+            if refs:
+                subject = refs[0]
+                self.entity_statements[subject].append(i)
+                self.entity_words[subject] |= name_words(subject)
+                for label in LABEL_PATTERN.findall(statement):
+                    self.entity_words[subject] |= name_words(label)
+        # only declared subjects count as entities (not brick:Office, brick:hasPart, ...)
+        self.statement_refs = [[r for r in refs if r in self.entity_statements] for refs in statement_refs]
+        self.referenced_by = defaultdict(set)
+        for i, refs in enumerate(self.statement_refs):
+            for ref in refs[1:]:
+                self.referenced_by[ref].add(i)
+
+        for d_idx, device in enumerate(self.devices):
+            ident = device.get('identification', {})
+            name = ident.get('device_name') or ident.get('device_ambiguous_name') or ''
+            key = _local(name)
+            self.device_index[key].append(d_idx)
+            self.entity_words[key] |= name_words(name) | name_words(ident.get('type') or '')
+            capabilities = device.get('capabilities', {})
+            for item in capabilities.get('measurable_attributes', []) + capabilities.get('commands', []):
+                self.attribute_words[key] |= name_words(item.get('name') or '')
+
+        self.word_entities = defaultdict(set)
+        for entity, words in self.entity_words.items():
+            for word in words:
+                self.word_entities[word].add(entity)
+        self.attribute_entities = defaultdict(set)
+        for entity, words in self.attribute_words.items():
+            for word in words:
+                self.attribute_entities[word].add(entity)
+        self.max_df = max(MIN_SPECIFIC_DF, int(SPECIFIC_DF_RATIO * len(self.entity_words)))
+
+    def match(self, rule_text, specific_only=True):
+        """
+        entities named by one rule. the relaxed pass (specific_only=False) also accepts common
+        name words and attribute / command names ("open", "position"), which are too vague to
+        select anything while a rule names its devices or spaces.
+        """
+        matched = set()
+        # identifiers spelled out in the rule (VAV_1B, Window_Contact_Office_1B) select exactly that entity,
+        # their pieces (window, contact, office) must not pull in every look-alike
+        for identifier in IDENTIFIER_PATTERN.findall(rule_text):
+            if identifier.lower() in self.entity_words:
+                matched.add(identifier.lower())
+                rule_text = rule_text.replace(identifier, ' ')
+        for word in name_words(rule_text):
+            entities = self.word_entities.get(word, set())
+            # words with digits (office1a, room101, 2f) identify a place or an instance, keep them regardless
+            if not specific_only or len(entities) <= self.max_df or any(c.isdigit() for c in word):
+                matched |= entities
+            if not specific_only:
+                matched |= self.attribute_entities.get(word, set())
+        return matched
+
+    def neighbours(self, entities):
+        """one hop: what the entities' statements reference, and who references them"""
+        result = set()
+        for entity in entities:
+            for i in self.entity_statements.get(entity, ()):
+                result.update(self.statement_refs[i][1:])
+            for i in self.referenced_by.get(entity, ()):
+                result.add(self.statement_refs[i][0])
+        return result
+
+    def select(self, rule_text):
+        """
+        (device JSON, ontology turtle) restricted to what the rules in rule_text need
+        """
+        matched = set()
+        for rule in rule_text.splitlines():
+            # the "Rule_12:" numbering is not a device reference
+            rule = RULE_ID_PATTERN.sub('', rule)
+            if not rule.strip():
+                continue
+            entities = self.match(rule) or self.match(rule, specific_only=False)
+            if not entities:
+                # nothing to anchor this rule to: keep the prompt exactly as before
+                return self.full_device_text, self.full_ontology_text
+            matched |= entities
+        selected = matched | self.neighbours(matched)
+
+        statement_ids = set()
+        for entity in selected:
+            statement_ids.update(self.entity_statements.get(entity, ()))
+        for entity in matched:
+            statement_ids.update(self.referenced_by.get(entity, ()))
+        ontology_text = ''.join(self.header) + '\n' + '\n'.join(self.statements[i].rstrip('\n')
+                                                                  for i in sorted(statement_ids)) + '\n'
+
+        device_ids = sorted({d for entity in selected for d in self.device_index.get(entity, ())})
+        devices = [self.devices[d] for d in device_ids]
+        device_text = json.dumps({self.device_key: devices} if self.device_key else devices, ensure_ascii=False, indent=2)
+        return device_text, ontology_text
@@ -1,8 +1,23 @@
 import os
-from openai import OpenAI
-import json
+import sys
+import hashlib
+import asyncio
 import threading
-import re
+from functools import partial
+from openai import OpenAI, AsyncOpenAI
+import json
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from llm_cache import LLMCache
+from llm_scheduler import LLMScheduler, estimate_tokens
+from llm_async import AsyncLLMRunner
+from chunk_planner import plan_chunks, split_chunk
+from llm_json import decode_response
+from llm_stream import stream_completion
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from context_retriever import ContextRetriever
+from rule_merger import RuleMerger, validate_rule
 
 '''d
 model list：
@@ -20,11 +35,46 @@ output_dir = f'./1-SemanticParser/output/{model_name}'
 
 os.makedirs(output_dir, exist_ok=True)
 
+# OPENAI_BASE_URL can point at common/mock_llm_server.py to replay recorded answers offline
+api_key = os.environ.get("OPENAI_API_KEY", "")
+base_url = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
 client = OpenAI(
-    api_key="",
-    base_url = "https://api.openai.com/v1"
+    api_key=api_key,
+    base_url = base_url
 )
 
+# unchanged chunks (same model, prompt, rules, devices and ontology) are answered from disk
+llm_cache = LLMCache()
+
+# request fan-out limits: concurrent requests, requests per minute, (estimated) tokens per minute
+max_concurrency = 8
+requests_per_minute = 60
+tokens_per_minute = 1000000
+# 'threads': bounded thread pool with the sync client; 'async': one event loop with the async client
+execution_mode = 'threads'
+# async mode only: seconds before a single request is abandoned and retried
+request_timeout = 600
+
+# token budget per request: the model's context window, the completion budget reserved for the answer
+# and a rough number of answer tokens per parsed rule (caps how many rules one answer can hold)
+context_window = 1000000
+max_output_tokens = 65536
+output_tokens_per_rule = 1000
+# optional hard cap on rules per chunk (None: only the token budget decides)
+max_rules_per_chunk = None
+completion_params = {'max_completion_tokens': max_output_tokens}
+# only send the devices / ontology statements a chunk's rules refer to (and their neighbours)
+prune_context = True
+# stream answers and append each schema-valid rule to parsed_rules.stream.ndjson as soon as it closes
+stream_responses = False
+stream_output_path = os.path.join(output_dir, 'parsed_rules.stream.ndjson')
+# incremental re-parse: rules whose text and relevant context are unchanged since the last run are not re-sent
+incremental = True
+manifest_path = os.path.join(output_dir, 'parse_manifest.json')
+MANIFEST_VERSION = 1
+merged_output_path = os.path.join(output_dir, 'parsed_rules.json')
+flagged_output_path = os.path.join(output_dir, 'flagged_rules.json')
+
 
 with open('./1-SemanticParser/prompt.txt', 'r', encoding='utf-8') as f1:
     prompt_text = f1.read()
@@ -34,73 +84,231 @@ with open('./1-SemanticParser/input/device_list/device_test.json', 'r', encoding
     device_data = f3.read()
 
 
-rule_files = []
-rule_path = './1-SemanticParser/input/rule_description/rule_test.txt'
-with open(rule_path, 'r', encoding='utf-8') as f:
-    lines = f.readlines()
-
-
-chunk_size = 30  
-
-for i in range(0, len(lines), chunk_size):
-    chunk = lines[i:i+chunk_size]
-    split_path = os.path.join(output_dir, f'rule_split_{i//chunk_size+1}.txt')
-    with open(split_path, 'w', encoding='utf-8') as f_split:
-        f_split.writelines(chunk)
-    rule_files.append(split_path)
-
-
-output_jsons = []
-
-def process_rule(idx, rule_file):
-    print(f'------------------------{idx}th chunk------------------------')
-    with open(rule_file, 'r', encoding='utf-8') as f:
-        rule_text = f.read()
-
-    full_prompt = f'''
+def build_prompt(rule_text, device_text=None, ontology_text=None):
+    if device_text is None:
+        device_text = device_data
+    if ontology_text is None:
+        ontology_text = building_data
+    return f'''
 {prompt_text}\n
 -------------------------------
 #input1-rule text:
 {rule_text}\n
 -------------------------------
 #input2.device attributes list (JSON format):
-{device_data}\n
+{device_text}\n
 #input3.building ontology information (e.g. excerpt based on Brick Schema):
-{building_data}\n
+{ontology_text}\n
 '''
 
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {
-                "role": "user",
-                "content": full_prompt,
-            }
-        ],
-        model=model_name,
-        stream=False,
-        max_completion_tokens=65536
-    )
-    result = chat_completion.choices[0].message.content
-
-    result = re.sub(r'^<think>.*?</think>\s*', '', result, flags=re.DOTALL)
-    result = result.lstrip('\n')
-    if result.startswith('```json'):
-        result = result[len('```json'):].strip()
-    if result.endswith('```'):
-        result = result[:-len('```')].strip()
 
+retriever = ContextRetriever(device_data, building_data) if prune_context else None
+
+def rule_context(rule_text):
+    if retriever is None:
+        return device_data, building_data
+    return retriever.select(rule_text)
+
+def build_chunk_prompt(chunk):
+    rule_text = ''.join(rules[i] for i in chunk)
+    return build_prompt(rule_text, *rule_context(rule_text))
+
+def rule_key(rule):
+    """hash of everything that decides a rule's parse: model, prompt, rule line and its device / ontology context"""
+    payload = json.dumps([model_name, prompt_text, rule.strip(), *rule_context(rule)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def load_manifest():
+    """{rule key: [parsed rule JSON]} from the last run"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('rules', {})
+
+def write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
 
+
+rule_path = './1-SemanticParser/input/rule_description/rule_test.txt'
+with open(rule_path, 'r', encoding='utf-8') as f:
+    rules = [line if line.endswith('\n') else line + '\n' for line in f if line.strip()]
+
+rule_keys = [rule_key(rule) for rule in rules]
+previous = load_manifest() if incremental else {}
+changed = [i for i, key in enumerate(rule_keys) if key not in previous]
+print(f"{len(rules) - len(changed)} rules unchanged since the last run, {len(changed)} to parse")
+
+# pack the changed rules into as few requests as the token budget allows (chunks hold rule indexes)
+rules_per_answer = max(1, max_output_tokens // output_tokens_per_rule)
+chunks = plan_chunks(changed,
+                     fixed_tokens=estimate_tokens(build_prompt('')),
+                     input_budget=context_window - max_output_tokens,
+                     max_items=min(rules_per_answer, max_rules_per_chunk or rules_per_answer),
+                     count_tokens=lambda i: estimate_tokens(rules[i]))
+print(f"{len(changed)} rules packed into {len(chunks)} chunks")
+
+for idx, chunk in enumerate(chunks, 1):
+    split_path = os.path.join(output_dir, f'rule_split_{idx}.txt')
+    with open(split_path, 'w', encoding='utf-8') as f_split:
+        f_split.writelines(rules[i] for i in chunk)
+
+
+def save_result(idx, parsed_rules):
     output_path_split = os.path.join(output_dir, f'result-{idx}.json')
     with open(output_path_split, 'w', encoding='utf-8') as f:
-        f.write(result)
+        json.dump(parsed_rules, f, ensure_ascii=False, indent=2)
     print(f"{idx}th chunk saved to: {output_path_split}")
 
+def job_label(job_id):
+    # (3,) -> "3", (3, 2, 1) -> "3.2.1" for the halves of a re-split chunk
+    return '.'.join(str(part) for part in job_id)
+
+stream_lock = threading.Lock()
+streamed = set()
+stream_file = open(stream_output_path, 'w', encoding='utf-8') if stream_responses else None
+
+def emit_rule(job_id, rule):
+    """
+    streaming mode: write a rule the moment its object closes (the merged file still comes at the end)
+    """
+    if validate_rule(rule):
+        return
+    with stream_lock:
+        # a retried request replays rules that were already written
+        if (job_id, rule['rule_id']) in streamed:
+            return
+        streamed.add((job_id, rule['rule_id']))
+        stream_file.write(json.dumps(rule, ensure_ascii=False) + '\n')
+        stream_file.flush()
+
+def complete_prompts(prompts, on_result):
+    """
+    send {job_id: prompt}; on_result(job_id, response text) is called as each answer arrives
+    """
+    if execution_mode == 'async':
+        runner = AsyncLLMRunner(AsyncOpenAI(api_key=api_key, base_url=base_url), model_name, cache=llm_cache,
+                                max_concurrency=max_concurrency,
+                                requests_per_minute=requests_per_minute,
+                                tokens_per_minute=tokens_per_minute,
+                                request_timeout=request_timeout)
+        asyncio.run(runner.run(prompts.items(), on_result=on_result,
+                               on_item=emit_rule if stream_responses else None, **completion_params))
+        print(runner.report())
+        return runner.failed()
+
+    scheduler = LLMScheduler(max_concurrency=max_concurrency,
+                             requests_per_minute=requests_per_minute,
+                             tokens_per_minute=tokens_per_minute)
+    for job_id, prompt in prompts.items():
+        if stream_responses:
+            scheduler.submit(job_id, stream_completion, client, model_name, prompt, partial(emit_rule, job_id),
+                             cache=llm_cache, estimated_tokens=estimate_tokens(prompt), **completion_params)
+        else:
+            scheduler.submit(job_id, llm_cache.complete, client, model_name, prompt,
+                             estimated_tokens=estimate_tokens(prompt), **completion_params)
+    scheduler.run(on_result=on_result)
+    print(scheduler.report())
+    return scheduler.failed()
+
+
+merger = RuleMerger(reused={i: previous[key] for i, key in enumerate(rule_keys) if key in previous})
+# input rule index -> why it is still missing from the merged output
+flagged = {}
+
+def handle_response(job_id, response):
+    """
+    merge stage, run as each answer arrives: decode, validate per rule, queue what must be asked again
+    """
+    chunk = pending[job_id]
+    try:
+        decoded = decode_response(response)
+    except ValueError:
+        retry_rules = list(chunk)
+        reason = 'no JSON in the answer'
+        for i in chunk:
+            flagged[i] = [reason]
+    else:
+        if decoded.repaired:
+            # cut-off answer: its complete leading rules belong to the leading rules of the chunk
+            answered = chunk[:decoded.items] if isinstance(decoded.data, list) else chunk
+            print(f"Chunk {job_label(job_id)}: answer cut off, recovered {decoded.items} of {len(chunk)} rules")
+            retry_rules = merger.add_chunk(answered, decoded.data) + [i for i in chunk if i not in answered]
+        else:
+            retry_rules = merger.add_chunk(chunk, decoded.data)
+        reason = f'{len(retry_rules)} rules missing or failed schema validation'
+        for i in chunk:
+            if i in retry_rules:
+                flagged[i] = merger.invalid.get(i, ['missing from a cut-off answer'])
+            else:
+                flagged.pop(i, None)
+    if not retry_rules:
+        return
+    # don't replay the rejected answer from the cache on the next run
+    llm_cache.discard(model_name, prompts[job_id], completion_params)
+    if len(retry_rules) > 1 and all(i in merger.mismatched for i in retry_rules):
+        print(f"Chunk {job_label(job_id)}: answer does not have one rule per input rule, "
+              f"asking again for each of its {len(retry_rules)} rules on its own")
+        for n, i in enumerate(retry_rules, 1):
+            retry[job_id + (n,)] = [i]
+    elif len(retry_rules) < len(chunk):
+        print(f"Chunk {job_label(job_id)}: {reason}, asking again for those rules")
+        retry[job_id + (1,)] = retry_rules
+    elif len(chunk) > 1:
+        left, right = split_chunk(chunk)
+        print(f"Chunk {job_label(job_id)}: {reason}, retrying as {len(left)} + {len(right)} rules")
+        retry[job_id + (1,)] = left
+        retry[job_id + (2,)] = right
+    else:
+        print(f"Chunk {job_label(job_id)}: {reason} for a single rule, giving up")
+
+
+# request rounds: rejected rules are asked again (a fully rejected chunk is halved) until nothing is left
+pending = {(idx,): chunk for idx, chunk in enumerate(chunks, 1)}
+while pending:
+    print(f'------------------------{len(pending)} chunks------------------------')
+    prompts = {job_id: build_chunk_prompt(chunk) for job_id, chunk in pending.items()}
+    if retriever is not None:
+        full_tokens = sum(estimate_tokens(build_prompt(''.join(rules[i] for i in chunk))) for chunk in pending.values())
+        sent_tokens = sum(estimate_tokens(prompt) for prompt in prompts.values())
+        print(f"prompt tokens (estimated): {sent_tokens} of {full_tokens} with the full device list and ontology")
+    retry = {}
+    for job_id in complete_prompts(prompts, on_result=handle_response):
+        for i in pending[job_id]:
+            flagged[i] = ['request failed after all retries']
+    pending = retry
+
+for idx, chunk in enumerate(chunks, 1):
+    chunk_rules = [parsed_rule for i in chunk for parsed_rule in merger.parsed_by_rule.get(i, [])]
+    if chunk_rules:
+        save_result(idx, chunk_rules)
+
+# one ordered rules file: unchanged rules from the manifest plus the validated new answers
+write_json(manifest_path, {'version': MANIFEST_VERSION,
+                           'rules': {rule_keys[i]: parsed_rules for i, parsed_rules in merger.parsed_by_rule.items()}})
+merged_rules = merger.merged_rules()
+write_json(merged_output_path, merged_rules)
+print(f"{len(merged_rules)} parsed rules ({len(rules) - len(changed)} reused, {merger.duplicates} duplicate "
+      f"rule_ids dropped) saved to: {merged_output_path}")
+for rule_id, kept, dropped in merger.conflicts:
+    print(f"Warning: rule_id {rule_id} was given to two different rules; kept the first one.\n"
+          f"    kept:    {kept}\n    dropped: {dropped}")
+
+# flagged rules are not in the manifest, so the next run asks for them again
+flagged_rules = [{'rule_index': i + 1, 'rule': rules[i].strip(), 'errors': flagged[i]} for i in sorted(flagged)]
+write_json(flagged_output_path, flagged_rules)
+if flagged_rules:
+    print(f"Warning: {len(flagged_rules)} rules are missing from the merged output (see {flagged_output_path}); "
+          f"re-run to request them again.")
 
-threads = []
-for idx, rule_file in enumerate(rule_files, 1):
-    t = threading.Thread(target=process_rule, args=(idx, rule_file))
-    t.start()
-    threads.append(t)
+if stream_file is not None:
+    stream_file.close()
+    print(f"{len(streamed)} rules streamed to: {stream_output_path}")
 
-for t in threads:
-    t.join()
+print(llm_cache.report())
@@ -0,0 +1,143 @@
+'''
+Merge stage for parser chunk answers.
+
+Every chunk answer is checked rule by rule against the structured-rule schema (prompt.txt) as
+soon as it arrives. Valid rules are kept per input rule; rules that fail are handed back for
+re-request instead of reaching stage 2. An answer with a different number of rules than its
+chunk cannot be attributed rule by rule, so its rules are asked again one per request.
+At the end the rules are written as one file in input order, with repeated rule_ids
+de-duplicated: rule_ids are never rewritten (later stages key on them), the first rule with a
+rule_id in input order is kept and later ones are dropped. A dropped rule with a different
+description is a conflict, recorded in merger.conflicts.
+
+Usage:
+    merger = RuleMerger(reused={rule_index: [parsed_rule], ...})
+    retry = merger.add_chunk(chunk, decoded_json)      # chunk: list of input rule indexes
+    merged = merger.merged_rules()
+'''
+
+LOGICAL_OPERATORS = {'AND', 'OR'}
+
+
+def _is_text(value):
+    return isinstance(value, str) and value.strip() != ''
+
+
+def validate_rule(rule):
+    """
+    schema problems of one parsed rule, [] if it is usable downstream
+    """
+    if not isinstance(rule, dict):
+        return ['rule is not a JSON object']
+    errors = []
+    for field in ('rule_id', 'description'):
+        if not _is_text(rule.get(field)):
+            errors.append(f'missing {field}')
+
+    triggers = rule.get('triggers')
+    if not isinstance(triggers, dict):
+        errors.append('triggers is not an object')
+    else:
+        operator = triggers.get('logical_operator')
+        if operator is not None and str(operator).upper() not in LOGICAL_OPERATORS:
+            errors.append(f'unknown logical_operator {operator!r}')
+        conditions = triggers.get('conditions')
+        if not isinstance(conditions, list):
+            errors.append('triggers.conditions is not a list')
+        else:
+            for i, condition in enumerate(conditions):
+                if not isinstance(condition, dict):
+                    errors.append(f'triggers.conditions[{i}] is not an object')
+                    continue
+                for field in ('device_name', 'attribute', 'operator'):
+                    if not _is_text(condition.get(field)):
+                        errors.append(f'triggers.conditions[{i}] missing {field}')
+                if 'value' not in condition:
+                    errors.append(f'triggers.conditions[{i}] missing value')
+
+    actions = rule.get('actions')
+    if not isinstance(actions, list) or not actions:
+        errors.append('actions is not a non-empty list')
+    else:
+        for i, action in enumerate(actions):
+            if not isinstance(action, dict):
+                errors.append(f'actions[{i}] is not an object')
+                continue
+            if not _is_text(action.get('device_name')):
+                errors.append(f'actions[{i}] missing device_name')
+            if not (_is_text(action.get('attribute')) or _is_text(action.get('command'))):
+                errors.append(f'actions[{i}] has neither attribute nor command')
+
+    context = rule.get('context', {})
+    if not isinstance(context, dict):
+        errors.append('context is not an object')
+    else:
+        locations = context.get('device_locations', [])
+        if not isinstance(locations, list) or not all(isinstance(dl, dict) for dl in locations):
+            errors.append('context.device_locations is not a list of objects')
+    return errors
+
+
+class RuleMerger:
+    def __init__(self, reused=None):
+        # input rule index -> [parsed rule]
+        self.parsed_by_rule = dict(reused or {})
+        # rule indexes whose latest answer had a different number of rules than its chunk
+        self.mismatched = set()
+        # input rule index -> schema problems of its latest answer
+        self.invalid = {}
+        self.duplicates = 0
+        # (rule_id, kept description, dropped description) of the last merged_rules()
+        self.conflicts = []
+
+    def add_chunk(self, chunk, data):
+        """
+        record the decoded answer for chunk (input rule indexes).
+        returns the rule indexes that have to be asked again.
+        """
+        items = data if isinstance(data, list) else [data]
+        errors = [validate_rule(item) for item in items]
+        if len(items) == len(chunk):
+            retry = []
+            for i, item, problems in zip(chunk, items, errors):
+                if problems:
+                    self.invalid[i] = problems
+                    retry.append(i)
+                else:
+                    self.parsed_by_rule[i] = [item]
+                    self.invalid.pop(i, None)
+                self.mismatched.discard(i)
+            return retry
+        if len(chunk) == 1 and items and not any(errors):
+            # a single input rule parsed into several rules: they are all its own
+            self.parsed_by_rule[chunk[0]] = items
+            self.invalid.pop(chunk[0], None)
+            self.mismatched.discard(chunk[0])
+            return []
+        # not one object per rule: no object can be attributed to an input rule, ask again rule by rule
+        problem = f'answer has {len(items)} rules for {len(chunk)} input rules'
+        for i in chunk:
+            self.invalid[i] = [problem]
+            self.mismatched.add(i)
+        return list(chunk)
+
+    def merged_rules(self):
+        """
+        all parsed rules in input order, one per rule_id: the first one wins, later ones are dropped
+        (counted in duplicates; recorded in conflicts when their description differs)
+        """
+        merged = []
+        seen = {}
+        self.duplicates = 0
+        self.conflicts = []
+        for i in sorted(self.parsed_by_rule):
+            for rule in self.parsed_by_rule[i]:
+                rule_id = rule['rule_id']
+                if rule_id in seen:
+                    self.duplicates += 1
+                    if seen[rule_id] != rule.get('description'):
+                        self.conflicts.append((rule_id, seen[rule_id], rule.get('description')))
+                    continue
+                seen[rule_id] = rule.get('description')
+                merged.append(rule)
+        return merged
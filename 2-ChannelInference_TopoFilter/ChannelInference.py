@@ -1,19 +1,63 @@
 import os
 import re
+import sys
 import json
+import asyncio
 import threading
-from openai import OpenAI
+from functools import partial
+from openai import OpenAI, AsyncOpenAI
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from llm_cache import LLMCache
+from llm_scheduler import LLMScheduler, estimate_tokens
+from llm_async import AsyncLLMRunner
+from llm_json import decode_response
+from llm_stream import stream_completion
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from InteractionDiscover import InteractionStream, output_dir as interaction_output_dir
+from RuleTemplate import TemplateCache
+from ChannelRuleEngine import ChannelRuleEngine
 
 model_name = "gemini-2.5-pro"
 output_dir = './2-ChannelInference_TopoFilter/output'
 input_rule = 'virtualBuilding'
 os.makedirs(output_dir, exist_ok=True)
 
+# OPENAI_BASE_URL can point at common/mock_llm_server.py to replay recorded answers offline
+api_key = os.environ.get("OPENAI_API_KEY", "")
+base_url = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
 client = OpenAI(
-    api_key="",
-    base_url="https://api.openai.com/v1"
+    api_key=api_key,
+    base_url=base_url
 )
 
+# unchanged slices (same model, prompt and rules) are answered from disk
+llm_cache = LLMCache()
+# completion parameters of every request; also part of the cache key, so discard() must get the same dict
+completion_params = {'max_completion_tokens': 65536}
+
+# request fan-out limits: concurrent requests, requests per minute, (estimated) tokens per minute
+max_concurrency = 8
+requests_per_minute = 60
+tokens_per_minute = 1000000
+# 'threads': bounded thread pool with the sync client; 'async': one event loop with the async client
+execution_mode = 'threads'
+# async mode only: seconds before a single request is abandoned and retried
+request_timeout = 600
+# stream answers: each annotated rule is appended to <input>_<model>_stream.ndjson as soon as it closes,
+# and the interactions it forms with the rules seen so far to interaction/interactions.stream.ndjson
+stream_responses = False
+# opt-in shortcuts; both change the stage's output compared with asking the LLM for every rule.
+# rules that only differ in device / location names share a template: only one rule per template never seen
+# before goes to the LLM, the others get its channels (kept in output/channel_template_cache.json)
+use_template_cache = False
+# annotate rules whose channels follow from their attribute / command names (ChannelRuleEngine.CHANNEL_TABLE) locally;
+# only rules with a condition or action below offline_min_confidence go to the LLM. on virtualBuilding it resolves
+# 116 of 161 rules, and 101 of those match the LLM's channels exactly (the rest differ in device_switch)
+use_offline_engine = False
+offline_min_confidence = 0.8
+
 
 with open('./2-ChannelInference_TopoFilter/prompt.txt', 'r', encoding='utf-8') as f1:
     prompt_text = f1.read()
@@ -22,12 +66,58 @@ with open('./2-ChannelInference_TopoFilter/prompt.txt', 'r', encoding='utf-8') a
 with open(f'./2-ChannelInference_TopoFilter/input/{input_rule}.json', 'r', encoding='utf-8') as f2:
     rule_data = json.load(f2)
 
+# rules resolved without the LLM come back in input order with the answers (list input only)
+ordered_merge = isinstance(rule_data, list) and (use_offline_engine or use_template_cache)
+template_cache = None
+rule_keys = []
+# input rule index -> rule annotated by the offline engine
+offline_rules = {}
+# rule_id -> template key (None if it has none) of the rules sent to the LLM, template key -> the rule sent for it
+sent_keys = {}
+representatives = {}
+llm_rules = rule_data
+
+def cached_template(key):
+    return template_cache is not None and key in template_cache
+
+if ordered_merge:
+    if use_offline_engine:
+        engine = ChannelRuleEngine(min_confidence=offline_min_confidence)
+        offline_report = []
+        for i, rule in enumerate(rule_data):
+            resolution = engine.resolve(rule)
+            if resolution.resolved:
+                offline_rules[i] = resolution.rule
+            offline_report.append({'rule_id': rule.get('rule_id') if isinstance(rule, dict) else None,
+                                   'resolved': resolution.resolved,
+                                   'confidence': resolution.confidence,
+                                   'entries': resolution.entries})
+        offline_report_path = os.path.join(output_dir, f'{input_rule}_offline_channels.json')
+        with open(offline_report_path, 'w', encoding='utf-8') as f:
+            json.dump(offline_report, f, ensure_ascii=False, indent=2)
+    if use_template_cache:
+        template_cache = TemplateCache(salt=f'{model_name}\n{prompt_text}')
+        rule_keys = [template_cache.key(rule) for rule in rule_data]
+    else:
+        rule_keys = [None] * len(rule_data)
+    llm_rules = []
+    for i, (rule, key) in enumerate(zip(rule_data, rule_keys)):
+        if i in offline_rules or cached_template(key) or key in representatives:
+            continue
+        if key is not None:
+            representatives[key] = rule
+        sent_keys.setdefault(rule.get('rule_id'), key)
+        llm_rules.append(rule)
+    template_covered = sum(cached_template(key) for i, key in enumerate(rule_keys) if i not in offline_rules)
+    print(f"{len(rule_data)} rules: {len(offline_rules)} resolved offline, "
+          f"{template_covered} covered by cached templates, {len(llm_rules)} sent to the LLM")
+
 # slice size
 slice_size = 20  
 
 # slice data
-if isinstance(rule_data, list):
-    slices = [rule_data[i:i+slice_size] for i in range(0, len(rule_data), slice_size)]
+if isinstance(llm_rules, list):
+    slices = [llm_rules[i:i+slice_size] for i in range(0, len(llm_rules), slice_size)]
 elif isinstance(rule_data, dict):
     # if dict, group by top level key
     keys = list(rule_data.keys())
@@ -41,42 +131,130 @@ os.makedirs(slice_output_dir, exist_ok=True)
 
 output_json_paths = []
 
-def call_llm(slice_data, idx):
-    full_prompt = f'''
+def build_prompt(slice_data):
+    return f'''
 {prompt_text}\n
 -------------------------------
 Input:
 Structured Rules Data - JSON format:
 {json.dumps(slice_data, ensure_ascii=False, indent=2)}\n
 '''
-    print(f'Processing slice {idx+1}/{len(slices)}...')
-    chat_completion = client.chat.completions.create(
-        messages=[{"role": "user", "content": full_prompt}],
-        model=model_name,
-        stream=False,
-        max_completion_tokens=65536
-    )
-    result = chat_completion.choices[0].message.content
-    result = re.sub(r'^<think>.*?</think>\s*', '', result, flags=re.DOTALL)
-    result = result.lstrip('\n')
-    if result.startswith('```json'):
-        result = result[len('```json'):].strip()
-    if result.endswith('```'):
-        result = result[:-len('```')].strip()
+
+def save_result(idx, result):
     output_path = os.path.join(slice_output_dir, f'slice_{idx+1}.json')
+    try:
+        decoded = decode_response(result)
+    except ValueError:
+        print(f'Warning: slice {idx+1} has no JSON in its answer, saving it as text')
+        text = result
+    else:
+        if decoded.repaired:
+            print(f'Warning: slice {idx+1} answer was cut off, recovered {decoded.items} of {len(slices[idx])} rules')
+            # a re-run asks for this slice again instead of replaying the cut-off answer
+            llm_cache.discard(model_name, build_prompt(slices[idx]), completion_params)
+        text = json.dumps(decoded.data, ensure_ascii=False, indent=2)
     with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(result)
+        f.write(text)
         print(f'Slice {idx+1} processed and saved to {output_path}')
     output_json_paths.append(output_path)
 
-threads = []
-for idx, slice_data in enumerate(slices):
-    t = threading.Thread(target=call_llm, args=(slice_data, idx))
-    t.start()
-    threads.append(t)
+stream_lock = threading.Lock()
+streamed = set()
+interaction_stream = InteractionStream()
+interaction_count = 0
+if stream_responses:
+    rule_stream_path = os.path.join(slice_output_dir, f'{input_rule}_{model_name}_stream.ndjson')
+    interaction_stream_path = os.path.join(interaction_output_dir, 'interactions.stream.ndjson')
+    os.makedirs(interaction_output_dir, exist_ok=True)
+    rule_stream_file = open(rule_stream_path, 'w', encoding='utf-8')
+    interaction_stream_file = open(interaction_stream_path, 'w', encoding='utf-8')
+
+def write_rule(job_id, rule):
+    global interaction_count
+    # a retried request replays rules that were already written
+    if (job_id, rule['rule_id']) in streamed:
+        return
+    streamed.add((job_id, rule['rule_id']))
+    rule_stream_file.write(json.dumps(rule, ensure_ascii=False) + '\n')
+    rule_stream_file.flush()
+    try:
+        new_interactions = interaction_stream.add_rule(rule)
+    except (KeyError, TypeError, AttributeError):
+        return
+    for interaction in new_interactions:
+        interaction_count += 1
+        record = {'id': f'interaction_{interaction_count}'}
+        record.update(interaction)
+        interaction_stream_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+    interaction_stream_file.flush()
 
-for t in threads:
-    t.join()
+def emit_rule(job_id, rule):
+    """
+    streaming mode: write an annotated rule the moment its object closes, and join it with the rules seen so far.
+    the rules sharing its template are written along with it.
+    """
+    if not isinstance(rule, dict) or 'rule_id' not in rule:
+        return
+    with stream_lock:
+        write_rule(job_id, rule)
+        key = sent_keys.get(rule['rule_id'])
+        if key is None or template_cache is None or not template_cache.learn(key, representatives[key], rule):
+            return
+        for i, (sibling, sibling_key) in enumerate(zip(rule_data, rule_keys)):
+            if (sibling_key == key and sibling is not representatives[key] and i not in offline_rules
+                    and 'rule_id' in sibling):
+                write_rule(job_id, template_cache.apply(key, sibling))
+
+if stream_responses and ordered_merge:
+    # rules resolved offline or by a known template are written before the first request goes out
+    with stream_lock:
+        for i, (rule, key) in enumerate(zip(rule_data, rule_keys)):
+            if i in offline_rules:
+                write_rule(0, offline_rules[i])
+            elif cached_template(key) and 'rule_id' in rule:
+                write_rule(0, template_cache.apply(key, rule))
+
+def call_llm(slice_data, idx):
+    print(f'Processing slice {idx+1}/{len(slices)}...')
+    if stream_responses:
+        result = stream_completion(client, model_name, build_prompt(slice_data), partial(emit_rule, idx + 1),
+                                   cache=llm_cache, **completion_params)
+    else:
+        result = llm_cache.complete(client, model_name, build_prompt(slice_data), **completion_params)
+    save_result(idx, result)
+
+if execution_mode == 'async':
+    runner = AsyncLLMRunner(AsyncOpenAI(api_key=api_key, base_url=base_url), model_name, cache=llm_cache,
+                            max_concurrency=max_concurrency,
+                            requests_per_minute=requests_per_minute,
+                            tokens_per_minute=tokens_per_minute,
+                            request_timeout=request_timeout)
+    jobs = [(idx + 1, build_prompt(slice_data)) for idx, slice_data in enumerate(slices)]
+    asyncio.run(runner.run(jobs, on_result=lambda job_id, result: save_result(job_id - 1, result),
+                           on_item=emit_rule if stream_responses else None, **completion_params))
+    print(runner.report())
+    failed_slices = runner.failed()
+else:
+    scheduler = LLMScheduler(max_concurrency=max_concurrency,
+                             requests_per_minute=requests_per_minute,
+                             tokens_per_minute=tokens_per_minute)
+    prompt_tokens = estimate_tokens(prompt_text)
+    for idx, slice_data in enumerate(slices):
+        slice_tokens = estimate_tokens(json.dumps(slice_data, ensure_ascii=False, indent=2))
+        scheduler.submit(idx + 1, call_llm, slice_data, idx, estimated_tokens=prompt_tokens + slice_tokens)
+
+    scheduler.run()
+    print(scheduler.report())
+    failed_slices = scheduler.failed()
+if failed_slices:
+    print(f"Warning: slices {failed_slices} failed after all retries and are missing from the merged output; "
+          f"re-run to retry them (completed slices are served from the LLM cache).")
+
+if stream_responses:
+    rule_stream_file.close()
+    interaction_stream_file.close()
+    print(f"{len(streamed)} annotated rules streamed to {rule_stream_path}, "
+          f"{interaction_count} interactions to {interaction_stream_path}")
 
 # merge all outputs to one file (put in slice folder, sorted by slice order)
 merged_results = []
@@ -84,16 +262,61 @@ merged_results = []
 sorted_paths = sorted(output_json_paths, key=lambda x: int(re.search(r'slice_(\d+)\.json', x).group(1)))
 for path in sorted_paths:
     with open(path, 'r', encoding='utf-8') as f:
-        try:
-            data = json.loads(f.read())
-            if isinstance(data, list):
-                merged_results.extend(data)
-            else:
-                merged_results.append(data)
-        except Exception:
-            merged_results.append(f.read())
+        content = f.read()
+    try:
+        data = decode_response(content).data
+    except ValueError:
+        merged_results.append(content)
+        continue
+    if isinstance(data, list):
+        merged_results.extend(data)
+    else:
+        merged_results.append(data)
+
+if ordered_merge:
+    # answers of the rules sent, by rule_id; anything else the LLM returned is kept at the end
+    answered = {}
+    unmatched = []
+    for rule in merged_results:
+        if isinstance(rule, dict) and rule.get('rule_id') in sent_keys and rule['rule_id'] not in answered:
+            answered[rule['rule_id']] = rule
+        else:
+            unmatched.append(rule)
+    if template_cache is not None:
+        for rule_id, rule in answered.items():
+            key = sent_keys[rule_id]
+            if key is not None and not template_cache.learn(key, representatives[key], rule):
+                print(f"Warning: the answer for {rule_id} does not match its conditions / actions, "
+                      f"its template is not cached")
+        template_cache.save()
+
+    # every input rule in input order: resolved offline, its own answer, or the channels of its template
+    merged_results = []
+    template_hits = 0
+    missing = []
+    for i, (rule, key) in enumerate(zip(rule_data, rule_keys)):
+        rule_id = rule.get('rule_id')
+        if i in offline_rules:
+            merged_results.append(offline_rules[i])
+        elif rule_id in answered:
+            merged_results.append(answered.pop(rule_id))
+        elif cached_template(key):
+            merged_results.append(template_cache.apply(key, rule))
+            template_hits += 1
+        else:
+            missing.append(rule_id)
+    merged_results.extend(answered.values())
+    merged_results.extend(unmatched)
+    if use_offline_engine:
+        print(f"Offline engine: {len(offline_rules)} rules annotated locally, report in {offline_report_path}")
+    if template_cache is not None:
+        print(f"Template cache: {template_hits} rules annotated from {len(template_cache.templates)} cached templates "
+              f"({template_cache.learned} learned in this run)")
+    if missing:
+        print(f"Warning: {len(missing)} rules have neither an answer nor a local annotation: {missing}")
 
 output_path = os.path.join(slice_output_dir, f'{input_rule}_{model_name}_merged_output.json')
 with open(output_path, 'w', encoding='utf-8') as f:
     json.dump(merged_results, f, ensure_ascii=False, indent=2)
 print(f"All results merged to: {output_path}")
+print(llm_cache.report())
@@ -0,0 +1,120 @@
+'''
+Deterministic channel inference from attribute names, run before the LLM.
+
+Most channels follow from what a condition senses or an action sets: a "temperature" reading is
+the temperature channel, "lock_status" is door_lock, "brightness" is luminance. CHANNEL_TABLE maps
+attribute / command names (optionally narrowed by the device name) to channels with a confidence:
+
+    entry      attribute / command pattern   device pattern     channels                                    confidence
+    condition  temperature                   outdoor            -                                           0.5
+    action     power_status|set_power        lumin|light|lamp   implicit_physical_channel: luminance,      0.9
+                                                                implicit_system_channel: device_switch
+
+Patterns are regular expressions; the attribute pattern must match the whole attribute (or, for
+actions, the whole command), the device pattern anywhere in the device name, both lowercased.
+The first row that matches decides. A rule is resolved locally only if every condition and action
+matches a row with at least min_confidence; anything else (damper_position, whose channel depends
+on what the damper is for) goes to the LLM unchanged. Channel names follow the ones the LLM
+assigns for prompt.txt, so local and LLM annotations join in InteractionDiscover.
+
+Usage:
+    engine = ChannelRuleEngine(min_confidence=0.8)
+    resolution = engine.resolve(rule)
+    if resolution.resolved:
+        annotated = resolution.rule
+'''
+
+import copy
+import re
+from collections import namedtuple
+
+PHYSICAL = 'implicit_physical_channel'
+SYSTEM = 'implicit_system_channel'
+
+# (entry, attribute / command pattern, device pattern or None, channels, confidence); first match wins
+CHANNEL_TABLE = [
+    # ----- conditions: the sensed quantity is the channel
+    ('condition', r'.*temperature.*', r'outdoor|outside|ambient', {}, 0.5),
+    ('condition', r'(indoor_|zone_|room_|air_|supply_air_|return_air_)?temperature', None, {PHYSICAL: 'temperature'}, 0.95),
+    ('condition', r'.*co2.*|carbon_dioxide.*', None, {PHYSICAL: 'CO2'}, 0.95),
+    ('condition', r'(relative_)?humidity(_level)?', None, {PHYSICAL: 'humidity'}, 0.95),
+    ('condition', r'illuminance|luminance|light_level|lux|brightness', None, {PHYSICAL: 'luminance'}, 0.95),
+    ('condition', r'motion(_detected|_status)?|occupancy(_status)?|presence(_detected)?', None, {PHYSICAL: 'motion'}, 0.95),
+    ('condition', r'smoke(_detected|_level|_status)?', None, {PHYSICAL: 'smoke'}, 0.95),
+    ('condition', r'(sound|noise)(_level)?', None, {PHYSICAL: 'sound'}, 0.9),
+    ('condition', r'(water_)?leak(_detected|_status)?|flood(_detected)?|water_level', None, {PHYSICAL: 'water'}, 0.9),
+    ('condition', r'alarm_status', r'smoke', {PHYSICAL: 'smoke'}, 0.9),
+    ('condition', r'alarm_status', r'heat', {PHYSICAL: 'temperature'}, 0.9),
+    ('condition', r'alarm_status', r'door|contact|intrusion', {SYSTEM: 'alarm'}, 0.85),
+    ('condition', r'system_status|alarm_status', r'facp|fire', {SYSTEM: 'alarm'}, 0.9),
+    ('condition', r'(day|season|week)_profile|time(_of_day)?|schedule|clock', None, {SYSTEM: 'time'}, 0.9),
+    ('condition', r'door_state.*|lock_status', None, {SYSTEM: 'door_lock'}, 0.85),
+    # explicit user input: the switch itself is the only channel
+    ('condition', r'button_pressed|switch_status', None, {SYSTEM: 'device_switch'}, 0.85),
+    # ----- actions: the quantity or state the action changes
+    ('action', r'brightness|set_brightness|dim.*', None, {PHYSICAL: 'luminance'}, 0.95),
+    ('action', r'power_status|set_power|turn_on|turn_off', r'lumin|light|lamp',
+     {PHYSICAL: 'luminance', SYSTEM: 'device_switch'}, 0.9),
+    ('action', r'activation_status|activate', r'horn|siren|speaker|sounder|bell', {PHYSICAL: 'sound'}, 0.9),
+    ('action', r'activation_status|activate', r'strobe|beacon', {PHYSICAL: 'luminance'}, 0.9),
+    ('action', r'lock_status|lock|unlock', None, {SYSTEM: 'door_lock'}, 0.95),
+    ('action', r'alarm_status|generate_alarm|silence_alarm|reset_alarm', None, {SYSTEM: 'alarm'}, 0.9),
+    ('action', r'system_status', r'facp|fire_controller|fire_alarm', {SYSTEM: 'alarm'}, 0.9),
+    ('action', r'(heating|cooling)(_power|_output|_mode)?|(increase|decrease)_(heating|cooling)|.*temperature_setpoint|set_temperature',
+     None, {PHYSICAL: 'temperature'}, 0.85),
+    ('action', r'position|set_position|open_shade|close_shade', r'blind|shade|shutter', {PHYSICAL: 'luminance'}, 0.85),
+    ('action', r'(de)?humidif(ier|ication)(_status|_level)?', None, {PHYSICAL: 'humidity'}, 0.85),
+]
+
+# resolved: every condition and action is covered; rule: the annotated copy (None if unresolved);
+# confidence: the lowest entry confidence; entries: one record per condition / action
+Resolution = namedtuple('Resolution', ['resolved', 'rule', 'confidence', 'entries'])
+
+
+class ChannelRuleEngine:
+    def __init__(self, table=CHANNEL_TABLE, min_confidence=0.8):
+        self.table = [(entry, re.compile(attribute), re.compile(device) if device else None, channels, confidence)
+                      for entry, attribute, device, channels, confidence in table]
+        self.min_confidence = min_confidence
+
+    def match(self, entry, item):
+        """(channels, confidence, row index) of the first table row matching a condition / action, or None"""
+        names = [str(item.get('attribute') or '').lower()]
+        if entry == 'action':
+            names.append(str(item.get('command') or '').lower())
+        device = str(item.get('device_name') or '').lower()
+        for row, (row_entry, attribute, device_pattern, channels, confidence) in enumerate(self.table):
+            if row_entry != entry:
+                continue
+            if not any(name and attribute.fullmatch(name) for name in names):
+                continue
+            if device_pattern is not None and not device_pattern.search(device):
+                continue
+            return channels, confidence, row
+        return None
+
+    def resolve(self, rule):
+        """Resolution for one structured rule"""
+        try:
+            conditions = (rule.get('triggers') or {}).get('conditions') or []
+            actions = rule.get('actions') or []
+        except AttributeError:
+            return Resolution(False, None, 0.0, [])
+        entries = []
+        for entry, path, items in (('condition', 'triggers.conditions', conditions), ('action', 'actions', actions)):
+            for i, item in enumerate(items):
+                found = self.match(entry, item) if isinstance(item, dict) else None
+                if found is None:
+                    entries.append({'entry': f'{path}[{i}]', 'channels': None, 'confidence': 0.0, 'row': None})
+                else:
+                    channels, confidence, row = found
+                    entries.append({'entry': f'{path}[{i}]', 'channels': channels, 'confidence': confidence, 'row': row})
+        confidence = min((e['confidence'] for e in entries), default=0.0)
+        if not actions or confidence < self.min_confidence:
+            return Resolution(False, None, confidence, entries)
+
+        annotated = copy.deepcopy(rule)
+        items = annotated['triggers']['conditions'] if conditions else []
+        for item, record in zip(list(items) + annotated['actions'], entries):
+            item.update(record['channels'])
+        return Resolution(True, annotated, confidence, entries)
@@ -1,75 +1,161 @@
+'''
+Channel statistics over annotated rule files.
+
+Every rule file (JSON array / object, or NDJSON with one rule per line, e.g. the streamed
+ChannelInference output) is read once; each channel of each condition / action updates a single
+counter keyed by (source, role, channel type, channel), from which all six views are derived:
+all / triggers / actions x system / physical. Counts are merged across all files given, so a whole
+portfolio of buildings and model runs is one report, written as
+    - the text report (totals, as before)
+    - CSV rows: source, role, channel_type, channel, count (one row per file plus source "ALL")
+    - JSON: {"sources": [...], "totals": {section: {channel: count}}, "by_source": {...}}
+
+Usage:
+    python 2-ChannelInference_TopoFilter/CountChannel.py                   # the default rule file
+    python 2-ChannelInference_TopoFilter/CountChannel.py 'output/*_slices/*_merged_output.json' run2.ndjson
+'''
+
+import argparse
+import csv
+import glob
 import json
+import os
 from collections import Counter
 
-def count_channels(json_path, output_path):
-    with open(json_path, 'r', encoding='utf-8') as f:
-        rules = json.load(f)
+CHANNEL_TYPES = [('system', 'implicit_system_channel'), ('physical', 'implicit_physical_channel')]
+ROLES = [('triggers', 'triggers of'), ('actions', 'actions of')]
+ALL_SOURCES = 'ALL'
 
 
-    system_channels = []
-    physical_channels = []
+def iter_rules(path):
+    """rules of a .json file (array, {id: rule} or one rule) or of an .ndjson file, one at a time"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.ndjson') or path.endswith('.jsonl'):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+            return
+        data = json.load(f)
+    if isinstance(data, list):
+        yield from data
+    elif isinstance(data, dict) and 'rule_id' not in data:
+        yield from data.values()
+    else:
+        yield data
 
 
-    triggers_system_channels = []
-    triggers_physical_channels = []
-    actions_system_channels = []
-    actions_physical_channels = []
+def _channels(value):
+    if not value:
+        return []
+    return [v for v in value if v] if isinstance(value, list) else [value]
 
+
+def update_counts(counts, source, rules):
+    """one pass over rules: counts[(source, role, channel type, channel)] += 1 per channel"""
     for rule in rules:
-        triggers = rule.get('triggers', {})
-        conditions = triggers.get('conditions', [])
-        for cond in conditions:
-            sys_ch = cond.get('implicit_system_channel')
-            phy_ch = cond.get('implicit_physical_channel')
-            if sys_ch:
-                system_channels.append(sys_ch)
-                triggers_system_channels.append(sys_ch)
-            if phy_ch:
-                physical_channels.append(phy_ch)
-                triggers_physical_channels.append(phy_ch)
-
-        actions = rule.get('actions', [])
-        for act in actions:
-            sys_ch = act.get('implicit_system_channel')
-            phy_ch = act.get('implicit_physical_channel')
-            if sys_ch:
-                system_channels.append(sys_ch)
-                actions_system_channels.append(sys_ch)
-            if phy_ch:
-                physical_channels.append(phy_ch)
-                actions_physical_channels.append(phy_ch)
-
-    system_count = Counter(system_channels)
-    physical_count = Counter(physical_channels)
-    triggers_system_count = Counter(triggers_system_channels)
-    triggers_physical_count = Counter(triggers_physical_channels)
-    actions_system_count = Counter(actions_system_channels)
-    actions_physical_count = Counter(actions_physical_channels)
+        if not isinstance(rule, dict):
+            continue
+        conditions = (rule.get('triggers') or {}).get('conditions') or []
+        actions = rule.get('actions') or []
+        for role, entries in (('triggers', conditions), ('actions', actions)):
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    continue
+                for channel_type, key in CHANNEL_TYPES:
+                    for channel in _channels(entry.get(key)):
+                        counts[(source, role, channel_type, channel)] += 1
+
 
+def sections(counts, source=None):
+    """
+    {section title: Counter} for one source (None = all sources), in first-appearance order
+    """
+    views = {}
+    for channel_type, _ in CHANNEL_TYPES:
+        views[f'all {channel_type}_channel counts'] = Counter()
+    for role, label in ROLES:
+        for channel_type, _ in CHANNEL_TYPES:
+            views[f'{label} {channel_type}_channel counts'] = Counter()
+    labels = dict(ROLES)
+    for (src, role, channel_type, channel), n in counts.items():
+        if source is not None and src != source:
+            continue
+        views[f'all {channel_type}_channel counts'][channel] += n
+        views[f'{labels[role]} {channel_type}_channel counts'][channel] += n
+    return views
+
+
+def write_text(views, output_path):
     with open(output_path, 'w', encoding='utf-8') as f:
-        f.write("all system_channel counts:\n")
-        for k, v in system_count.items():
-            f.write(f"{k}: {v}\n")
-        f.write("\nall physical_channel counts:\n")
-        for k, v in physical_count.items():
-            f.write(f"{k}: {v}\n")
-
-        f.write("\ntriggers of system_channel counts:\n")
-        for k, v in triggers_system_count.items():
-            f.write(f"{k}: {v}\n")
-        f.write("\ntriggers of physical_channel counts:\n")
-        for k, v in triggers_physical_count.items():
-            f.write(f"{k}: {v}\n")
-
-        f.write("\nactions of system_channel counts:\n")
-        for k, v in actions_system_count.items():
-            f.write(f"{k}: {v}\n")
-        f.write("\nactions of physical_channel counts:\n")
-        for k, v in actions_physical_count.items():
-            f.write(f"{k}: {v}\n")
+        f.write('\n'.join(f"{title}:\n" + ''.join(f"{k}: {v}\n" for k, v in counter.items())
+                          for title, counter in views.items()))
+
+
+def write_csv(counts, csv_path):
+    totals = Counter()
+    for (_, role, channel_type, channel), n in counts.items():
+        totals[(ALL_SOURCES, role, channel_type, channel)] += n
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['source', 'role', 'channel_type', 'channel', 'count'])
+        for (source, role, channel_type, channel), n in list(counts.items()) + list(totals.items()):
+            writer.writerow([source, role, channel_type, channel, n])
+
+
+def write_json(counts, sources, json_path):
+    report = {'sources': sources,
+              'totals': {title: dict(counter) for title, counter in sections(counts).items()},
+              'by_source': {source: {title: dict(counter) for title, counter in sections(counts, source).items()}
+                            for source in sources}}
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def source_name(path, paths):
+    """file name without extension, or the full path if two inputs share a file name"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    if sum(os.path.splitext(os.path.basename(p))[0] == name for p in paths) > 1:
+        return path
+    return name
+
+
+def count_channels(json_paths, output_path, csv_path=None, json_path=None):
+    """
+    channel counts over one or more rule files / NDJSON streams (paths or glob patterns),
+    merged into one text report, plus CSV / JSON if their paths are given. returns the counter.
+    """
+    if isinstance(json_paths, str):
+        json_paths = [json_paths]
+    paths = []
+    for pattern in json_paths:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        paths.extend(p for p in matches if p not in paths)
+
+    counts = Counter()
+    sources = []
+    for path in paths:
+        source = source_name(path, paths)
+        sources.append(source)
+        update_counts(counts, source, iter_rules(path))
+
+    for path in (output_path, csv_path, json_path):
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_text(sections(counts), output_path)
+    if csv_path:
+        write_csv(counts, csv_path)
+    if json_path:
+        write_json(counts, sources, json_path)
+    return counts
+
 
 if __name__ == '__main__':
-    count_channels(
-        './2-ChannelInference_TopoFilter/output/virtualBuilding_gemini-2.5-pro_slices/virtualBuilding_gemini-2.5.json',
-        './2-ChannelInference_TopoFilter/output/ChannelCount/channel_count_result.txt'
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Count implicit channels over annotated rule files')
+    parser.add_argument('inputs', nargs='*', help='rule files (.json / .ndjson) or glob patterns',
+                        default=['./2-ChannelInference_TopoFilter/output/virtualBuilding_gemini-2.5-pro_slices/virtualBuilding_gemini-2.5.json'])
+    parser.add_argument('--output', default='./2-ChannelInference_TopoFilter/output/ChannelCount/channel_count_result.txt')
+    parser.add_argument('--csv', default='./2-ChannelInference_TopoFilter/output/ChannelCount/channel_count_result.csv')
+    parser.add_argument('--json', default='./2-ChannelInference_TopoFilter/output/ChannelCount/channel_count_result.json')
+    args = parser.parse_args()
+    count_channels(args.inputs, args.output, args.csv, args.json)
@@ -1,5 +1,10 @@
 import os
+import sys
 import json
+from collections import defaultdict
+
+sys.path.append(os.path.dirname(__file__))
+from InteractionTable import InteractionTable
 
 '''
 After discovering implicit channels, search for interactions between rules
@@ -28,6 +33,12 @@ Output: the name of the implicit channel, rule ID, and device location
     ...    }
 ]
 '''
+output_dir = './2-ChannelInference_TopoFilter/output/interaction'
+# 'ndjson': write interactions.ndjson line by line
+# 'itab':   write the compact interaction table interactions.itab (see InteractionTable.py)
+# 'json':   write the legacy interactions.json dict
+output_format = 'ndjson'
+
 # The output format uses keys like interaction_1, interaction_2, etc.
 # We'll adjust the output to match this format.
 def format_interactions(interactions):
@@ -36,55 +47,94 @@ def format_interactions(interactions):
         key = f'interaction_{idx}'
         formatted[key] = interaction
     return formatted
-def discover_interactions(rule_data):
-    interactions = []
-    # Build index for triggers by implicit channel (both physical and system)
-    trigger_index = []
+CHANNEL_KEYS = ['implicit_physical_channel', 'implicit_system_channel']
+
+def build_location_lookup(rule):
+    """
+    map device_name -> location for one rule (first entry wins)
+    """
+    lookup = {}
+    for dl in rule.get('context', {}).get('device_locations', []):
+        lookup.setdefault(dl.get('device_name'), dl.get('location'))
+    return lookup
+
+def iter_endpoints(rule, entries, locations):
+    """
+    (channel_type, implicit_channel, endpoint) for every implicit channel on a rule's conditions or actions
+    """
+    for entry in entries:
+        for channel_key in CHANNEL_KEYS:
+            channel = entry.get(channel_key)
+            if channel:
+                yield channel_key, channel, {
+                    'implicit_channel': channel,
+                    'channel_type': channel_key,
+                    'rule_id': rule['rule_id'],
+                    'device_name': entry.get('device_name'),
+                    'device_location': locations.get(entry.get('device_name'))
+                }
+
+def build_trigger_index(rule_data):
+    """
+    index trigger endpoints by (channel_type, implicit_channel), keeping rule order inside each bucket
+    """
+    trigger_index = defaultdict(list)
     for rule in rule_data:
-        for cond in rule['triggers']['conditions']:
-            for channel_key in ['implicit_physical_channel', 'implicit_system_channel']:
-                channel = cond.get(channel_key)
-                if channel:
-                    trigger_index.append({
-                        'implicit_channel': channel,
-                        'channel_type': channel_key,
-                        'rule_id': rule['rule_id'],
-                        'device_name': cond.get('device_name'),
-                        'device_location': next(
-                            (dl['location'] for dl in rule['context']['device_locations'] if dl['device_name'] == cond.get('device_name')),
-                            None
-                        )
-                    })
-
-    # Find interactions: actions in one rule, triggers in another, same implicit channel
+        locations = build_location_lookup(rule)
+        for channel_key, channel, endpoint in iter_endpoints(rule, rule['triggers']['conditions'], locations):
+            trigger_index[(channel_key, channel)].append(endpoint)
+    return trigger_index
+
+def iter_interactions(rule_data):
+    """
+    yield interactions one at a time: actions in one rule, triggers in another, same implicit channel
+    """
+    # Build index for triggers by implicit channel (both physical and system)
+    trigger_index = build_trigger_index(rule_data)
+
     for rule in rule_data:
-        for action in rule['actions']:
-            for channel_key in ['implicit_physical_channel', 'implicit_system_channel']:
-                channel = action.get(channel_key)
-                if channel:
-                    for trig in trigger_index:
-                        if (
-                            trig['implicit_channel'] == channel and
-                            trig['channel_type'] == channel_key and
-                            trig['rule_id'] != rule['rule_id']
-                        ):
-                            interaction = {
-                                'actions': {
-                                    'implicit_channel': channel,
-                                    'channel_type': channel_key,
-                                    'rule_id': rule['rule_id'],
-                                    'device_name': action.get('device_name'),
-                                    'device_location': next(
-                                        (dl['location'] for dl in rule['context']['device_locations'] if dl['device_name'] == action.get('device_name')),
-                                        None
-                                    )
-                                },
-                                'triggers': trig
-                            }
-                            interactions.append(interaction)
+        locations = build_location_lookup(rule)
+        for channel_key, channel, action_endpoint in iter_endpoints(rule, rule['actions'], locations):
+            for trig in trigger_index.get((channel_key, channel), []):
+                if trig['rule_id'] != rule['rule_id']:
+                    yield {
+                        'actions': dict(action_endpoint),
+                        'triggers': trig
+                    }
+
+class InteractionStream:
+    """
+    incremental join for rules that arrive one at a time (e.g. from streamed channel inference):
+    add_rule returns the interactions the new rule forms with the rules added before it.
+    over a whole rule set this gives the same interactions as iter_interactions, in arrival order.
+    """
+    def __init__(self):
+        self.trigger_index = defaultdict(list)
+        self.action_index = defaultdict(list)
+
+    def add_rule(self, rule):
+        locations = build_location_lookup(rule)
+        actions = list(iter_endpoints(rule, rule['actions'], locations))
+        triggers = list(iter_endpoints(rule, rule['triggers']['conditions'], locations))
+        new_interactions = []
+        for channel_key, channel, action_endpoint in actions:
+            for trig in self.trigger_index.get((channel_key, channel), []):
+                if trig['rule_id'] != rule['rule_id']:
+                    new_interactions.append({'actions': dict(action_endpoint), 'triggers': trig})
+        for channel_key, channel, trigger_endpoint in triggers:
+            for action_endpoint in self.action_index.get((channel_key, channel), []):
+                if action_endpoint['rule_id'] != rule['rule_id']:
+                    new_interactions.append({'actions': dict(action_endpoint), 'triggers': trigger_endpoint})
+        for channel_key, channel, action_endpoint in actions:
+            self.action_index[(channel_key, channel)].append(action_endpoint)
+        for channel_key, channel, trigger_endpoint in triggers:
+            self.trigger_index[(channel_key, channel)].append(trigger_endpoint)
+        return new_interactions
+
+def discover_interactions(rule_data):
+    interactions = list(iter_interactions(rule_data))
 
     # Save results
-    output_dir = './2-ChannelInference_TopoFilter/output/interaction'
     os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, 'interactions.json')
     formatted = format_interactions(interactions)
@@ -92,8 +142,44 @@ def discover_interactions(rule_data):
         json.dump(formatted, f, ensure_ascii=False, indent=2)
         print(f'Interactions discovered and saved to {output_path}')
 
+def stream_interactions(rule_data, output_path=None):
+    """
+    write interactions as newline-delimited JSON while the join runs.
+    each line is {"id": "interaction_N", "actions": {...}, "triggers": {...}}, so memory stays flat.
+    """
+    if output_path is None:
+        output_path = os.path.join(output_dir, 'interactions.ndjson')
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for count, interaction in enumerate(iter_interactions(rule_data), 1):
+            record = {'id': f'interaction_{count}'}
+            record.update(interaction)
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    print(f'{count} interactions discovered and streamed to {output_path}')
+    return output_path
+
+def save_interaction_table(rule_data, output_path=None):
+    """
+    write interactions as a compact InteractionTable: rule/device/location/channel strings are stored once,
+    each interaction is a row of integer indices.
+    """
+    if output_path is None:
+        output_path = os.path.join(output_dir, 'interactions.itab')
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    table = InteractionTable()
+    table.extend(iter_interactions(rule_data))
+    table.save(output_path)
+    print(f'{len(table)} interactions discovered and saved to {output_path}')
+    return output_path
+
 if __name__ == '__main__':
     input_path = './2-ChannelInference_TopoFilter/output/virtualBuilding_gemini-2.5-pro_slices/virtualBuilding_gemini-2.5.json'
     with open(input_path, 'r', encoding='utf-8') as f:
         rule_data = json.load(f)
-    discover_interactions(rule_data)
+    if output_format == 'ndjson':
+        stream_interactions(rule_data)
+    elif output_format == 'itab':
+        save_interaction_table(rule_data)
+    else:
+        discover_interactions(rule_data)
@@ -4,6 +4,21 @@ check if the interactions in interaction.json are space reachable
 
 import json
 import os
+import sys
+from array import array
+from collections import namedtuple
+from contextlib import nullcontext
+
+try:
+    import numpy as np
+except ImportError:
+    # only the batch API (TopologyIndex.judge_batch / filter_interaction_table) needs NumPy
+    np = None
+
+sys.path.append(os.path.dirname(__file__))
+from InteractionTable import load_interaction_table
+from OntologyLoader import load_topology_tables
+from InteractionDiscover import iter_interactions as discover_iter_interactions
 
 # ==============================================================================
 # 1. Ontology Data Representation - 
@@ -108,95 +123,489 @@ def is_reachable(channel, device_locs, space_flrs, hvac_zones, adj_spaces):
     # if none of the above reachability rules are satisfied, it is determined to be unreachable.
     return False, "Rule R4 (Spatially Separated): No plausible physical path found."
 
+# ==============================================================================
+# 2.1 Precompiled Reachability Index
+# ==============================================================================
+# reason codes stored in the TopologyIndex table; R2 codes are REASON_R2_BASE + AHU index
+REASON_SOURCE_UNKNOWN = 0
+REASON_TARGET_UNKNOWN = 1
+REASON_R1 = 2
+REASON_R3 = 3
+REASON_R4 = 4
+REASON_R2_BASE = 5
+
+# channel class bits: a channel may be HVAC-mediated, adjacency-mediated, both or neither
+CHANNEL_CLASS_HVAC = 1
+CHANNEL_CLASS_ADJACENCY = 2
+CHANNEL_CLASS_COUNT = 4
+
+class TopologyIndex:
+    """
+    location x location x channel-class reachability table, built once per building.
+    every cell holds the reason code that is_reachable would return for that combination,
+    so judging an interaction is a single table lookup.
+    """
+    def __init__(self, space_flrs, hvac_zones, adj_spaces,
+                 hvac_channels=HVAC_MEDIATED_CHANNELS, adjacency_channels=ADJACENCY_MEDIATED_CHANNELS,
+                 location_aliases=None):
+        self.hvac_channels = set(hvac_channels)
+        self.adjacency_channels = set(adjacency_channels)
+        self.locations = list(space_flrs)
+        self.location_index = {loc: i for i, loc in enumerate(self.locations)}
+        # alternative spellings ("Office 1A", "bldg:Office_1A") resolve to the same table row
+        for alias, loc in (location_aliases or {}).items():
+            if loc in self.location_index:
+                self.location_index.setdefault(alias, self.location_index[loc])
+        self.ahu_ids = list(hvac_zones)
+        self.reasons = [
+            "Rule Error: Source device location unknown in ontology.",
+            "Rule Error: Target device location unknown in ontology.",
+            "Rule R1 (Intra-Space): Devices are in the same location.",
+            "Rule R3 (Adjacency): Locations are physically adjacent on the same floor.",
+            "Rule R4 (Spatially Separated): No plausible physical path found.",
+        ] + [f"Rule R2 (HVAC-Mediated): Locations are connected by the same AHU ({ahu_id})." for ahu_id in self.ahu_ids]
+
+        # raw topology kept for the vectorized batch path (judge_batch)
+        self.floors = [space_flrs[loc] for loc in self.locations]
+        self.adjacent_pairs = set()
+        self.zone_members = [
+            sorted({self.location_index[loc] for loc in hvac_zones[ahu_id] if loc in self.location_index})
+            for ahu_id in self.ahu_ids
+        ]
+        self._batch_arrays = None
+
+        n = len(self.locations)
+        self.table = array('H', [REASON_R4]) * (n * n * CHANNEL_CLASS_COUNT)
+        hvac_classes = [c for c in range(CHANNEL_CLASS_COUNT) if c & CHANNEL_CLASS_HVAC]
+        adjacency_classes = [c for c in range(CHANNEL_CLASS_COUNT) if c & CHANNEL_CLASS_ADJACENCY]
+
+        # fill from lowest to highest priority so that higher rules overwrite lower ones: R3 < R2 < R1
+        for source_loc, neighbours in adj_spaces.items():
+            i = self.location_index.get(source_loc)
+            if i is None:
+                continue
+            for target_loc in neighbours:
+                j = self.location_index.get(target_loc)
+                if j is None or self.floors[i] != self.floors[j]:
+                    continue
+                self.adjacent_pairs.add((i, j))
+                for c in adjacency_classes:
+                    self.table[self._cell(i, j, c)] = REASON_R3
+
+        # R2: the first AHU (in hvac_zones order) serving both spaces wins, so write zones in reverse
+        for ahu_idx in reversed(range(len(self.ahu_ids))):
+            members = self.zone_members[ahu_idx]
+            for i in members:
+                for j in members:
+                    for c in hvac_classes:
+                        self.table[self._cell(i, j, c)] = REASON_R2_BASE + ahu_idx
+
+        for i in range(n):
+            for c in range(CHANNEL_CLASS_COUNT):
+                self.table[self._cell(i, i, c)] = REASON_R1
+
+    def _cell(self, i, j, channel_class):
+        return (i * len(self.locations) + j) * CHANNEL_CLASS_COUNT + channel_class
+
+    def channel_class(self, channel_type):
+        channel_class = 0
+        if channel_type in self.hvac_channels:
+            channel_class |= CHANNEL_CLASS_HVAC
+        if channel_type in self.adjacency_channels:
+            channel_class |= CHANNEL_CLASS_ADJACENCY
+        return channel_class
+
+    def reason_code(self, source_loc, target_loc, channel_type):
+        i = self.location_index.get(source_loc)
+        if i is None:
+            return REASON_SOURCE_UNKNOWN
+        j = self.location_index.get(target_loc)
+        if j is None:
+            return REASON_TARGET_UNKNOWN
+        return self.table[self._cell(i, j, self.channel_class(channel_type))]
+
+    @staticmethod
+    def is_plausible(code):
+        return code == REASON_R1 or code == REASON_R3 or code >= REASON_R2_BASE
+
+    def is_reachable(self, channel):
+        """
+        drop-in equivalent of is_reachable() for the building this index was built from
+        """
+        code = self.reason_code(channel['source'], channel['target'], channel['type'])
+        return self.is_plausible(code), self.reasons[code]
+
+    # --------------------------------------------------------------------------
+    # vectorized batch path: R1-R4 as NumPy masks over whole interaction arrays
+    # --------------------------------------------------------------------------
+    def encode_batch(self, source_locs, target_locs, channel_types):
+        """
+        encode location / channel strings as integer arrays (-1 = location unknown in ontology)
+        """
+        np = _require_numpy()
+        source_idx = np.fromiter((self.location_index.get(loc, -1) for loc in source_locs), dtype=np.int64)
+        target_idx = np.fromiter((self.location_index.get(loc, -1) for loc in target_locs), dtype=np.int64)
+        channel_class = np.fromiter((self.channel_class(ch) for ch in channel_types), dtype=np.int8)
+        return source_idx, target_idx, channel_class
+
+    def judge_batch(self, source_idx, target_idx, channel_class):
+        """
+        apply R1-R4 to whole arrays at once.
+        returns (verdicts, reason_codes): a bool array (True = plausible) and a uint16 array of
+        REASON_* codes; self.reasons[code] gives the same reason string as is_reachable.
+        """
+        np = _require_numpy()
+        floors, adjacency_keys, zone_masks = self._get_batch_arrays()
+        n = len(self.locations)
+        source_idx = np.asarray(source_idx, dtype=np.int64)
+        target_idx = np.asarray(target_idx, dtype=np.int64)
+        channel_class = np.asarray(channel_class, dtype=np.int8)
+
+        source_known = source_idx >= 0
+        target_known = target_idx >= 0
+        known = source_known & target_known
+        src = np.where(known, source_idx, 0)
+        tgt = np.where(known, target_idx, 0)
+
+        codes = np.full(src.shape, REASON_R4, dtype=np.uint16)
+        # lowest priority first, later masks overwrite: R3 < R2 < R1 < unknown target < unknown source
+        if len(adjacency_keys):
+            r3 = (known & ((channel_class & CHANNEL_CLASS_ADJACENCY) != 0)
+                  & (floors[src] == floors[tgt]) & np.isin(src * n + tgt, adjacency_keys))
+            codes[r3] = REASON_R3
+        hvac = known & ((channel_class & CHANNEL_CLASS_HVAC) != 0)
+        for ahu_idx in reversed(range(len(zone_masks))):
+            zone = zone_masks[ahu_idx]
+            codes[hvac & zone[src] & zone[tgt]] = REASON_R2_BASE + ahu_idx
+        codes[known & (src == tgt)] = REASON_R1
+        codes[~target_known] = REASON_TARGET_UNKNOWN
+        codes[~source_known] = REASON_SOURCE_UNKNOWN
+
+        verdicts = (codes == REASON_R1) | (codes == REASON_R3) | (codes >= REASON_R2_BASE)
+        return verdicts, codes
+
+    def _get_batch_arrays(self):
+        if self._batch_arrays is None:
+            np = _require_numpy()
+            n = len(self.locations)
+            floors = np.array(self.floors)
+            adjacency_keys = np.array(sorted(i * n + j for i, j in self.adjacent_pairs), dtype=np.int64)
+            zone_masks = []
+            for members in self.zone_members:
+                mask = np.zeros(n, dtype=bool)
+                mask[members] = True
+                zone_masks.append(mask)
+            self._batch_arrays = (floors, adjacency_keys, zone_masks)
+        return self._batch_arrays
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for batch topology filtering (pip install numpy).")
+    return np
+
+def filter_interaction_table(table_path, ontology_path=None):
+    """
+    batch-filter a compact interaction table (.itab) without touching individual rows.
+    string-table entries are encoded once, then the integer columns are gathered into arrays
+    and judged with TopologyIndex.judge_batch.
+    returns a dict of arrays: 'physical' (rows that are physical channels), 'verdicts', 'reasons',
+    plus the 'topology' used so reasons can be decoded with topology.reasons[code].
+    """
+    np = _require_numpy()
+    topology = load_topology_index(ontology_path)
+    table = load_interaction_table(table_path)
+    columns = {name: np.frombuffer(column, dtype=np.int32) if len(column) else np.zeros(0, dtype=np.int32)
+               for name, column in table.columns.items()}
+
+    # encode each distinct string once; the trailing -1 entry catches missing (-1) cells
+    location_codes = np.array([topology.location_index.get(loc, -1) for loc in table.tables['locations'].values] + [-1], dtype=np.int64)
+    channel_codes = np.array([topology.channel_class(ch) for ch in table.tables['channels'].values] + [0], dtype=np.int8)
+    physical_type = table.tables['channel_types'].lookup('implicit_physical_channel')
+
+    source_idx = location_codes[columns['action_location']]
+    target_idx = location_codes[columns['trigger_location']]
+    channel_class = channel_codes[columns['channel']]
+    verdicts, reasons = topology.judge_batch(source_idx, target_idx, channel_class)
+    return {
+        'physical': columns['channel_type'] == physical_type,
+        'verdicts': verdicts,
+        'reasons': reasons,
+        'topology': topology,
+    }
+
 # ==============================================================================
 # 3. Main Execution Script (Main Execution Script) 
 # ==============================================================================
-def run_topology_filter(json_filepath, log_path='topology_filter_log.txt'):
+def load_topology_index(ontology_path=None):
     """
-    read the interaction.json file, perform topology filtering on the physical channels, and save the log.
+    build the TopologyIndex for a building: from its Brick .ttl (tables cached on disk by file hash)
+    or, without an ontology, from the hardcoded virtual building tables above.
     """
-    log_lines = []
-    log_lines.append("="*40)
-    log_lines.append("Starting IoTSemVer TopologyFilter")
-    log_lines.append(f"Reading interactions from: {json_filepath}")
-    log_lines.append("="*40)
-    
-    try:
-        with open(json_filepath, 'r') as f:
-            interactions_data = json.load(f)
-    except FileNotFoundError:
-        log_lines.append(f"Error: The file '{json_filepath}' was not found.")
-        with open(log_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(log_lines))
-        return
-    except json.JSONDecodeError:
-        log_lines.append(f"Error: The file '{json_filepath}' is not a valid JSON file.")
-        with open(log_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(log_lines))
-        return
+    if ontology_path is None:
+        return TopologyIndex(space_floors, hvac_service_zones, space_adjacencies)
+    tables = load_topology_tables(ontology_path)
+    zones, adjacencies = tables['hvac_service_zones'], tables['space_adjacencies']
+    # an ontology without feeds / adjacentTo triples would silently disable R2 / R3
+    if not zones:
+        print(f"Warning: {ontology_path} has no HVAC zones (feeds / isFedBy), using the hardcoded hvac_service_zones")
+        zones = hvac_service_zones
+    if not adjacencies:
+        print(f"Warning: {ontology_path} has no space adjacency (adjacentTo), using the hardcoded space_adjacencies")
+        adjacencies = space_adjacencies
+    return TopologyIndex(tables['space_floors'], zones, adjacencies, location_aliases=tables['location_aliases'])
+
+# one interaction as it flows through the filter; the same fields as an action/trigger endpoint pair
+Interaction = namedtuple('Interaction', [
+    'id', 'channel_type', 'channel',
+    'action_rule', 'action_device', 'action_location',
+    'trigger_rule', 'trigger_device', 'trigger_location'
+])
+
+def interaction_from_dict(interaction_id, details):
+    actions = details.get('actions', {})
+    triggers = details.get('triggers', {})
+    return Interaction(interaction_id, actions.get('channel_type'), actions.get('implicit_channel'),
+                       actions.get('rule_id'), actions.get('device_name'), actions.get('device_location'),
+                       triggers.get('rule_id'), triggers.get('device_name'), triggers.get('device_location'))
 
-    plausible_interactions = []
-    pruned_interactions = []
-    skipped_count = 0
-
-    for interaction_id, details in interactions_data.items():
-        # step 1: check if it is 'implicit_physical_channel'
-        if details.get('actions', {}).get('channel_type') != 'implicit_physical_channel':
-            skipped_count += 1
-            continue
-
-        log_lines.append(f"\n---> Analyzing Interaction '{interaction_id}':")
-        
-        # step 2: extract and normalize the device name and channel type
-        source_device_location = details['actions']['device_location']
-        target_device_location = details['triggers']['device_location']
-        channel_type = details['actions']['implicit_channel']
-
-        source_device_bldg = f"{source_device_location}"
-        target_device_bldg = f"{target_device_location}"
-        
-        log_lines.append(f"     {source_device_bldg} --({channel_type})--> {target_device_bldg}")
-
-        channel_to_check = {
-            'source': source_device_bldg,
-            'target': target_device_bldg,
-            'type': channel_type
+def interaction_to_dict(interaction):
+    """back to the {'id', 'actions', 'triggers'} record format written by InteractionDiscover"""
+    return {
+        'id': interaction.id,
+        'actions': {
+            'implicit_channel': interaction.channel,
+            'channel_type': interaction.channel_type,
+            'rule_id': interaction.action_rule,
+            'device_name': interaction.action_device,
+            'device_location': interaction.action_location
+        },
+        'triggers': {
+            'implicit_channel': interaction.channel,
+            'channel_type': interaction.channel_type,
+            'rule_id': interaction.trigger_rule,
+            'device_name': interaction.trigger_device,
+            'device_location': interaction.trigger_location
         }
+    }
+
+def iter_interactions(json_filepath):
+    """
+    yield an Interaction for every entry of the interaction file.
+    .itab tables are read column-wise without building dicts, .ndjson/.jsonl files one line at a time,
+    and a legacy interactions.json dict is loaded whole.
+    """
+    if json_filepath.endswith('.itab'):
+        table = load_interaction_table(json_filepath)
+        for i in range(len(table)):
+            yield Interaction(f'interaction_{i+1}', *(table.value(column, i) for column in Interaction._fields[1:]))
+        return
+
+    if json_filepath.endswith(('.ndjson', '.jsonl')):
+        with open(json_filepath, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                yield interaction_from_dict(record.get('id', f'interaction_{line_no}'), record)
+    else:
+        with open(json_filepath, 'r', encoding='utf-8') as f:
+            interactions_data = json.load(f)
+        for interaction_id, details in interactions_data.items():
+            yield interaction_from_dict(interaction_id, details)
+
+def prune_rule_channels(rule, pruned_endpoints):
+    """
+    return the rule without the implicit channel annotations listed in pruned_endpoints,
+    i.e. (rule_id, device_name, channel_type, channel) endpoints whose physical interactions were all pruned.
+    untouched rules are returned as-is.
+    """
+    def prune(item):
+        if not isinstance(item, dict):
+            return item
+        drop = [key for key in ('implicit_physical_channel', 'implicit_system_channel')
+                if item.get(key) and (rule.get('rule_id'), item.get('device_name'), key, item[key]) in pruned_endpoints]
+        if not drop:
+            return item
+        return {k: v for k, v in item.items() if k not in drop}
+
+    def prune_trigger_block(block):
+        if not isinstance(block, dict) or not isinstance(block.get('conditions'), list):
+            return block
+        return dict(block, conditions=[prune(cond) for cond in block['conditions']])
+
+    pruned = dict(rule)
+    triggers = rule.get('triggers')
+    if isinstance(triggers, list):
+        pruned['triggers'] = [prune_trigger_block(block) for block in triggers]
+    elif isinstance(triggers, dict):
+        pruned['triggers'] = prune_trigger_block(triggers)
+    if isinstance(rule.get('actions'), list):
+        pruned['actions'] = [prune(action) for action in rule['actions']]
+    return pruned
+
+def write_filtered_rules(rule_data, pruned_endpoints, filtered_rules_path):
+    """
+    write the filtered rule set (same layout as json.dump(..., indent=2)) one rule at a time
+    """
+    os.makedirs(os.path.dirname(filtered_rules_path) or '.', exist_ok=True)
+    with open(filtered_rules_path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for idx, rule in enumerate(rule_data):
+            f.write(',\n  ' if idx else '\n  ')
+            f.write(json.dumps(prune_rule_channels(rule, pruned_endpoints), ensure_ascii=False, indent=2).replace('\n', '\n  '))
+        f.write('\n]' if rule_data else ']')
+
+def filter_interaction_stream(interactions, log_path, ontology_path=None, source='<stream>',
+                              rule_data=None, filtered_interactions_path=None, filtered_rules_path=None):
+    """
+    judge a stream of Interaction records and write the results as they come in:
+      - log_path: the human-readable verdict log
+      - filtered_interactions_path (optional): NDJSON of every interaction that survives the filter
+        (plausible physical interactions with their reason, plus the unjudged system-channel ones)
+      - filtered_rules_path (optional, needs rule_data): the rule set with the physical channel annotations
+        removed whose interactions were all pruned, ready for 3-GraphGenerator
+    """
+    if filtered_interactions_path:
+        os.makedirs(os.path.dirname(filtered_interactions_path) or '.', exist_ok=True)
+    with open(log_path, 'w', encoding='utf-8') as log_file, \
+         (open(filtered_interactions_path, 'w', encoding='utf-8') if filtered_interactions_path else nullcontext()) as kept_file:
+        def log(line):
+            log_file.write(line + '\n')
+
+        def keep(interaction, reason=None):
+            if kept_file is not None:
+                record = interaction_to_dict(interaction)
+                if reason is not None:
+                    record['reason'] = reason
+                kept_file.write(json.dumps(record, ensure_ascii=False) + '\n')
 
-        # step 3: call the reachability judgment function
-        reachable, reason = is_reachable(
-            channel_to_check,
-            device_locations,
-            space_floors,
-            hvac_service_zones,
-            space_adjacencies
-        )
-        
-        # step 4: record and report the result
-        if reachable:
-            plausible_interactions.append({'id': interaction_id, 'reason': reason})
-            log_lines.append(f"     [+] VERDICT: PLAUSIBLE. Reason: {reason}")
-        else:
-            pruned_interactions.append({'id': interaction_id, 'reason': reason})
-            log_lines.append(f"     [-] VERDICT: PRUNED. Reason: {reason}")
-
-    # step 5: print the final summary report
-    log_lines.append("\n" + "="*40)
-    log_lines.append("TopologyFilter Analysis Complete")
-    log_lines.append("="*40)
-    log_lines.append(f"Total Interactions in File: {len(interactions_data)}")
-    log_lines.append(f"Skipped (Not Physical Channel): {skipped_count}")
-    log_lines.append(f"Physical Channels Analyzed: {len(plausible_interactions) + len(pruned_interactions)}")
-    log_lines.append(f"Plausible Interactions Found: {len(plausible_interactions)}")
-    log_lines.append(f"Interactions Pruned: {len(pruned_interactions)}")
-
-    # save the log
-    with open(log_path, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(log_lines))
+        log("="*40)
+        log("Starting IoTSemVer TopologyFilter")
+        log(f"Reading interactions from: {source}")
+        log("="*40)
+
+        # the reachability table only depends on the building, build it once per run
+        topology = load_topology_index(ontology_path)
+        if ontology_path:
+            log(f"Topology derived from ontology: {ontology_path}")
+
+        total_count = 0
+        plausible_count = 0
+        pruned_count = 0
+        skipped_count = 0
+        # channel endpoints (rule_id, device_name, channel_type, channel) that were judged / that survived
+        judged_endpoints = set()
+        kept_endpoints = set()
+
+        try:
+            for interaction in interactions:
+                total_count += 1
+                action_endpoint = (interaction.action_rule, interaction.action_device, interaction.channel_type, interaction.channel)
+                trigger_endpoint = (interaction.trigger_rule, interaction.trigger_device, interaction.channel_type, interaction.channel)
+                # step 1: check if it is 'implicit_physical_channel'
+                if interaction.channel_type != 'implicit_physical_channel':
+                    skipped_count += 1
+                    keep(interaction)
+                    continue
+
+                log(f"\n---> Analyzing Interaction '{interaction.id}':")
+
+                # step 2: normalize the device locations
+                source_device_bldg = f"{interaction.action_location}"
+                target_device_bldg = f"{interaction.trigger_location}"
+                channel_type = interaction.channel
+
+                log(f"     {source_device_bldg} --({channel_type})--> {target_device_bldg}")
+
+                channel_to_check = {
+                    'source': source_device_bldg,
+                    'target': target_device_bldg,
+                    'type': channel_type
+                }
+
+                # step 3: look up the precompiled reachability table
+                reachable, reason = topology.is_reachable(channel_to_check)
+
+                # step 4: record and report the result
+                judged_endpoints.add(action_endpoint)
+                judged_endpoints.add(trigger_endpoint)
+                if reachable:
+                    plausible_count += 1
+                    kept_endpoints.add(action_endpoint)
+                    kept_endpoints.add(trigger_endpoint)
+                    keep(interaction, reason)
+                    log(f"     [+] VERDICT: PLAUSIBLE. Reason: {reason}")
+                else:
+                    pruned_count += 1
+                    log(f"     [-] VERDICT: PRUNED. Reason: {reason}")
+        except FileNotFoundError:
+            log(f"Error: The file '{source}' was not found.")
+            return
+        except json.JSONDecodeError:
+            log(f"Error: The file '{source}' is not a valid JSON file.")
+            return
+
+        # step 5: print the final summary report
+        log("\n" + "="*40)
+        log("TopologyFilter Analysis Complete")
+        log("="*40)
+        log(f"Total Interactions in File: {total_count}")
+        log(f"Skipped (Not Physical Channel): {skipped_count}")
+        log(f"Physical Channels Analyzed: {plausible_count + pruned_count}")
+        log(f"Plausible Interactions Found: {plausible_count}")
+        log(f"Interactions Pruned: {pruned_count}")
+
+    # step 6: the filtered rule set for 3-GraphGenerator
+    if filtered_rules_path and rule_data is not None:
+        write_filtered_rules(rule_data, judged_endpoints - kept_endpoints, filtered_rules_path)
+        print(f"Filtered rule set saved to {filtered_rules_path}")
+
+def run_topology_filter(json_filepath, log_path='topology_filter_log.txt', ontology_path=None,
+                        rules_path=None, filtered_interactions_path=None, filtered_rules_path=None):
+    """
+    read the interaction file (.itab table, NDJSON stream or legacy JSON dict), perform topology filtering on the physical channels, and save the log.
+    the log is written while interactions are judged, so memory does not grow with the number of interactions.
+    ontology_path selects the building's Brick .ttl; without it the hardcoded virtual building tables are used.
+    rules_path (the rules the interactions were discovered from) is needed to write filtered_rules_path.
+    """
+    rule_data = None
+    if rules_path and filtered_rules_path:
+        with open(rules_path, 'r', encoding='utf-8') as f:
+            rule_data = json.load(f)
+    filter_interaction_stream(iter_interactions(json_filepath), log_path, ontology_path, source=json_filepath,
+                              rule_data=rule_data, filtered_interactions_path=filtered_interactions_path,
+                              filtered_rules_path=filtered_rules_path)
+
+def run_pipeline(rules_path, log_path, ontology_path=None, filtered_interactions_path=None, filtered_rules_path=None):
+    """
+    discovery -> topology filter -> filtered rule set in one streaming pass:
+    interactions go straight from the channel join into the filter without an intermediate file.
+    """
+    with open(rules_path, 'r', encoding='utf-8') as f:
+        rule_data = json.load(f)
+    interactions = (interaction_from_dict(f'interaction_{idx}', details)
+                    for idx, details in enumerate(discover_iter_interactions(rule_data), 1))
+    filter_interaction_stream(interactions, log_path, ontology_path, source=f'{rules_path} (channel join)',
+                              rule_data=rule_data, filtered_interactions_path=filtered_interactions_path,
+                              filtered_rules_path=filtered_rules_path)
 
 if __name__ == '__main__':
-    
-    file_path = './2-ChannelInference_TopoFilter/output/interaction/interactions.json'
+
+    rules_path = './2-ChannelInference_TopoFilter/output/virtualBuilding_gemini-2.5-pro_slices/virtualBuilding_gemini-2.5.json'
+    file_path = './2-ChannelInference_TopoFilter/output/interaction/interactions.ndjson'
     output_path = './2-ChannelInference_TopoFilter/output/topologyFilter/interactions_filter.txt'
+    filtered_interactions_path = './2-ChannelInference_TopoFilter/output/topologyFilter/interactions_filtered.ndjson'
+    # copy it to 3-GraphGenerator/input/ to build the graph from it
+    filtered_rules_path = './2-ChannelInference_TopoFilter/output/topologyFilter/virtualBuilding_filter.json'
+    # a building's Brick .ttl, or None for the hardcoded virtual building tables. virtualBuilding.ttl
+    # (./1-SemanticParser/input/building_ontology/) has no adjacentTo triples and a single HVAC zone,
+    # so the hardcoded tables stay the default until it carries those facts
+    ontology_path = None
+    # True: discover and filter in one pass from rules_path, without reading interactions.ndjson
+    run_as_pipeline = False
 
-    run_topology_filter(file_path,output_path)
\ No newline at end of file
+    if run_as_pipeline:
+        run_pipeline(rules_path, output_path, ontology_path, filtered_interactions_path, filtered_rules_path)
+    else:
+        run_topology_filter(file_path, output_path, ontology_path, rules_path, filtered_interactions_path, filtered_rules_path)
@@ -0,0 +1,181 @@
+'''
+Compact, column-oriented storage for discovered interactions.
+
+Instead of repeating the full action/trigger dicts for every interaction, rule IDs,
+device names, locations and channel names are interned once into string tables and
+each interaction is a row of integer indices into those tables:
+
+    column            -> string table
+    ---------------------------------
+    channel           -> channels
+    channel_type      -> channel_types  (implicit_physical_channel / implicit_system_channel)
+    action_rule       -> rules
+    action_device     -> devices
+    action_location   -> locations
+    trigger_rule      -> rules
+    trigger_device    -> devices
+    trigger_location  -> locations
+
+Missing values (e.g. a device without a location in the rule context) are stored as -1.
+
+File layout (.itab):
+    b'ITAB1\n' | uint32 header length | JSON header (row count + string tables) | int32 columns, little-endian
+
+Readers: InteractionFilter (run_topology_filter / filter_interaction_table) is the only stage that
+reads interaction tables. 3-GraphGenerator builds its graph from the filtered rules, whose channel
+annotations already imply every interaction, and 4-GraphAnalyzer reads the graph that stage writes
+(.graph.json / .gcsr), so neither has a use for the interaction list itself.
+'''
+
+import json
+import struct
+import sys
+from array import array
+
+MAGIC = b'ITAB1\n'
+
+# column name -> string table it indexes into
+COLUMNS = {
+    'channel': 'channels',
+    'channel_type': 'channel_types',
+    'action_rule': 'rules',
+    'action_device': 'devices',
+    'action_location': 'locations',
+    'trigger_rule': 'rules',
+    'trigger_device': 'devices',
+    'trigger_location': 'locations',
+}
+TABLES = ['rules', 'devices', 'locations', 'channels', 'channel_types']
+
+
+class StringTable:
+    """
+    interned strings: value -> index and index -> value
+    """
+    def __init__(self, values=None):
+        self.values = []
+        self.index = {}
+        for value in values or []:
+            self.intern(value)
+
+    def intern(self, value):
+        if value is None:
+            return -1
+        idx = self.index.get(value)
+        if idx is None:
+            idx = len(self.values)
+            self.index[value] = idx
+            self.values.append(value)
+        return idx
+
+    def lookup(self, value):
+        """index of value, or -1 if it was never interned"""
+        return self.index.get(value, -1)
+
+    def __getitem__(self, idx):
+        return self.values[idx] if idx >= 0 else None
+
+    def __len__(self):
+        return len(self.values)
+
+
+class InteractionTable:
+    """
+    array-backed interaction set. Readers can work on the integer columns directly
+    (table.columns['channel'], table.tables['channels']) or expand single rows with row().
+    """
+    def __init__(self):
+        self.tables = {name: StringTable() for name in TABLES}
+        self.columns = {name: array('i') for name in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns['channel'])
+
+    def append(self, interaction):
+        """add one interaction in the {'actions': {...}, 'triggers': {...}} form produced by InteractionDiscover"""
+        action = interaction['actions']
+        trigger = interaction['triggers']
+        values = {
+            'channel': action.get('implicit_channel'),
+            'channel_type': action.get('channel_type'),
+            'action_rule': action.get('rule_id'),
+            'action_device': action.get('device_name'),
+            'action_location': action.get('device_location'),
+            'trigger_rule': trigger.get('rule_id'),
+            'trigger_device': trigger.get('device_name'),
+            'trigger_location': trigger.get('device_location'),
+        }
+        for column, value in values.items():
+            self.columns[column].append(self.tables[COLUMNS[column]].intern(value))
+
+    def extend(self, interactions):
+        for interaction in interactions:
+            self.append(interaction)
+
+    def value(self, column, i):
+        """decoded string value of one cell"""
+        return self.tables[COLUMNS[column]][self.columns[column][i]]
+
+    def row(self, i):
+        """expand row i back to the interaction dict format"""
+        channel = self.value('channel', i)
+        channel_type = self.value('channel_type', i)
+        return {
+            'actions': {
+                'implicit_channel': channel,
+                'channel_type': channel_type,
+                'rule_id': self.value('action_rule', i),
+                'device_name': self.value('action_device', i),
+                'device_location': self.value('action_location', i)
+            },
+            'triggers': {
+                'implicit_channel': channel,
+                'channel_type': channel_type,
+                'rule_id': self.value('trigger_rule', i),
+                'device_name': self.value('trigger_device', i),
+                'device_location': self.value('trigger_location', i)
+            }
+        }
+
+    def iter_rows(self):
+        """yield (interaction_id, interaction dict) pairs, ids follow the interaction_N convention"""
+        for i in range(len(self)):
+            yield f'interaction_{i+1}', self.row(i)
+
+    def save(self, path):
+        header = json.dumps({
+            'rows': len(self),
+            'columns': list(COLUMNS),
+            'strings': {name: self.tables[name].values for name in TABLES}
+        }, ensure_ascii=False).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for column in COLUMNS:
+                data = self.columns[column]
+                if sys.byteorder != 'little':
+                    data = array('i', data)
+                    data.byteswap()
+                data.tofile(f)
+
+
+def load_interaction_table(path):
+    """
+    load an .itab file written by InteractionTable.save
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{path}' is not an interaction table file.")
+        (header_len,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+        table = InteractionTable()
+        table.tables = {name: StringTable(header['strings'].get(name, [])) for name in TABLES}
+        rows = header['rows']
+        for column in header['columns']:
+            data = array('i')
+            data.frombytes(f.read(rows * data.itemsize))
+            if sys.byteorder != 'little':
+                data.byteswap()
+            table.columns[column] = data
+    return table
@@ -0,0 +1,304 @@
+'''
+Derive the topology tables used by InteractionFilter from a Brick (.ttl) building ontology.
+
+    device_locations    {"bldg:VAV_1A": "Office_1A", ...}       isLocationOf / hasLocation / hasPart / isPartOf / hasPoint / isPointOf
+    space_floors        {"Office_1A": 1, ..., "Roof": 4}         Building hasPart Floor (order = level), Floor hasPart Space
+    hvac_service_zones  {"bldg:Central_AHU": {"Office_1A", ...}} spaces reached downstream through feeds / isFedBy
+    space_adjacencies   {"Hallway_1": {"Office_1A", ...}}        adjacentTo / isAdjacentTo (symmetric), if the ontology has them
+    location_aliases    {"Office 1A": "Office_1A", ...}          labels and spelling variants used in rule contexts
+
+Parsing turtle is the slow part, so the tables are cached as a pickle keyed by the SHA-256
+of the .ttl file; a cache hit skips the parser entirely.
+'''
+
+import hashlib
+import os
+import pickle
+import re
+from collections import defaultdict
+
+CACHE_DIR = './2-ChannelInference_TopoFilter/output/topology_cache'
+# bump when the derived table layout changes so old cache files are ignored
+CACHE_VERSION = 1
+
+RDF_TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
+
+# predicate local name -> (whole/location side, part/device side)
+PART_OF_PREDICATES = {'hasPart': 0, 'isPartOf': 1}
+LOCATION_PREDICATES = {'isLocationOf': 0, 'hasLocation': 1, 'hasPart': 0, 'isPartOf': 1, 'hasPoint': 0, 'isPointOf': 1}
+FEEDS_PREDICATES = {'feeds': 0, 'isFedBy': 1}
+ADJACENCY_PREDICATES = {'adjacentTo', 'isAdjacentTo', 'adjacentElement'}
+# preferred owners of an HVAC zone when several upstream devices serve the same spaces
+AIR_HANDLER_TYPES = {'AHU', 'Air_Handler_Unit', 'Air_Handling_Unit', 'RTU', 'DOAS', 'Makeup_Air_Unit'}
+
+# ==============================================================================
+# 1. Minimal Turtle Parser
+# ==============================================================================
+TOKEN_PATTERN = re.compile(r'''
+    (?P<ws>\s+|\#[^\n]*)
+  | (?P<iri><[^>]*>)
+  | (?P<string>"""(?:.|\n)*?"""|"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')(?:@[A-Za-z\-]+|\^\^(?:<[^>]*>|[A-Za-z][\w\-]*:[\w\-]*))?
+  | (?P<directive>@prefix|@base|PREFIX\b|BASE\b)
+  | (?P<number>[+-]?(?:\d+\.\d*(?:[eE][+-]?\d+)?|\.?\d+(?:[eE][+-]?\d+)?))
+  | (?P<pname>(?:[A-Za-z][\w\-]*)?:(?:[\w\-:%]|\.(?=[\w\-:%]))*)
+  | (?P<keyword>a\b|true\b|false\b)
+  | (?P<bnode>_:[\w\-]+)
+  | (?P<punct>[;,.\[\]()])
+''', re.VERBOSE)
+
+
+def tokenize(text):
+    pos = 0
+    while pos < len(text):
+        m = TOKEN_PATTERN.match(text, pos)
+        if not m:
+            raise ValueError(f"Turtle syntax error near: {text[pos:pos+40]!r}")
+        pos = m.end()
+        if m.lastgroup != 'ws':
+            yield m.lastgroup, m.group(0)
+
+
+def parse_turtle(text):
+    """
+    parse the subset of Turtle used by our building ontologies.
+    returns (triples, prefixes); IRIs are expanded, literals are kept as their lexical string.
+    """
+    tokens = list(tokenize(text))
+    prefixes = {}
+    triples = []
+    pos = 0
+    blank_count = [0]
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else (None, None)
+
+    def take(expected=None):
+        nonlocal pos
+        if pos >= len(tokens):
+            raise ValueError("Turtle syntax error: unexpected end of file.")
+        token = tokens[pos]
+        if expected is not None and token[1] != expected:
+            raise ValueError(f"Turtle syntax error: expected '{expected}', got '{token[1]}'.")
+        pos += 1
+        return token
+
+    def term(kind, value):
+        if kind == 'iri':
+            return value[1:-1]
+        if kind == 'pname':
+            prefix, _, local = value.partition(':')
+            if prefix not in prefixes:
+                raise ValueError(f"Turtle syntax error: undeclared prefix '{prefix}:'.")
+            return prefixes[prefix] + local
+        if kind == 'keyword' and value == 'a':
+            return RDF_TYPE
+        if kind == 'string':
+            if value.startswith('"""'):
+                return value[3:value.rindex('"""')]
+            return value[1:value.rindex(value[0])]
+        return value
+
+    def parse_object():
+        kind, value = take()
+        if value == '[':
+            return parse_blank_node()
+        if value == '(':
+            raise ValueError("Turtle collections '( ... )' are not supported.")
+        return term(kind, value)
+
+    def parse_blank_node():
+        blank_count[0] += 1
+        node = f'_:b{blank_count[0]}'
+        if peek()[1] != ']':
+            parse_predicate_object_list(node)
+        take(']')
+        return node
+
+    def parse_predicate_object_list(subject):
+        while True:
+            predicate = term(*take())
+            triples.append((subject, predicate, parse_object()))
+            while peek()[1] == ',':
+                take(',')
+                triples.append((subject, predicate, parse_object()))
+            if peek()[1] != ';':
+                return
+            while peek()[1] == ';':
+                take(';')
+            if peek()[1] in ('.', ']'):
+                return
+
+    while pos < len(tokens):
+        kind, value = take()
+        if kind == 'directive':
+            if value.lower().endswith('prefix'):
+                name = take()[1]
+                prefixes[name[:-1]] = term(*take())
+            else:
+                take()
+            if value.startswith('@'):
+                take('.')
+            continue
+        subject = parse_blank_node() if value == '[' else term(kind, value)
+        if peek()[1] != '.':
+            parse_predicate_object_list(subject)
+        take('.')
+    return triples, prefixes
+
+# ==============================================================================
+# 2. Topology Table Construction
+# ==============================================================================
+def local_name(iri):
+    return re.split(r'[#/]', iri)[-1]
+
+
+def build_topology_tables(triples, prefixes):
+    """
+    turn parsed triples into the InteractionFilter lookup tables
+    """
+    # compact IRIs back to prefix:local for device / AHU keys (e.g. "bldg:VAV_1A")
+    namespaces = sorted(prefixes.items(), key=lambda item: -len(item[1]))
+    def compact(iri):
+        for prefix, ns in namespaces:
+            if ns and iri.startswith(ns):
+                return f'{prefix}:{iri[len(ns):]}'
+        return iri
+
+    types = defaultdict(set)
+    labels = {}
+    by_predicate = defaultdict(list)
+    for s, p, o in triples:
+        if p == RDF_TYPE:
+            types[s].add(local_name(o))
+        elif local_name(p) == 'label':
+            labels.setdefault(s, o)
+        else:
+            by_predicate[local_name(p)].append((s, o))
+
+    def edges(predicates):
+        # normalise (s, o) pairs to (container, member) using the predicate direction
+        for name, direction in predicates.items():
+            for s, o in by_predicate.get(name, []):
+                yield (s, o) if direction == 0 else (o, s)
+
+    # --- floors and spaces ---
+    buildings = {n for n, t in types.items() if 'Building' in t}
+    floors = {n for n, t in types.items() if 'Floor' in t}
+    building_parts = []
+    floor_spaces = defaultdict(list)
+    for whole, part in edges(PART_OF_PREDICATES):
+        if whole in buildings:
+            # systems (HVAC_System, Lighting_System, ...) are logical parts, not levels of the building
+            if part not in building_parts and not any(t.endswith('System') for t in types[part]):
+                building_parts.append(part)
+        elif whole in floors and part not in floor_spaces[whole]:
+            floor_spaces[whole].append(part)
+
+    space_floors = {}
+    for level, part in enumerate(building_parts, 1):
+        if part in floors:
+            for space in floor_spaces[part]:
+                space_floors.setdefault(local_name(space), level)
+        else:
+            # a non-floor part of the building (e.g. the roof) is a level of its own
+            space_floors.setdefault(local_name(part), level)
+    # floors that are not attached to a building keep their spaces, ordered after the attached ones
+    for level, floor in enumerate(sorted(f for f in floors if f not in building_parts), len(building_parts) + 1):
+        for space in floor_spaces[floor]:
+            space_floors.setdefault(local_name(space), level)
+    spaces = {iri for iri in set(types) | {m for pairs in floor_spaces.values() for m in pairs} | set(building_parts)
+              if local_name(iri) in space_floors}
+
+    # --- device locations ---
+    device_locations = {}
+    for location, device in edges(LOCATION_PREDICATES):
+        if location in spaces and device not in spaces and device not in floors:
+            device_locations.setdefault(compact(device), local_name(location))
+
+    # --- HVAC service zones: spaces downstream of each feeding device ---
+    feeds = defaultdict(list)
+    for upstream, downstream in edges(FEEDS_PREDICATES):
+        if downstream not in feeds[upstream]:
+            feeds[upstream].append(downstream)
+
+    def served_spaces(root):
+        seen, stack, served = {root}, [root], set()
+        while stack:
+            node = stack.pop()
+            for nxt in feeds.get(node, []):
+                if nxt in seen:
+                    continue
+                seen.add(nxt)
+                if nxt in spaces:
+                    served.add(local_name(nxt))
+                stack.append(nxt)
+        return served
+
+    zones_by_spaces = {}
+    for feeder in feeds:
+        served = frozenset(served_spaces(feeder))
+        if len(served) < 2:
+            # a single-space zone can never connect two different locations
+            continue
+        owner = zones_by_spaces.get(served)
+        if owner is None or (types[feeder] & AIR_HANDLER_TYPES and not types[owner] & AIR_HANDLER_TYPES):
+            zones_by_spaces[served] = feeder
+    hvac_service_zones = {compact(owner): set(served) for served, owner in zones_by_spaces.items()}
+
+    # --- explicit adjacency (symmetric) ---
+    space_adjacencies = defaultdict(set)
+    for name in ADJACENCY_PREDICATES:
+        for s, o in by_predicate.get(name, []):
+            if s in spaces and o in spaces:
+                space_adjacencies[local_name(s)].add(local_name(o))
+                space_adjacencies[local_name(o)].add(local_name(s))
+
+    # --- spellings used for spaces in rule contexts ---
+    location_aliases = {}
+    for iri in spaces:
+        name = local_name(iri)
+        for alias in (compact(iri), name.replace('_', ' '), labels.get(iri)):
+            if alias and alias != name:
+                location_aliases.setdefault(alias, name)
+                location_aliases.setdefault(alias.replace(' ', '_'), name)
+
+    return {
+        'device_locations': device_locations,
+        'space_floors': space_floors,
+        'hvac_service_zones': hvac_service_zones,
+        'space_adjacencies': dict(space_adjacencies),
+        'location_aliases': location_aliases,
+    }
+
+# ==============================================================================
+# 3. Cached Loader
+# ==============================================================================
+def load_topology_tables(ttl_path, cache_dir=CACHE_DIR):
+    """
+    return the topology tables for ttl_path, parsing the turtle only when its content hash is not cached
+    """
+    with open(ttl_path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    cache_path = None
+    if cache_dir:
+        stem = os.path.splitext(os.path.basename(ttl_path))[0]
+        cache_path = os.path.join(cache_dir, f'{stem}_{digest[:16]}.pkl')
+        try:
+            with open(cache_path, 'rb') as f:
+                cached = pickle.load(f)
+            if cached.get('version') == CACHE_VERSION and cached.get('sha256') == digest:
+                return cached['tables']
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+            pass
+
+    triples, prefixes = parse_turtle(content.decode('utf-8'))
+    tables = build_topology_tables(triples, prefixes)
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': CACHE_VERSION, 'sha256': digest, 'tables': tables}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    return tables
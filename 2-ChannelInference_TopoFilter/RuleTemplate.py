@@ -0,0 +1,189 @@
+'''
+Rule-template cache for channel inference.
+
+Templated buildings repeat the same rule once per room: Rule_1..Rule_N are "temperature in
+Office <X> rises above 24°C -> VAV_<X> damper 100" with only the room changing. The implicit
+channels the LLM assigns depend on what is sensed and actuated, not on which room, so a rule is
+reduced to a template before it is sent:
+    - device names lose their trailing location / instance parts (TempSensor_1A -> tempsensor,
+      Luminaire_Office_1A -> luminaire), using the rule's own context.device_locations; type words
+      with digits (CO2Sensor, PM25Sensor) are kept
+    - numeric values become <num>; attribute, command, operator and text values are kept
+    - rule_id, description and context are ignored
+The channels inferred for one rule of a template are stored per condition / action position in
+channel_template_cache.json (salted with model and prompt) and copied onto every other rule with
+that template, in this run and the next ones. Only one rule per novel template reaches the LLM.
+
+Usage:
+    templates = TemplateCache(salt=f'{model_name}\n{prompt_text}')
+    key = templates.key(rule)
+    annotated = templates.apply(key, rule)      # None if the template was never inferred
+    templates.learn(key, rule, llm_annotated_rule)
+    templates.save()
+'''
+
+import copy
+import hashlib
+import json
+import os
+import re
+
+from InteractionDiscover import CHANNEL_KEYS
+
+CACHE_PATH = './2-ChannelInference_TopoFilter/output/channel_template_cache.json'
+# bump when the template layout changes so old cache entries are ignored
+CACHE_VERSION = 2
+
+NUMBER_PATTERN = re.compile(r'^[+-]?\d+(?:\.\d+)?$')
+# instance / room number suffix of a device name: _1, _1A, _02
+INSTANCE_PATTERN = re.compile(r'\d+[a-z]?')
+
+# ==============================================================================
+# 1. Canonicalization
+# ==============================================================================
+def _words(name):
+    return [w for w in re.split(r'[_\s\-]+', str(name or '')) if w]
+
+
+def location_words(rule):
+    """lowercased words of every location named in the rule context (Office_1A -> office, 1a)"""
+    context = rule.get('context') or {}
+    names = list(context.get('involved_locations') or [])
+    names += [dl.get('location') for dl in context.get('device_locations') or [] if isinstance(dl, dict)]
+    return {w.lower() for name in names for w in _words(name)}
+
+
+def abstract_device(name, locations):
+    """
+    device name without its trailing location and instance parts: VAV_1A -> vav,
+    Luminaire_Office_1A -> luminaire, Main_FACP -> main_facp. type words with digits stay
+    (CO2Sensor_1 -> co2sensor, PM25Sensor -> pm25sensor)
+    """
+    words = [w.lower() for w in _words(name)]
+    while len(words) > 1 and (words[-1] in locations or INSTANCE_PATTERN.fullmatch(words[-1])):
+        words.pop()
+    return '_'.join(words) or '<device>'
+
+
+def abstract_value(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)) or NUMBER_PATTERN.match(str(value).strip()):
+        return '<num>'
+    if isinstance(value, str):
+        return value.strip().lower()
+    return json.dumps(value, sort_keys=True)
+
+
+def rule_template(rule):
+    """
+    the location-free shape of a rule, or None if it is not a well-formed structured rule
+    """
+    try:
+        locations = location_words(rule)
+        triggers = rule.get('triggers') or {}
+        operator = triggers.get('logical_operator')
+        conditions = [[abstract_device(c.get('device_name'), locations), c.get('attribute'),
+                       c.get('operator'), abstract_value(c.get('value'))]
+                      for c in triggers.get('conditions') or []]
+        actions = [[abstract_device(a.get('device_name'), locations), a.get('attribute'),
+                    a.get('command'), abstract_value(a.get('value'))]
+                   for a in rule.get('actions') or []]
+    except (AttributeError, TypeError):
+        return None
+    if not actions:
+        return None
+    return {'logical_operator': str(operator).upper() if operator else None,
+            'conditions': conditions, 'actions': actions}
+
+# ==============================================================================
+# 2. Channel Annotations
+# ==============================================================================
+def _entries(rule):
+    return (rule.get('triggers') or {}).get('conditions') or [], rule.get('actions') or []
+
+
+def extract_channels(rule):
+    """{'conditions': [{channel key: value}], 'actions': [...]} of an annotated rule"""
+    conditions, actions = _entries(rule)
+    return {'conditions': [{k: e[k] for k in CHANNEL_KEYS if e.get(k)} for e in conditions],
+            'actions': [{k: e[k] for k in CHANNEL_KEYS if e.get(k)} for e in actions]}
+
+
+def apply_channels(rule, channels):
+    """copy of rule with the channels of its template set on each condition / action"""
+    annotated = copy.deepcopy(rule)
+    conditions, actions = _entries(annotated)
+    for entries, annotations in ((conditions, channels['conditions']), (actions, channels['actions'])):
+        for entry, annotation in zip(entries, annotations):
+            for k in CHANNEL_KEYS:
+                entry.pop(k, None)
+            entry.update(annotation)
+    return annotated
+
+
+def _same_shape(rule, annotated):
+    """the LLM answer has the rule's conditions / actions, in the same order"""
+    if not isinstance(annotated, dict):
+        return False
+    for entries, annotated_entries in zip(_entries(rule), _entries(annotated)):
+        if len(entries) != len(annotated_entries):
+            return False
+        for entry, annotated_entry in zip(entries, annotated_entries):
+            if not isinstance(annotated_entry, dict) or entry.get('device_name') != annotated_entry.get('device_name'):
+                return False
+    return True
+
+# ==============================================================================
+# 3. Cache
+# ==============================================================================
+class TemplateCache:
+    def __init__(self, path=CACHE_PATH, salt=''):
+        self.path = path
+        self.salt = salt
+        self.templates = {}
+        self.learned = 0
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == CACHE_VERSION:
+                    self.templates = data.get('templates', {})
+            except (OSError, ValueError):
+                print(f"Warning: template cache {path} is unreadable, starting empty")
+
+    def key(self, rule):
+        """template key of a rule, or None if it cannot be templated"""
+        template = rule_template(rule) if isinstance(rule, dict) else None
+        if template is None:
+            return None
+        payload = json.dumps([self.salt, template], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        return key is not None and key in self.templates
+
+    def apply(self, key, rule):
+        """rule annotated from its cached template, or None"""
+        if key not in self:
+            return None
+        return apply_channels(rule, self.templates[key]['channels'])
+
+    def learn(self, key, rule, annotated):
+        """
+        store the channels the LLM gave rule under its template; False if the answer does not line
+        up with the rule (conditions / actions missing or reordered) and cannot be reused
+        """
+        if key is None or not _same_shape(rule, annotated):
+            return False
+        if key not in self.templates:
+            self.learned += 1
+        self.templates[key] = {'example': rule.get('rule_id'), 'channels': extract_channels(annotated)}
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'templates': self.templates}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
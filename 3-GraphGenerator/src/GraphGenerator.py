@@ -1,69 +1,91 @@
 import json
-import graphviz
 import os
+import sys
+from collections import Counter
 
-def generate_interaction_graph(rules_data, output_filename_prefix="smart_building_rules_graph"):
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+from graph_model import InteractionGraph, GRAPH_FILE_SUFFIX
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from RenderQueue import RenderQueue, spawn_background
+from GraphPartition import save_partitions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '2-ChannelInference_TopoFilter'))
+from OntologyLoader import load_topology_tables
+
+# channel key -> channel type shown in the node label (stage 4 reads [Physical] / [System] from it)
+CHANNEL_KEY_TYPES = [('implicit_physical_channel', 'Physical'),
+                     ('implicit_system_channel', 'System'),
+                     ('implicit_channel', 'Unknown')]
+CHANNEL_NODE_KINDS = {'Physical': 'physical_channel', 'System': 'system_channel', 'Unknown': 'channel'}
+
+def channel_node_id(channel_name):
+    return f'CH_{channel_name.replace(":", "_").replace(".", "_")}'
+
+def rule_entries(rule):
     """
-    generate the interaction graph based on the rule data.
+    all conditions (of every trigger block) and actions of a rule that are objects
     """
-    dot = graphviz.Digraph('SmartBuildingRules', comment='Smart Building Control Rule Interaction Graph')
-    dot.attr(rankdir='LR', splines='spline', nodesep='0.7', ranksep='1.5', overlap='prism', concentrate='false', compound='true', charset='UTF-8')
+    triggers = rule.get('triggers', [])
+    if isinstance(triggers, dict):
+        triggers = [triggers]
+    for trigger_block in triggers:
+        if not isinstance(trigger_block, dict):
+            continue
+        conditions = trigger_block.get('conditions', [])
+        if not isinstance(conditions, list):
+            conditions = [conditions] if isinstance(conditions, dict) else []
+        for cond in conditions:
+            if cond and isinstance(cond, dict):
+                yield cond
+    for action in rule.get('actions', []):
+        if action and isinstance(action, dict):
+            yield action
 
-    all_channels = set()
+def index_channel_types(rules_data):
+    """
+    one pass over every condition and action: ({channel: type}, {channel: {type: tag count}} for
+    channels tagged both Physical and System). a conflicting channel gets the type it is tagged with
+    most often (the later tag on a tie); implicit_channel alone gives Unknown.
+    """
+    tags = {}
+    last_typed = {}
     for rule in rules_data:
-        triggers = rule.get('triggers', [])
-        if isinstance(triggers, dict):
-            triggers = [triggers]
-        for trigger_block in triggers:
-            conditions = trigger_block.get('conditions', [])
-            if not isinstance(conditions, list):
-                conditions = [conditions] if isinstance(conditions, dict) else []
-            for cond in conditions:
-                if cond and isinstance(cond, dict):
-                    for key in ['implicit_channel', 'implicit_physical_channel', 'implicit_system_channel']:
-                        if cond.get(key):
-                            all_channels.add(cond[key])
-        for action in rule.get('actions', []):
-            if action and isinstance(action, dict):
-                for key in ['implicit_channel', 'implicit_physical_channel', 'implicit_system_channel']:
-                    if action.get(key):
-                        all_channels.add(action[key])
-
-    for channel_name in sorted(list(all_channels)):
-        channel_type = "Unknown"
-        for rule in rules_data:
-            triggers = rule.get('triggers', [])
-            if isinstance(triggers, dict):
-                triggers = [triggers]
-            for trigger_block in triggers:
-                conditions = trigger_block.get('conditions', [])
-                if not isinstance(conditions, list):
-                    conditions = [conditions] if isinstance(conditions, dict) else []
-                for cond in conditions:
-                    if cond and isinstance(cond, dict):
-                        if cond.get('implicit_physical_channel') == channel_name:
-                            channel_type = "Physical"
-                        elif cond.get('implicit_system_channel') == channel_name:
-                            channel_type = "System"
-                        elif cond.get('implicit_channel') == channel_name:
-                            channel_type = "Unknown"
-            for action in rule.get('actions', []):
-                if action and isinstance(action, dict):
-                    if action.get('implicit_physical_channel') == channel_name:
-                        channel_type = "Physical"
-                    elif action.get('implicit_system_channel') == channel_name:
-                        channel_type = "System"
-                    elif action.get('implicit_channel') == channel_name:
-                        channel_type = "Unknown"
-        node_id = f'CH_{channel_name.replace(":", "_").replace(".", "_")}'
-        dot.node(node_id, 
-                 label=f"{channel_name} [{channel_type}]", 
-                 shape='ellipse', 
-                 style='filled', 
-                 fillcolor='#FFC0CB',
-                 fontcolor='black',
-                 color='red',
-                 penwidth='1.5')
+        for entry in rule_entries(rule):
+            for key, channel_type in CHANNEL_KEY_TYPES:
+                channel_name = entry.get(key)
+                if not channel_name or not isinstance(channel_name, str):
+                    continue
+                tags.setdefault(channel_name, Counter())[channel_type] += 1
+                if channel_type != 'Unknown':
+                    last_typed[channel_name] = channel_type
+
+    channel_types = {}
+    conflicts = {}
+    for channel_name, counts in tags.items():
+        typed = {t: n for t, n in counts.items() if t != 'Unknown'}
+        if not typed:
+            channel_types[channel_name] = 'Unknown'
+            continue
+        most = max(typed.values())
+        leaders = [t for t, n in typed.items() if n == most]
+        channel_types[channel_name] = last_typed[channel_name] if last_typed[channel_name] in leaders else leaders[0]
+        if len(typed) > 1:
+            conflicts[channel_name] = typed
+    return channel_types, conflicts
+
+def build_interaction_graph(rules_data):
+    """
+    the typed interaction graph (graph_model.InteractionGraph) of the rules
+    """
+    graph = InteractionGraph('SmartBuildingRules')
+
+    channel_types, conflicts = index_channel_types(rules_data)
+    for channel_name, counts in conflicts.items():
+        tags = ', '.join(f"{t} x{n}" for t, n in counts.items())
+        print(f"Warning: channel '{channel_name}' is tagged both ways ({tags}), labelled {channel_types[channel_name]}")
+
+    for channel_name in sorted(channel_types):
+        graph.add_node(channel_node_id(channel_name), CHANNEL_NODE_KINDS[channel_types[channel_name]],
+                       label=f"{channel_name} [{channel_types[channel_name]}]")
 
     for rule in rules_data:
         rule_id_safe = rule['rule_id'].replace(":", "_").replace(".", "_")
@@ -77,21 +99,13 @@ def generate_interaction_graph(rules_data, output_filename_prefix="smart_buildin
             action_value = str(action_value_raw) if action_value_raw is not None else ''
             action_label = f"Action_{rule_id_safe}:{action_device}.{action_command}({action_value})"
 
-            action_node_id = f'A_{rule_id_safe}_{act_idx}'
-            dot.node(action_node_id, 
-                     label=action_label, 
-                     shape='box', 
-                     style='filled,rounded', 
-                     fillcolor='#FFFACD',
-                     color='#BDB76B',
-                     fontcolor='#4A4A4A')
+            action_node_id = graph.add_node(f'A_{rule_id_safe}_{act_idx}', 'action', action_label,
+                                            rule=rule['rule_id'], device=action.get('device_name'))
             current_rule_action_node_ids.append(action_node_id)
 
             for key in ['implicit_channel', 'implicit_physical_channel', 'implicit_system_channel']:
                 if action.get(key):
-                    channel_name = action[key]
-                    channel_node_id = f'CH_{channel_name.replace(":", "_").replace(".", "_")}'
-                    dot.edge(action_node_id, channel_node_id, color='red', penwidth='1.5')
+                    graph.add_edge(action_node_id, channel_node_id(action[key]), 'emits')
 
         triggers = rule.get('triggers', [])
         if isinstance(triggers, dict):
@@ -116,91 +130,91 @@ def generate_interaction_graph(rules_data, output_filename_prefix="smart_buildin
                 cond_value_raw = cond.get('value', '')
                 cond_value = str(cond_value_raw) if cond_value_raw is not None else ''
                 condition_label = f"Trigger_({rule_id_safe}):{cond_device}.{cond_attribute}{cond_operator}{cond_value}"
-                condition_node_id = f'T_{rule_id_safe}_{cond_idx}'
-                dot.node(condition_node_id, 
-                         label=condition_label, 
-                         shape='box', 
-                         style='filled,rounded', 
-                         fillcolor='#E0FFFF',
-                         color='#4682B4',
-                         fontcolor='#3A3A3A')
+                condition_node_id = graph.add_node(f'T_{rule_id_safe}_{cond_idx}', 'trigger', condition_label,
+                                                   rule=rule['rule_id'], device=cond.get('device_name'))
                 condition_node_ids_for_this_block.append(condition_node_id)
 
                 for key in ['implicit_channel', 'implicit_physical_channel', 'implicit_system_channel']:
                     if cond.get(key):
-                        channel_name = cond[key]
-                        channel_node_id = f'CH_{channel_name.replace(":", "_").replace(".", "_")}'
-                        dot.edge(channel_node_id, condition_node_id, color='red', penwidth='1.5')
+                        graph.add_edge(channel_node_id(cond[key]), condition_node_id, 'senses')
 
             source_for_actions = None
             if len(condition_node_ids_for_this_block) > 1 and logical_operator and logical_operator.upper() in ["AND", "OR"]:
-                logic_node_id = f'LOGIC_{rule_id_safe}_{logical_operator}'
-                logical_label = f'{logical_operator.upper()}'
-                dot.node(logic_node_id, 
-                         label=logical_label,
-                         shape='diamond', 
-                         style='filled', 
-                         fillcolor='#D3D3D3',
-                         color='#808080',
-                         fontcolor='black')
+                logic_node_id = graph.add_node(f'LOGIC_{rule_id_safe}_{logical_operator}', logical_operator.upper(),
+                                               logical_operator.upper(), rule=rule['rule_id'])
                 for cond_node_id in condition_node_ids_for_this_block:
-                    dot.edge(cond_node_id, logic_node_id, color='#AAAAAA', penwidth='1.0')
+                    graph.add_edge(cond_node_id, logic_node_id, 'joins')
                 source_for_actions = logic_node_id
             elif len(condition_node_ids_for_this_block) == 1:
                 source_for_actions = condition_node_ids_for_this_block[0]
             elif len(condition_node_ids_for_this_block) > 1:
-                implicit_and_node_id = f'IMPLICIT_AND_{rule_id_safe}_{trigger_block_idx}'
-                dot.node(implicit_and_node_id, 
-                         label="AND", 
-                         shape='diamond', 
-                         style='filled', 
-                         fillcolor='#E8E8E8', 
-                         color='#B0B0B0',
-                         fontsize='10',
-                         fontcolor='black')
+                implicit_and_node_id = graph.add_node(f'IMPLICIT_AND_{rule_id_safe}_{trigger_block_idx}', 'AND', 'AND',
+                                                      rule=rule['rule_id'], implicit=True)
                 for cond_node_id in condition_node_ids_for_this_block:
-                    dot.edge(cond_node_id, implicit_and_node_id, color='#C0C0C0', penwidth='1.0')
+                    graph.add_edge(cond_node_id, implicit_and_node_id, 'joins')
                 source_for_actions = implicit_and_node_id
 
             if source_for_actions:
                 for action_node_id in current_rule_action_node_ids:
-                    dot.edge(source_for_actions, action_node_id, color='#999999', style='dashed', penwidth='1.0')
+                    graph.add_edge(source_for_actions, action_node_id, 'fires')
+    return graph
+
+def render_graphs(dot_paths, pic_dir, render_mode='wait', render_formats=('png',), render_workers=2):
+    """
+    lay out DOT files into images (RenderQueue): 'wait' renders in a process pool and returns when done,
+    'background' hands the jobs to a detached process and returns at once, 'off' renders nothing.
+    unchanged graphs whose images exist are skipped.
+    """
+    if render_mode == 'off' or not render_formats or not dot_paths:
+        return
+    if render_mode == 'background':
+        spawn_background(dot_paths, pic_dir, list(render_formats), max_workers=render_workers)
+        return
+    queue = RenderQueue(max_workers=render_workers)
+    for dot_path in dot_paths:
+        queue.submit(dot_path, pic_dir, render_formats)
+    if queue.wait():
+        print(f"You can use Graphviz tool to manually compile the DOT files (e.g.: dot -Tpng \"{dot_paths[0]}\" -o out.png)")
+
+def generate_interaction_graph(rules_data, output_filename_prefix="smart_building_rules_graph",
+                               render_mode='wait', render_formats=('png',), render_workers=2,
+                               partition_by=None, topology=None):
+    """
+    generate the interaction graph based on the rule data: the typed graph is saved as
+    DOT/<name>.graph.json (read by 4-GraphAnalyzer) and DOT/<name>.dot before any layout runs; images
+    (PIC/<name>.<format>) are rendered as render_graphs does. with partition_by ('floor', 'zone',
+    'channel'; topology = OntologyLoader tables for floor / zone), the per-partition graphs and their
+    summary go to DOT/partitions/ (GraphPartition.py) and their images to PIC/partitions/.
+    returns the graph.
+    """
+    graph = build_interaction_graph(rules_data)
+    dot = graph.to_graphviz()
 
     dot_dir = os.path.join(os.path.dirname(output_filename_prefix), "DOT")
     pic_dir = os.path.join(os.path.dirname(output_filename_prefix), "PIC")
     if not os.path.exists(dot_dir):
         os.makedirs(dot_dir)
-    if not os.path.exists(pic_dir):
-        os.makedirs(pic_dir)
 
     base_name = os.path.basename(output_filename_prefix)
     dot_source_file_dot = os.path.join(dot_dir, base_name + '.dot')
-    png_file = os.path.join(pic_dir, base_name + '.png')
+    graph_file = os.path.join(dot_dir, base_name + GRAPH_FILE_SUFFIX)
 
     try:
         dot.save(dot_source_file_dot)
         print(f"DOT source file saved: {dot_source_file_dot}")
+    except Exception as save_e:
+        print(f"Failed to save DOT source file: {save_e}")
+        return graph
+    # saved after the DOT file: it records the DOT file's hash, so the analyzer can tell they belong together
+    graph.save(graph_file, dot_source_file_dot)
+    print(f"Graph model saved: {graph_file} ({len(graph.nodes)} nodes, {len(graph.edges)} edges)")
 
-        rendered_path = dot.render(filename=base_name, directory=pic_dir, view=False, format='png', cleanup=True)
-        print(f"Interaction graph generated: {png_file}")
-
-    except graphviz.exceptions.ExecutableNotFound:
-        print("Error: Graphviz executable file not found. Please ensure Graphviz is installed and added to the system PATH.")
-        print("Attempting to save DOT source code...")
-        try:
-            dot.save(dot_source_file_dot)
-            print(f"DOT source file saved: {dot_source_file_dot}")
-            print(f"You can use Graphviz tool to manually compile this file (e.g.: dot -Tpng \"{dot_source_file_dot}\" -o \"{png_file}\")")
-        except Exception as save_e:
-            print(f"Failed to save DOT source file: {save_e}")
-    except Exception as e:
-        print(f"Error: {e}")
-        print("Attempting to save DOT source code...")
-        try:
-            dot.save(dot_source_file_dot)
-            print(f"DOT source file saved: {dot_source_file_dot}")
-        except Exception as save_e:
-            print(f"Failed to save DOT source file: {save_e}")
+    if partition_by:
+        _, partition_dots = save_partitions(graph, rules_data, partition_by, os.path.join(dot_dir, "partitions"),
+                                            base_name, topology)
+        render_graphs(partition_dots, os.path.join(pic_dir, "partitions"), render_mode, render_formats, render_workers)
+    render_graphs([dot_source_file_dot], pic_dir, render_mode, render_formats, render_workers)
+    return graph
 
 def load_rules_from_file(filepath):
     """
@@ -224,6 +238,14 @@ if __name__ == "__main__":
     file_name_base = "virtualBuilding_filter"
     input_dir = "./3-GraphGenerator/input/"
     output_dir = "./3-GraphGenerator/output/"
+    # 'background': images are laid out by a detached process pool after the stage exits (see
+    # PIC/render.log), 'wait': render before exiting, 'off': DOT and graph data only
+    render_mode = 'background'
+    render_formats = ['png']    # e.g. ['png', 'svg']
+    render_workers = 2
+    # None, 'floor', 'zone' or 'channel': also write one graph per partition plus a summary graph
+    partition_by = None
+    ontology_path = './1-SemanticParser/input/building_ontology/virtualBuilding.ttl'
 
     input_file = os.path.join(input_dir, file_name_base + ".json")
     output_filename_prefix = os.path.join(output_dir, file_name_base + "_graph")
@@ -244,6 +266,9 @@ if __name__ == "__main__":
 
     if rules_data:
         print(f"Loaded {len(rules_data)} rules from '{input_file}'. Generating interaction graph...")
-        generate_interaction_graph(rules_data, output_filename_prefix=output_filename_prefix)
+        topology = load_topology_tables(ontology_path) if partition_by in ('floor', 'zone') else None
+        generate_interaction_graph(rules_data, output_filename_prefix=output_filename_prefix,
+                                   render_mode=render_mode, render_formats=render_formats, render_workers=render_workers,
+                                   partition_by=partition_by, topology=topology)
     else:
         print("Failed to load rule data, cannot generate graph.")
\ No newline at end of file
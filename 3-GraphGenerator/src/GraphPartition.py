@@ -0,0 +1,209 @@
+'''
+Partition the interaction graph of a large building for layout and analysis.
+
+Every rule is assigned to one partition, with all its trigger, action and logic nodes:
+    floor     floor of the anchor device's location (rule context.device_locations, resolved with
+              the building ontology's location aliases and space -> floor table)
+    zone      HVAC zone (air handler) serving the anchor device's location; spaces no zone serves are 'unzoned'
+    channel   channel family of the rule: physical, system, mixed or none, from the channels its actions emit
+The anchor device is the one of the rule's first action (or its first trigger); a rule whose
+anchor has no known location is 'unlocated'. Rules are never split, so every partition keeps the
+trigger -> logic -> action paths of its rules.
+
+Each partition is a graph of its own: its rule nodes, a copy of every channel node they touch and
+the edges among them. What connects partitions is the summary graph: one node per partition and one
+edge per ordered pair of partitions, labelled with the channels that carry interactions across
+(action in A emits the channel a trigger in B senses, counted per action / trigger pair).
+Partitions and summary are saved as typed graphs plus DOT exports, listed in
+<name>_<mode>_partitions.json, which 4-GraphAnalyzer/src/extract_dot_nodes.py extracts in parallel.
+
+Usage:
+    topology = load_topology_tables('./1-SemanticParser/input/building_ontology/virtualBuilding.ttl')
+    manifest, dot_paths = save_partitions(graph, rules_data, 'floor', './3-GraphGenerator/output/DOT/partitions',
+                                          'virtualBuilding_filter_graph', topology)
+'''
+
+import json
+import os
+import re
+from collections import Counter, defaultdict
+
+from graph_model import InteractionGraph, CHANNEL_KINDS, GRAPH_FILE_SUFFIX
+
+PARTITION_MODES = ('floor', 'zone', 'channel')
+UNLOCATED = 'unlocated'
+UNZONED = 'unzoned'
+CHANNEL_FAMILIES = {'physical_channel': 'physical', 'system_channel': 'system', 'channel': 'unknown'}
+MANIFEST_VERSION = 1
+
+
+# ==============================================================================
+# 1. Node -> partition
+# ==============================================================================
+def rule_device_locations(rules_data):
+    """{rule_id: {device: location}} from every rule's context.device_locations (list or dict form)"""
+    locations = {}
+    for rule in rules_data:
+        entries = (rule.get('context') or {}).get('device_locations') or []
+        if isinstance(entries, dict):
+            entries = [{'device_name': d, 'location': l} for d, l in entries.items()]
+        locations[rule.get('rule_id')] = {e.get('device_name'): e.get('location')
+                                          for e in entries if isinstance(e, dict)}
+    return locations
+
+
+def space_key(location, topology, partition_by):
+    """floor / zone name of a context location, or None if the ontology does not know it"""
+    if not location:
+        return None
+    aliases = topology.get('location_aliases', {})
+    space = aliases.get(location) or aliases.get(location.replace(' ', '_')) or location
+    floor = topology['space_floors'].get(space)
+    if floor is None:
+        return None
+    if partition_by == 'floor':
+        return f'floor_{floor}'
+    for owner, served in topology['hvac_service_zones'].items():
+        if space in served:
+            return owner.split(':')[-1]
+    return UNZONED
+
+
+def rule_channel_families(graph):
+    """{rule_id: family} from the kinds of the channels each rule's actions emit"""
+    families = defaultdict(set)
+    for edge in graph.edges:
+        if edge.kind == 'emits':
+            families[graph.nodes[edge.source].rule].add(CHANNEL_FAMILIES[graph.nodes[edge.target].kind])
+    return {rule: (next(iter(kinds)) if len(kinds) == 1 else 'mixed') for rule, kinds in families.items()}
+
+
+def assign_partitions(graph, rules_data, partition_by, topology=None):
+    """{node id: partition} for every non-channel node"""
+    if partition_by not in PARTITION_MODES:
+        raise ValueError(f"partition_by must be one of {PARTITION_MODES}, got {partition_by!r}")
+    if partition_by in ('floor', 'zone') and topology is None:
+        raise ValueError(f"partitioning by {partition_by} needs the building topology (OntologyLoader tables)")
+
+    assignment = {}
+    if partition_by == 'channel':
+        families = rule_channel_families(graph)
+        for node_id, node in graph.nodes.items():
+            if node.kind not in CHANNEL_KINDS:
+                assignment[node_id] = families.get(node.rule, 'none')
+        return assignment
+
+    locations = rule_device_locations(rules_data)
+    # a rule is never split: all its nodes follow its first action, else its first trigger
+    anchors = {'action': {}, 'trigger': {}}
+    for node in graph.nodes.values():
+        if node.kind in anchors and node.rule not in anchors[node.kind]:
+            location = locations.get(node.rule, {}).get(node.device)
+            anchors[node.kind][node.rule] = space_key(location, topology, partition_by) or UNLOCATED
+    for node_id, node in graph.nodes.items():
+        if node.kind not in CHANNEL_KINDS:
+            assignment[node_id] = anchors['action'].get(node.rule) or anchors['trigger'].get(node.rule) or UNLOCATED
+    return assignment
+
+
+# ==============================================================================
+# 2. Partition graphs and summary
+# ==============================================================================
+def partition_graph(graph, assignment):
+    """
+    ({partition: InteractionGraph}, summary InteractionGraph). channel nodes are copied into every
+    partition with an edge to them; interactions across partitions become summary edges.
+    """
+    members = defaultdict(set)
+    for node_id, key in assignment.items():
+        members[key].add(node_id)
+    edge_pairs = defaultdict(set)
+    channel_copies = defaultdict(set)
+    crossing = defaultdict(Counter)
+    # channel -> partition -> number of emitting actions / sensing triggers
+    emitters = defaultdict(Counter)
+    sensors = defaultdict(Counter)
+    for edge in graph.edges:
+        source_key, target_key = assignment.get(edge.source), assignment.get(edge.target)
+        if source_key is None and target_key is None:
+            continue
+        if source_key is None or target_key is None:
+            # a channel edge: it belongs to the partition of its rule node
+            key = source_key if target_key is None else target_key
+            channel = edge.source if source_key is None else edge.target
+            edge_pairs[key].add((edge.source, edge.target))
+            channel_copies[key].add(channel)
+            (sensors if source_key is None else emitters)[channel][key] += 1
+        else:
+            # rule edges: a rule is never split, so both ends are in the same partition
+            edge_pairs[source_key].add((edge.source, edge.target))
+    for channel, by_partition in emitters.items():
+        channel_name = graph.nodes[channel].label.rsplit(' [', 1)[0]
+        for source_key, emit_count in by_partition.items():
+            for target_key, sense_count in sensors[channel].items():
+                if source_key != target_key:
+                    crossing[(source_key, target_key)][channel_name] += emit_count * sense_count
+
+    partitions = {}
+    for key in sorted(members):
+        sub = graph.subgraph(members[key] | channel_copies[key], edge_pairs[key])
+        sub.name = f'{graph.name}_{key}'
+        partitions[key] = sub
+
+    summary = InteractionGraph(f'{graph.name}_summary')
+    for key, sub in partitions.items():
+        rules = {node.rule for node in sub.nodes.values() if node.rule is not None}
+        summary.add_node(partition_node_id(key), 'partition',
+                         f'{key}\n{len(rules)} rules, {len(sub.nodes)} nodes, {len(sub.edges)} edges')
+    for (source_key, target_key), counts in sorted(crossing.items()):
+        label = '\n'.join(f'{what} x{n}' for what, n in counts.most_common())
+        summary.add_edge(partition_node_id(source_key), partition_node_id(target_key), 'crosses', label)
+    return partitions, summary
+
+
+def partition_node_id(key):
+    return f'P_{safe_name(key)}'
+
+
+def safe_name(key):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', str(key))
+
+
+# ==============================================================================
+# 3. Output
+# ==============================================================================
+def save_partitions(graph, rules_data, partition_by, output_dir, base_name, topology=None):
+    """
+    write every partition and the summary as <base>_<mode>_<partition>.graph.json / .dot, plus the
+    manifest <base>_<mode>_partitions.json. returns (manifest, DOT paths to render).
+    """
+    assignment = assign_partitions(graph, rules_data, partition_by, topology)
+    partitions, summary = partition_graph(graph, assignment)
+    os.makedirs(output_dir, exist_ok=True)
+
+    prefix = f'{base_name}_{partition_by}'
+    manifest = {'version': MANIFEST_VERSION, 'graph': base_name, 'partition_by': partition_by,
+                'partitions': {}, 'summary': None}
+    dot_paths = []
+    for key, sub in list(partitions.items()) + [(None, summary)]:
+        name = f'{prefix}_summary' if key is None else f'{prefix}_{safe_name(key)}'
+        graph_path = os.path.join(output_dir, name + GRAPH_FILE_SUFFIX)
+        dot_path = os.path.join(output_dir, name + '.dot')
+        sub.to_graphviz().save(dot_path)
+        sub.save(graph_path, dot_path)
+        dot_paths.append(dot_path)
+        # paths relative to the manifest, so the directory can be copied as a whole
+        entry = {'name': name, 'graph': os.path.basename(graph_path), 'dot': os.path.basename(dot_path),
+                 'nodes': len(sub.nodes), 'edges': len(sub.edges)}
+        if key is None:
+            manifest['summary'] = entry
+        else:
+            manifest['partitions'][key] = entry
+    manifest_path = os.path.join(output_dir, f'{prefix}_partitions.json')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"Partitioned by {partition_by} into {len(partitions)} graphs: "
+          + ', '.join(f"{key} ({len(sub.nodes)} nodes)" for key, sub in partitions.items()))
+    print(f"Cross-partition summary: {len(summary.edges)} edges; manifest saved: {manifest_path}")
+    return manifest, dot_paths
@@ -0,0 +1,178 @@
+'''
+Deferred Graphviz layout for stage 3.
+
+Laying out a dense interaction graph takes minutes, while the DOT file and the typed graph that
+4-GraphAnalyzer reads are written in well under a second. GraphGenerator therefore saves those
+first and hands image rendering to a RenderQueue:
+    - a bounded process pool renders every (DOT file, format) job in parallel (png, svg, ...)
+    - a job whose DOT content, format and engine hash to the value recorded in the manifest
+      (PIC/render_manifest.json) is skipped if its image still exists; finished images are merged
+      into the manifest on disk and it is replaced atomically, so concurrent runs keep each other's entries
+    - in background mode the queue runs in a detached process (this script), so the stage exits as
+      soon as its data is saved; progress goes to PIC/render.log
+
+Usage:
+    queue = RenderQueue(max_workers=2)
+    queue.submit('./3-GraphGenerator/output/DOT/virtualBuilding_filter_graph.dot', './3-GraphGenerator/output/PIC', ['png', 'svg'])
+    queue.wait()
+
+    spawn_background(dot_paths, pic_dir, ['png'], max_workers=2)       # detached, returns immediately
+    python 3-GraphGenerator/src/RenderQueue.py output/DOT/*.dot --output-dir output/PIC --formats png svg
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+MANIFEST_NAME = 'render_manifest.json'
+LOG_NAME = 'render.log'
+
+
+def content_hash(dot_path, fmt, engine):
+    h = hashlib.sha256()
+    h.update(f'{engine}\0{fmt}\0'.encode('utf-8'))
+    with open(dot_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def write_manifest(manifest_path, entries):
+    """
+    merge entries into the manifest on disk (another run may have written it meanwhile) and replace
+    it atomically; returns the merged manifest
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    manifest.update(entries)
+    tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def render_dot(dot_path, output_path, fmt, engine='dot'):
+    """
+    lay out one DOT file into one image (runs in a pool worker). returns (output path, seconds, error or None)
+    """
+    import graphviz
+    start = time.perf_counter()
+    try:
+        graphviz.render(engine, fmt, dot_path, outfile=output_path, quiet=True)
+        return output_path, time.perf_counter() - start, None
+    except graphviz.ExecutableNotFound:
+        return output_path, time.perf_counter() - start, 'Graphviz executable not found (is it installed and on PATH?)'
+    except Exception as e:
+        return output_path, time.perf_counter() - start, str(e)
+
+
+class RenderQueue:
+    def __init__(self, max_workers=2, engine='dot'):
+        self.max_workers = max_workers
+        self.engine = engine
+        self._pool = None
+        # output path -> (future, manifest path, content hash)
+        self.pending = {}
+        self.skipped = []
+        self._manifests = {}
+
+    def _manifest(self, pic_dir):
+        path = os.path.join(pic_dir, MANIFEST_NAME)
+        if path not in self._manifests:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._manifests[path] = json.load(f)
+            except (OSError, ValueError):
+                self._manifests[path] = {}
+        return path, self._manifests[path]
+
+    def submit(self, dot_path, pic_dir, formats):
+        """queue dot_path for every format; unchanged graphs with an existing image are skipped"""
+        os.makedirs(pic_dir, exist_ok=True)
+        manifest_path, manifest = self._manifest(pic_dir)
+        base_name = os.path.splitext(os.path.basename(dot_path))[0]
+        for fmt in formats:
+            output_path = os.path.join(pic_dir, f'{base_name}.{fmt}')
+            digest = content_hash(dot_path, fmt, self.engine)
+            if manifest.get(os.path.basename(output_path)) == digest and os.path.exists(output_path):
+                self.skipped.append(output_path)
+                continue
+            if output_path in self.pending:
+                continue
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            future = self._pool.submit(render_dot, dot_path, output_path, fmt, self.engine)
+            self.pending[output_path] = (future, manifest_path, digest)
+
+    def wait(self):
+        """block until every queued job is done; records finished images in the manifests. returns the errors"""
+        errors = {}
+        for output_path in self.skipped:
+            print(f"Unchanged, not re-rendered: {output_path}")
+        # manifest path -> {image name: hash} rendered by this queue
+        rendered = {}
+        for output_path, (future, manifest_path, digest) in self.pending.items():
+            try:
+                path, seconds, error = future.result()
+            except Exception as e:
+                # the worker died (BrokenProcessPool) or could not run render_dot at all
+                path, seconds, error = output_path, 0.0, f'{type(e).__name__}: {e}'
+            if error is None:
+                rendered.setdefault(manifest_path, {})[os.path.basename(path)] = digest
+                print(f"Rendered {path} in {seconds:.1f}s")
+            else:
+                errors[path] = error
+                print(f"Error rendering {path}: {error}")
+        for manifest_path, entries in rendered.items():
+            self._manifests[manifest_path] = write_manifest(manifest_path, entries)
+        self.pending = {}
+        self.skipped = []
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        return errors
+
+
+def spawn_background(dot_paths, pic_dir, formats, max_workers=2, engine='dot'):
+    """
+    render in a detached process that outlives the caller; output goes to pic_dir/render.log.
+    returns the Popen handle.
+    """
+    os.makedirs(pic_dir, exist_ok=True)
+    log_path = os.path.join(pic_dir, LOG_NAME)
+    command = [sys.executable, os.path.abspath(__file__), *dot_paths, '--output-dir', pic_dir,
+               '--formats', *formats, '--workers', str(max_workers), '--engine', engine]
+    with open(log_path, 'a', encoding='utf-8') as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                   start_new_session=True)
+    print(f"Rendering {', '.join(formats)} in the background (pid {process.pid}), log: {log_path}")
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render DOT files with a bounded process pool')
+    parser.add_argument('dot_files', nargs='+')
+    parser.add_argument('--output-dir', required=True)
+    parser.add_argument('--formats', nargs='+', default=['png'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--engine', default='dot')
+    args = parser.parse_args()
+
+    queue = RenderQueue(args.workers, args.engine)
+    for dot_path in args.dot_files:
+        queue.submit(dot_path, args.output_dir, args.formats)
+    errors = queue.wait()
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
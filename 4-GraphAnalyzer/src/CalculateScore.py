@@ -27,16 +27,23 @@ def caculate_score(graph, edge):
     """ 
 import csv
 import os
-import json
 import time
 import sys
 
 sys.path.append(os.path.dirname(__file__))
-from SearchPath import DirectedGraphPathFinder
+from SearchPath import DirectedGraphPathFinder, read_graph_info
+from GraphCSR import GraphCSR, CSR_SUFFIX, load_graph_csr
 
 def load_graph_info(json_path):
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    """
+    (node_dict, edge_dict) of a graphinfo JSON / .gcsr path or a graph in memory; for a .gcsr graph
+    both are views that decode single nodes / edges on lookup
+    """
+    if isinstance(json_path, str) and json_path.endswith(CSR_SUFFIX):
+        json_path = load_graph_csr(json_path)
+    if isinstance(json_path, GraphCSR):
+        return json_path.node_dict(), json_path.edge_dict()
+    data, _ = read_graph_info(json_path)
     node_dict = {n['ID']: n for n in data['nodes']}
     edge_dict = {(e['source'], e['target']): e for e in data['edges']}
     return node_dict, edge_dict
@@ -243,6 +250,8 @@ def main():
     # Configuration
     json_base = 'virtualBuilding_filter_graph_graphinfo'
     json_path = os.path.join('./4-GraphAnalyzer/output/node/', f'{json_base}.json')
+    # the memory-mapped binary graph written next to the JSON, if there is one
+    csr_path = os.path.join('./4-GraphAnalyzer/output/node/', f'{json_base}{CSR_SUFFIX}')
     target_id = 'A_Rule_58_0'
     # A_Rule_58_0  Fire alarm opens the main door
     # A_Rule_129_0 card reaeder success opens the main door
@@ -250,11 +259,12 @@ def main():
     output_dir = './4-GraphAnalyzer/output/score'
     os.makedirs(output_dir, exist_ok=True)
 
-    # 1. Load graph info
-    node_dict, edge_dict = load_graph_info(json_path)
+    # 1. Load graph info (read once, shared with the path finder)
+    graph_info = load_graph_csr(csr_path) if os.path.exists(csr_path) else read_graph_info(json_path)[0]
+    node_dict, edge_dict = load_graph_info(graph_info)
 
     # 2. Get all paths (multi-dimensional list, supports AND structure)
-    finder = DirectedGraphPathFinder(json_path)
+    finder = DirectedGraphPathFinder(graph_info, json_base)
     all_paths = finder.get_paths_as_lists(target_id)
 
     # 3. Analyze each path
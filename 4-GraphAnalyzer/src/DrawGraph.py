@@ -1,7 +1,17 @@
 # Find all paths that can reach the target node, and draw graphs
-import pygraphviz as pgv
+# Uses the typed graph (<name>.graph.json next to the DOT file, common/graph_model.py) if it was saved
+# with this DOT file, otherwise parses the DOT file with pygraphviz.
 import networkx as nx
 import os 
+import sys
+
+try:
+    import pygraphviz as pgv
+except ImportError:
+    pgv = None
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+from graph_model import load_graph_for_dot
 
 def find_all_paths_to_target(dot_file_path, target_node_id):
     """
@@ -18,6 +28,9 @@ def find_all_paths_to_target(dot_file_path, target_node_id):
     """
     all_found_paths = []
     pgv_graph = None # Initialize as None
+    if pgv is None:
+        print("Error: pygraphviz is not installed; it is needed to read DOT files without a typed graph file.")
+        return all_found_paths, None
     try:
         pgv_graph = pgv.AGraph(dot_file_path, strict=False, directed=True)
     except Exception as e:
@@ -25,10 +38,22 @@ def find_all_paths_to_target(dot_file_path, target_node_id):
         return all_found_paths, None # Graph load failed
 
     nx_graph = nx.DiGraph(pgv_graph)
+    return find_all_simple_paths(nx_graph, target_node_id), pgv_graph
 
+def find_all_paths_in_model(graph, target_node_id):
+    """
+    Same as find_all_paths_to_target, on a typed graph (graph_model.InteractionGraph).
+    """
+    nx_graph = nx.DiGraph()
+    nx_graph.add_nodes_from(graph.nodes)
+    nx_graph.add_edges_from((edge.source, edge.target) for edge in graph.edges)
+    return find_all_simple_paths(nx_graph, target_node_id)
+
+def find_all_simple_paths(nx_graph, target_node_id):
+    all_found_paths = []
     if not nx_graph.has_node(target_node_id):
         print(f"Error: Target node '{target_node_id}' not found in the graph.")
-        return all_found_paths, pgv_graph
+        return all_found_paths
 
     for source_node_id in nx_graph.nodes():
         if source_node_id == target_node_id:
@@ -45,7 +70,51 @@ def find_all_paths_to_target(dot_file_path, target_node_id):
         except Exception as e:
             print(f"Unexpected error during path search from '{source_node_id}': {e}")
             continue
-    return all_found_paths, pgv_graph
+    return all_found_paths
+
+def path_elements(paths):
+    """(node ids, (source, target) edges) on the paths"""
+    path_nodes_set = set()
+    path_edges_set = set()
+    for path in paths:
+        for node_id in path:
+            path_nodes_set.add(node_id)
+        for i in range(len(path) - 1):
+            path_edges_set.add((path[i], path[i+1]))
+    return path_nodes_set, path_edges_set
+
+def save_graphviz(dot, output_dot_path, output_image_path, title):
+    try:
+        dot.save(output_dot_path)
+        print(f"\n{title}: Saved DOT file to: {output_dot_path}")
+        image = dot.pipe(format='png')
+        with open(output_image_path, 'wb') as f:
+            f.write(image)
+        print(f"{title}: Saved image file to: {output_image_path}")
+    except Exception as e:
+        print(f"{title}: Error saving files: {e}")
+        print("Please ensure Graphviz is installed and the 'dot' command is in your system PATH.")
+
+def save_model_subgraph(graph, paths, output_dot_path, output_image_path):
+    """
+    Type 1 from a typed graph: only the path elements, in their original styles.
+    """
+    if not paths:
+        print("Type 1 (Subgraph): No paths found; no files generated.")
+        return
+    path_nodes_set, path_edges_set = path_elements(paths)
+    dot = graph.subgraph(path_nodes_set, path_edges_set).to_graphviz()
+    save_graphviz(dot, output_dot_path, output_image_path, "Type 1 (Subgraph)")
+
+def save_model_highlight(graph, paths, output_dot_path, output_image_path):
+    """
+    Type 2 from a typed graph: the full graph with every element off the paths dimmed.
+    """
+    if not paths:
+        print("Type 2 (Full Graph Highlight): No paths found; no files generated.")
+        return
+    dot = graph.to_graphviz(highlight=path_elements(paths))
+    save_graphviz(dot, output_dot_path, output_image_path, "Type 2 (Full Graph Highlight)")
 
 def create_and_save_subgraph_with_original_styles(original_pgv_graph, paths, output_dot_path, output_image_path):
     """
@@ -61,13 +130,7 @@ def create_and_save_subgraph_with_original_styles(original_pgv_graph, paths, out
         print("Type 1 (Subgraph): No paths found; no files generated.")
         return
 
-    path_nodes_set = set()
-    path_edges_set = set()
-    for path in paths:
-        for node_id in path:
-            path_nodes_set.add(node_id)
-        for i in range(len(path) - 1):
-            path_edges_set.add((path[i], path[i+1]))
+    path_nodes_set, path_edges_set = path_elements(paths)
 
     # Convert Attribute object to a standard dict to allow modification
     graph_attrs = dict(original_pgv_graph.graph_attr)
@@ -142,13 +205,7 @@ def create_and_save_full_highlighted_graph(original_pgv_graph_ref, paths, target
     dimmed_attrs = {'color': '#d3d3d3', 'fontcolor': '#d3d3d3', 'style': 'filled', 'fillcolor': '#f5f5f5'} # Light gray border/font, whitesmoke fill
 
     # Collect all nodes and edges on the paths
-    path_nodes_set = set()
-    path_edges_set = set()
-    for path in paths:
-        for node_id in path:
-            path_nodes_set.add(node_id)
-        for i in range(len(path) - 1):
-            path_edges_set.add((path[i], path[i+1]))
+    path_nodes_set, path_edges_set = path_elements(paths)
 
     # 1. Iterate over all nodes
     for node in g_highlighted.nodes():
@@ -204,6 +261,21 @@ if __name__ == '__main__':
     os.makedirs(output_dir_highlight, exist_ok=True)
     os.makedirs(output_dir_subgraph, exist_ok=True)
 
+    graph = load_graph_for_dot(input_graph_file)
+    if graph is not None:
+        print(f"Finding all paths to target node '{target_node}' (in the typed graph of '{input_graph_file}')\n")
+        paths_to_target = find_all_paths_in_model(graph, target_node)
+        if paths_to_target:
+            print(f"Found {len(paths_to_target)} paths to '{target_node}':")
+            for i, path in enumerate(paths_to_target):
+                print(f"  Path {i+1}: {' -> '.join(path)}")
+            save_model_subgraph(graph, paths_to_target, subgraph_dot_file, subgraph_image_file)
+            save_model_highlight(graph, paths_to_target, full_highlight_dot_file, full_highlight_image_file)
+        else:
+            print(f"No paths to '{target_node}' were found.")
+        print("\n" + "="*50 + "\nScript finished.\n" + "="*50)
+        exit()
+
     # Check input file existence
     if not os.path.exists(input_graph_file):
         print(f"Error: Input file '{input_graph_file}' not found. Please ensure it exists at the specified path.")
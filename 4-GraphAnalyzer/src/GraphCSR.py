@@ -0,0 +1,336 @@
+'''
+Compact binary graphinfo (.gcsr) for repeated path queries on large interaction graphs.
+
+The graphinfo JSON written by extract_dot_nodes repeats every key for every node and edge, and
+each reader (SearchPath, CalculateScore) parses all of it and builds its own dicts. The .gcsr file
+holds the same graph as flat arrays that are memory-mapped, not parsed: opening a graph costs a
+header read, lookups touch only the pages they need, and processes that open the same file share
+its pages through the OS page cache.
+
+    section          type     length   content
+    ---------------------------------------------------------------------------------
+    id_offsets       int64    n + 1    node ID i is id_blob[id_offsets[i]:id_offsets[i+1]] (UTF-8)
+    id_blob          bytes
+    id_order         int32    n        node indices sorted by ID bytes (binary search in index_of)
+    label_offsets    int64    n + 1    labels, rules and devices the same way ('' = none)
+    label_blob       bytes
+    rule_offsets     int64    n + 1
+    rule_blob        bytes
+    device_offsets   int64    n + 1
+    device_blob      bytes
+    node_type_index  uint8    n        index into header node_types
+    centrality       float64  n
+    out_offsets      int64    n + 1    CSR: successors of i are out_targets[out_offsets[i]:out_offsets[i+1]]
+    out_targets      int32    m
+    out_edges        int32    m        edge index of each successor entry
+    in_offsets       int64    n + 1    same for predecessors
+    in_sources       int32    m
+    in_edges         int32    m
+    edge_source      int32    m        edges in graphinfo order
+    edge_target      int32    m
+    edge_type_index  uint8    m        index into header edge_types
+    edge_cost        int32    m        -1 = none
+    edge_stealth     int32    m        -1 = none
+
+Adjacency lists keep the graphinfo edge order, so paths come out in the same order as from JSON.
+
+File layout (.gcsr):
+    b'GCSR1\n' | uint32 header length | JSON header (counts, type tables, section table) | padding to 8 |
+    sections, little-endian, each starting on an 8-byte boundary
+
+Usage:
+    write_graph_csr(graph_info, 'virtualBuilding_filter_graph_graphinfo.gcsr')
+    graph = load_graph_csr('virtualBuilding_filter_graph_graphinfo.gcsr')
+    i = graph.index_of('A_Rule_58_0')
+    [graph.node_id(j) for j in graph.predecessors(i)]
+'''
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+MAGIC = b'GCSR1\n'
+CSR_SUFFIX = '.gcsr'
+ALIGN = 8
+
+STRING_COLUMNS = [('id', 'ID'), ('label', 'Label'), ('rule', 'Rule'), ('device', 'Device')]
+
+
+def _pad(n):
+    return (-n) % ALIGN
+
+
+def _string_column(values):
+    offsets = array('q', [0])
+    blob = bytearray()
+    for value in values:
+        blob += (value or '').encode('utf-8')
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+def _none_to(value, default):
+    return default if value is None else value
+
+
+def write_graph_csr(graph_info, path):
+    """
+    write a graphinfo dict ({"nodes": [...], "edges": [...]}, as extract_dot_nodes builds it) as .gcsr
+    """
+    nodes = list(graph_info['nodes'])
+    edges = graph_info['edges']
+    index = {node['ID']: i for i, node in enumerate(nodes)}
+    # edges to IDs without a node entry still need an index: append them as untyped nodes
+    for edge in edges:
+        for node_id in (edge['source'], edge['target']):
+            if node_id not in index:
+                index[node_id] = len(index)
+                nodes.append({'ID': node_id, 'Label': node_id, 'Type': None})
+    n, m = len(nodes), len(edges)
+
+    node_types = sorted({node.get('Type') or '' for node in nodes})
+    edge_types = sorted({edge.get('type') or '' for edge in edges})
+    sections = {}
+    for column, key in STRING_COLUMNS:
+        sections[f'{column}_offsets'], sections[f'{column}_blob'] = _string_column(node.get(key) for node in nodes)
+    ids = [node['ID'].encode('utf-8') for node in nodes]
+    sections['id_order'] = array('i', sorted(range(n), key=ids.__getitem__))
+    sections['node_type_index'] = array('B', (node_types.index(node.get('Type') or '') for node in nodes))
+    sections['centrality'] = array('d', (float(_none_to(node.get('centrality'), 0.0)) for node in nodes))
+
+    sources = array('i', (index[edge['source']] for edge in edges))
+    targets = array('i', (index[edge['target']] for edge in edges))
+    for direction, keys, others in (('out', sources, targets), ('in', targets, sources)):
+        # stable counting sort on the key node keeps the edge order within each list
+        offsets = array('q', [0] * (n + 1))
+        for k in keys:
+            offsets[k + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        fill = array('q', offsets)
+        neighbours = array('i', [0] * m)
+        edge_ids = array('i', [0] * m)
+        for e, k in enumerate(keys):
+            neighbours[fill[k]] = others[e]
+            edge_ids[fill[k]] = e
+            fill[k] += 1
+        sections[f'{direction}_offsets'] = offsets
+        sections[f'{direction}_targets' if direction == 'out' else f'{direction}_sources'] = neighbours
+        sections[f'{direction}_edges'] = edge_ids
+    sections['edge_source'] = sources
+    sections['edge_target'] = targets
+    sections['edge_type_index'] = array('B', (edge_types.index(edge.get('type') or '') for edge in edges))
+    sections['edge_cost'] = array('i', (int(_none_to(edge.get('cost'), -1)) for edge in edges))
+    sections['edge_stealth'] = array('i', (int(_none_to(edge.get('stealth'), -1)) for edge in edges))
+
+    table = []
+    position = 0
+    for name, data in sections.items():
+        typecode = data.typecode if isinstance(data, array) else 'B'
+        length = len(data)
+        size = length * (data.itemsize if isinstance(data, array) else 1)
+        table.append([name, typecode, length, position])
+        position += size + _pad(size)
+    header = json.dumps({'nodes': n, 'edges': m, 'node_types': node_types, 'edge_types': edge_types,
+                         'sections': table}, ensure_ascii=False).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        f.write(b'\0' * _pad(len(MAGIC) + 4 + len(header)))
+        for data in sections.values():
+            if isinstance(data, array):
+                if sys.byteorder != 'little' and data.itemsize > 1:
+                    data = array(data.typecode, data)
+                    data.byteswap()
+                raw = data.tobytes()
+            else:
+                raw = data
+            f.write(raw)
+            f.write(b'\0' * _pad(len(raw)))
+
+
+class GraphCSR:
+    """
+    read-only view of a .gcsr file. Nodes and edges are addressed by index; index_of() maps a node
+    ID to its index. node_dict() / edge_dict() give the {ID: node} and {(source, target): edge}
+    mappings CalculateScore works on, decoded per lookup.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._map)
+        self._buffer = buffer
+        self._views = []
+        if bytes(buffer[:len(MAGIC)]) != MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' is not a graph CSR file.")
+        (header_len,) = struct.unpack_from('<I', buffer, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(buffer[start:start + header_len]).decode('utf-8'))
+        base = start + header_len + _pad(start + header_len)
+        self.n_nodes = header['nodes']
+        self.n_edges = header['edges']
+        self.node_types = header['node_types']
+        self.edge_types = header['edge_types']
+        for name, typecode, length, offset in header['sections']:
+            itemsize = array(typecode).itemsize
+            raw = buffer[base + offset:base + offset + length * itemsize]
+            if typecode == 'B':
+                data = raw
+            elif sys.byteorder == 'little':
+                data = raw.cast(typecode)
+            else:
+                data = array(typecode, bytes(raw))
+                data.byteswap()
+            setattr(self, name, data)
+            self._views.append(name)
+
+    def close(self):
+        """
+        release the mapping. if slices handed out (successors(), predecessors()) are still alive,
+        the mapping stays open until they are garbage collected.
+        """
+        try:
+            for name in self._views:
+                view = getattr(self, name)
+                if isinstance(view, memoryview):
+                    view.release()
+            self._views = []
+            if self._buffer is not None:
+                self._buffer.release()
+                self._buffer = None
+            self._map.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.n_nodes
+
+    # ----- nodes
+    def _string(self, column, i):
+        offsets = getattr(self, f'{column}_offsets')
+        return bytes(getattr(self, f'{column}_blob')[offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def node_id(self, i):
+        return self._string('id', i)
+
+    def index_of(self, node_id):
+        """index of a node ID, or -1 (binary search over id_order, no table built)"""
+        key = node_id.encode('utf-8')
+        offsets, blob, order = self.id_offsets, self.id_blob, self.id_order
+        lo, hi = 0, self.n_nodes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = order[mid]
+            if blob[offsets[i]:offsets[i + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_nodes:
+            i = order[lo]
+            if blob[offsets[i]:offsets[i + 1]].tobytes() == key:
+                return i
+        return -1
+
+    def node_type(self, i):
+        return self.node_types[self.node_type_index[i]] or None
+
+    def successors(self, i):
+        return self.out_targets[self.out_offsets[i]:self.out_offsets[i + 1]]
+
+    def predecessors(self, i):
+        return self.in_sources[self.in_offsets[i]:self.in_offsets[i + 1]]
+
+    def node(self, i):
+        """node i as a graphinfo node dict"""
+        node = {'ID': self.node_id(i), 'Label': self._string('label', i), 'Type': self.node_type(i),
+                'Target': [self.node_id(j) for j in self.successors(i)],
+                'Source': [self.node_id(j) for j in self.predecessors(i)],
+                'centrality': self.centrality[i]}
+        for column, key in STRING_COLUMNS[2:]:
+            node[key] = self._string(column, i) or None
+        return node
+
+    # ----- edges
+    def edge(self, e):
+        """edge e as a graphinfo edge dict"""
+        cost, stealth = self.edge_cost[e], self.edge_stealth[e]
+        return {'source': self.node_id(self.edge_source[e]), 'target': self.node_id(self.edge_target[e]),
+                'type': self.edge_types[self.edge_type_index[e]] or None,
+                'cost': None if cost < 0 else cost, 'stealth': None if stealth < 0 else stealth}
+
+    def edge_index(self, source, target):
+        """index of the last edge source -> target (node indices), or -1"""
+        start, end = self.out_offsets[source], self.out_offsets[source + 1]
+        for k in range(end - 1, start - 1, -1):
+            if self.out_targets[k] == target:
+                return self.out_edges[k]
+        return -1
+
+    def to_graphinfo(self):
+        """the whole graph as a graphinfo dict (decodes everything: for small graphs and JSON export)"""
+        return {'nodes': [self.node(i) for i in range(self.n_nodes)],
+                'edges': [self.edge(e) for e in range(self.n_edges)]}
+
+    def node_dict(self):
+        return CSRNodes(self)
+
+    def edge_dict(self):
+        return CSREdges(self)
+
+
+class CSRNodes(Mapping):
+    """{node ID: node dict}, decoded on lookup"""
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, node_id):
+        i = self.graph.index_of(node_id) if isinstance(node_id, str) else -1
+        if i < 0:
+            raise KeyError(node_id)
+        return self.graph.node(i)
+
+    def __iter__(self):
+        return (self.graph.node_id(i) for i in range(self.graph.n_nodes))
+
+    def __len__(self):
+        return self.graph.n_nodes
+
+
+class CSREdges(Mapping):
+    """{(source ID, target ID): edge dict}, decoded on lookup"""
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, key):
+        source, target = (self.graph.index_of(node_id) if isinstance(node_id, str) else -1 for node_id in key)
+        e = self.graph.edge_index(source, target) if source >= 0 and target >= 0 else -1
+        if e < 0:
+            raise KeyError(key)
+        return self.graph.edge(e)
+
+    def __iter__(self):
+        return ((self.graph.node_id(self.graph.edge_source[e]), self.graph.node_id(self.graph.edge_target[e]))
+                for e in range(self.graph.n_edges))
+
+    def __len__(self):
+        return self.graph.n_edges
+
+
+def load_graph_csr(path):
+    """
+    memory-map a .gcsr file written by write_graph_csr
+    """
+    return GraphCSR(path)
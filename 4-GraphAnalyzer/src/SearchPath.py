@@ -1,7 +1,29 @@
 import json
 import os
+import sys
 from collections import defaultdict
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from GraphCSR import GraphCSR, CSR_SUFFIX, load_graph_csr
+
+def read_graph_info(source, name='graph'):
+    """
+    (graphinfo dict, name) from a graphinfo JSON path, a graphinfo dict or an object with
+    to_graphinfo() (graph_model.InteractionGraph), so the analyzer can work on the graph in memory
+    """
+    if isinstance(source, GraphCSR):
+        return source.to_graphinfo(), os.path.splitext(os.path.basename(source.path))[0]
+    if hasattr(source, 'to_graphinfo'):
+        return source.to_graphinfo(), name
+    if isinstance(source, dict):
+        return source, name
+    print(f"Loading graph data from {source}...")
+    if source.endswith(CSR_SUFFIX):
+        return read_graph_info(load_graph_csr(source))
+    with open(source, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data, os.path.splitext(os.path.basename(source))[0]
+
 class DirectedGraphPathFinder:
     """
     A class for finding all paths in a directed graph that reach a specific target node.
@@ -26,6 +48,9 @@ class DirectedGraphPathFinder:
             - stealth: Stealth score (numeric)
         - Access: self.edges is a list of edge dicts
 
+    A .gcsr graph (GraphCSR.py) is searched on its memory-mapped arrays; self.nodes / self.nodes_info /
+    self.edges are then decoded from it only when first accessed.
+
     You can access nodes via self.nodes / self.nodes_info and edges via self.edges.
     Examples:
         - Get all nodes: for node in self.nodes: ...
@@ -33,25 +58,23 @@ class DirectedGraphPathFinder:
         - Get details for a node: self.nodes_info['CH_door_contact_state']
     """
 
-    def __init__(self, graph_info_path):
+    def __init__(self, graph_info_path, name='graph'):
         """
         Initialize the path finder.
         Load graph data and split into nodes and edges for storage.
+        graph_info_path: graphinfo JSON or .gcsr path, or the graph itself (a graphinfo dict, a
+        GraphCSR or a graph_model.InteractionGraph); name is then used in output file names.
         """
-        print(f"Loading graph data from {graph_info_path}...")
         try:
-            self.json_basename = os.path.splitext(os.path.basename(graph_info_path))[0]
-            with open(graph_info_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            # Store full graph data
-            self.graph_data = data
-            # Split into nodes and edges
-            self.nodes = data['nodes']  # Node list
-            self.edges = data['edges']  # Edge list
-            # Mapping from node ID to node info
-            self.nodes_info = {node['ID']: node for node in self.nodes}
-            # Predecessor map
-            self.predecessors_map = self._build_predecessor_map(self.edges)
+            self.csr = None
+            self._graph_data = None
+            if isinstance(graph_info_path, GraphCSR) or str(graph_info_path).endswith(CSR_SUFFIX):
+                self.csr = graph_info_path if isinstance(graph_info_path, GraphCSR) else load_graph_csr(graph_info_path)
+                self.json_basename = os.path.splitext(os.path.basename(self.csr.path))[0]
+                print(f"Graph mapped from {self.csr.path} ({self.csr.n_nodes} nodes, {self.csr.n_edges} edges).")
+                return
+            data, self.json_basename = read_graph_info(graph_info_path, name)
+            self._set_graph_data(data)
             print("Graph data loaded and preprocessed.")
         except FileNotFoundError:
             print(f"Error: File not found - {graph_info_path}")
@@ -60,6 +83,57 @@ class DirectedGraphPathFinder:
             print(f"Error: Invalid or incomplete JSON format - {e}")
             raise
 
+    def _set_graph_data(self, data):
+        # Store full graph data
+        self._graph_data = data
+        # Mapping from node ID to node info
+        self._nodes_info = {node['ID']: node for node in data['nodes']}
+        # Predecessor map
+        self._predecessors_map = self._build_predecessor_map(data['edges'])
+
+    def _decoded(self):
+        """graph data of a .gcsr graph, decoded on first use"""
+        if self._graph_data is None:
+            self._set_graph_data(self.csr.to_graphinfo())
+        return self
+
+    @property
+    def graph_data(self):
+        return self._decoded()._graph_data
+
+    @property
+    def nodes(self):
+        return self.graph_data['nodes']  # Node list
+
+    @property
+    def edges(self):
+        return self.graph_data['edges']  # Edge list
+
+    @property
+    def nodes_info(self):
+        return self._decoded()._nodes_info
+
+    @property
+    def predecessors_map(self):
+        return self._decoded()._predecessors_map
+
+    def _has_node(self, node_id):
+        if self.csr is not None:
+            return self.csr.index_of(node_id) >= 0
+        return node_id in self.nodes_info
+
+    def _node_type(self, node_id):
+        if self.csr is not None:
+            i = self.csr.index_of(node_id)
+            return self.csr.node_type(i) if i >= 0 else None
+        return self.nodes_info.get(node_id, {}).get('Type')
+
+    def _predecessors(self, node_id):
+        if self.csr is not None:
+            i = self.csr.index_of(node_id)
+            return [self.csr.node_id(j) for j in self.csr.predecessors(i)] if i >= 0 else []
+        return self.predecessors_map.get(node_id, [])
+
     def _build_predecessor_map(self, edges):
         """Build a predecessor map from the list of edges."""
         pred_map = defaultdict(list)
@@ -76,19 +150,19 @@ class DirectedGraphPathFinder:
             return
 
         new_path_from_target = [current_node_id] + path_from_target
-        predecessors = self.predecessors_map.get(current_node_id, [])
+        predecessors = self._predecessors(current_node_id)
 
         if not predecessors:
             all_backward_paths.append(new_path_from_target)
             return
 
         is_and_case = (len(predecessors) == 1 and 
-                       self.nodes_info.get(predecessors[0], {}).get('Type') == 'AND')
+                       self._node_type(predecessors[0]) == 'AND')
 
         if is_and_case:
             and_node_id = predecessors[0]
             path_with_and_node = [and_node_id] + new_path_from_target
-            and_inputs = self.predecessors_map.get(and_node_id, [])
+            and_inputs = self._predecessors(and_node_id)
             
             if not and_inputs:
                 all_backward_paths.append(path_with_and_node)
@@ -101,7 +175,7 @@ class DirectedGraphPathFinder:
 
     def find_all_paths_to_target(self, target_node_id):
         """Find all paths that can reach the specified target node."""
-        if target_node_id not in self.nodes_info:
+        if not self._has_node(target_node_id):
             print(f"Error: Target node '{target_node_id}' does not exist in the graph.")
             return []
 
@@ -150,7 +224,7 @@ class DirectedGraphPathFinder:
         if not node['children']:
             return [node]
 
-        is_and_node = self.nodes_info.get(node['id'], {}).get('Type') == 'AND'
+        is_and_node = self._node_type(node['id']) == 'AND'
 
         if is_and_node:
             reconstructed_children = []
@@ -266,7 +340,7 @@ class DirectedGraphPathFinder:
             return [node_id]
 
         child_lists = [self._convert_tree_to_list(child) for child in node['children']]
-        is_and_node = self.nodes_info.get(node_id, {}).get('Type') == 'AND'
+        is_and_node = self._node_type(node_id) == 'AND'
 
         if is_and_node:
             return [node_id, child_lists]
@@ -286,6 +360,9 @@ class DirectedGraphPathFinder:
         
         finder.nodes_info['CH_door_contact_state']['ID']
         """
+        if self.csr is not None:
+            i = self.csr.index_of(node_id)
+            return self.csr.node(i) if i >= 0 else {}
         return self.nodes_info.get(node_id, {})
 
     def get_edge_info(self, source_id, target_id):
@@ -297,6 +374,8 @@ class DirectedGraphPathFinder:
         Returns:
             dict: Edge attribute dictionary; returns empty dict if not found
         """
+        if self.csr is not None:
+            return self.csr.edge_dict().get((source_id, target_id), {})
         for edge in self.edges:
             if edge.get('source') == source_id and edge.get('target') == target_id:
                 return edge
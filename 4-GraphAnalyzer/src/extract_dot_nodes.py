@@ -20,10 +20,16 @@ Edge attributes include:
 
 Main functions:
     - parse_dot(dot_path): Parse the DOT file and return a dict with 'nodes' and 'edges' lists.
-    - main(): Main entry point. Parse the DOT file, compute node/edge info, and write results to JSON.
+    - load_graph_info(dot_path): The same dict from the typed graph GraphGenerator saves next to the DOT file
+      (<name>.graph.json, common/graph_model.py) if it was saved with this DOT file, else from parse_dot. The typed graph also
+      gives each node its Rule and Device and keeps labels parse_dot cannot read (quotes in action values).
+    - main(): Main entry point. Load the graph, compute node/edge info, and write results to JSON, plus the
+      same graph as <name>_graphinfo.gcsr (GraphCSR.py), which SearchPath / CalculateScore memory-map.
 
 Usage:
     Run the script to process the specified DOT file and generate a JSON output containing node and edge information.
+    Copy <name>.graph.json from 3-GraphGenerator/output/DOT/ along with its DOT file to skip the DOT parsing.
+    Set partition_manifest to extract the partition graphs of GraphGenerator (partition_by) in parallel.
 
 Dependencies:
     - re
@@ -37,9 +43,20 @@ import networkx as nx
 import os
 import time
 import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'common'))
+from graph_model import load_graph, load_graph_for_dot
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from GraphCSR import write_graph_csr, CSR_SUFFIX
 
 dot_path = "./4-GraphAnalyzer/input/virtualBuilding_filter_graph.dot"
 ouput_path = "./4-GraphAnalyzer/output/node"
+# manifest of a partitioned graph (3-GraphGenerator/output/DOT/partitions/<name>_<mode>_partitions.json);
+# when set, every partition is extracted in parallel into output/node/partitions/ instead of dot_path
+partition_manifest = None
+partition_workers = 4
 
 def parse_dot(dot_path):
     with open(dot_path, "r", encoding="utf-8") as f:
@@ -168,17 +185,65 @@ def parse_dot(dot_path):
     }
 
 
-def main():
+def load_graph_info(dot_path):
+    graph = load_graph_for_dot(dot_path)
+    if graph is not None:
+        return graph.to_graphinfo()
+    print(f"Parsing DOT file: {dot_path}")
+    return parse_dot(dot_path)
 
-    graph_info = parse_dot(dot_path)
-    # Auto-generate output filename
-    basename = os.path.splitext(os.path.basename(dot_path))[0]
-    outname = f"{basename}_graphinfo.json"
-    outpath = os.path.join(ouput_path, outname)
+
+def write_graph_info(graph_info, basename, output_dir):
+    """write <basename>_graphinfo.json and .gcsr; returns the JSON path"""
+    os.makedirs(output_dir, exist_ok=True)
+    outpath = os.path.join(output_dir, f"{basename}_graphinfo.json")
     # Output JSON including nodes and edges
     with open(outpath, "w", encoding="utf-8") as f:
         json.dump(graph_info, f, ensure_ascii=False, indent=2)
+    write_graph_csr(graph_info, os.path.join(output_dir, f"{basename}_graphinfo{CSR_SUFFIX}"))
+    return outpath
+
+
+def extract_partition(graph_path, basename, output_dir):
+    """one partition graph -> graphinfo (runs in a pool worker); returns (basename, nodes, edges, seconds)"""
+    start = time.perf_counter()
+    graph_info = load_graph(graph_path).to_graphinfo()
+    write_graph_info(graph_info, basename, output_dir)
+    return basename, len(graph_info['nodes']), len(graph_info['edges']), time.perf_counter() - start
+
+
+def extract_partitions(manifest_path, output_dir, max_workers=4):
+    """
+    extract every partition graph listed in a GraphPartition manifest (and the summary graph) in a
+    process pool: centrality is computed per partition, in parallel. returns {name: JSON path}.
+    """
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(manifest_path)
+    entries = list(manifest["partitions"].values()) + ([manifest["summary"]] if manifest.get("summary") else [])
+    outputs = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(extract_partition, os.path.join(base_dir, entry["graph"]), entry["name"], output_dir)
+                   for entry in entries]
+        for future in futures:
+            name, nodes, edges, seconds = future.result()
+            outputs[name] = os.path.join(output_dir, f"{name}_graphinfo.json")
+            print(f"{name}: {nodes} nodes, {edges} edges ({seconds:.2f}s)")
+    print(f"{len(entries)} partition graphs of '{manifest['graph']}' by {manifest['partition_by']} written to: {output_dir}")
+    return outputs
+
+
+def main():
+    if partition_manifest:
+        extract_partitions(partition_manifest, os.path.join(ouput_path, "partitions"), partition_workers)
+        return
+
+    graph_info = load_graph_info(dot_path)
+    # Auto-generate output filename
+    basename = os.path.splitext(os.path.basename(dot_path))[0]
+    outpath = write_graph_info(graph_info, basename, ouput_path)
     print(f"Node and edge information written to: {outpath}")
+    print(f"Memory-mappable graph written to: {os.path.splitext(outpath)[0]}{CSR_SUFFIX}")
     print(f"Total nodes: {len(graph_info['nodes'])}")
     print(f"Total edges: {len(graph_info['edges'])}")
 
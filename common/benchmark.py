@@ -0,0 +1,232 @@
+'''
+End-to-end pipeline benchmark on recorded LLM answers.
+
+Starts common/mock_llm_server.py on the recording in ./.llm_cache, then runs every stage script as
+it is configured (parser -> ChannelInference -> InteractionDiscover -> InteractionFilter ->
+GraphGenerator -> GraphAnalyzer) in its own process, with OPENAI_BASE_URL pointing at the replay
+server and an empty LLM_CACHE_DIR, so every LLM request of stages 1-2 goes over HTTP. For each stage:
+    - wall time
+    - peak memory (max RSS of the stage process)
+    - throughput: items in the stage's output per second (rules, interactions, graph edges), and
+      LLM requests per second for stages 1-2
+The annotated rules of ChannelInference are copied to the file InteractionDiscover and
+InteractionFilter read (the manual hand-off of the normal workflow). A failing stage is reported
+and the later stages still run on whatever inputs they find.
+
+Usage (from the repository root):
+    python common/benchmark.py --latency 0.5 --jitter 0.5 --failure-rate 0.05
+    python common/benchmark.py --stages discover filter graph
+Results go to ./benchmark_output/benchmark_<timestamp>.json, stage logs next to them.
+'''
+
+import argparse
+import glob
+import json
+import os
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from llm_cache import DEFAULT_CACHE_DIR
+from mock_llm_server import ReplayState, serve
+
+OUTPUT_DIR = './benchmark_output'
+
+
+# ==============================================================================
+# 1. Output counters (items written by a stage, or None if it wrote nothing this run)
+# ==============================================================================
+def _newest(pattern, since):
+    paths = [p for p in glob.glob(pattern) if os.path.getmtime(p) >= since]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def count_json_list(pattern, key=None):
+    def count(since):
+        path = _newest(pattern, since)
+        if path is None:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if key is not None and isinstance(data, dict):
+            data = data.get(key, [])
+        return len(data) if isinstance(data, list) else 1
+    return count
+
+
+def count_lines(pattern):
+    def count(since):
+        path = _newest(pattern, since)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return sum(1 for line in f if line.strip())
+    return count
+
+
+def count_edges(pattern):
+    def count(since):
+        path = _newest(pattern, since)
+        if path is None:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return sum(line.count('->') for line in f)
+    return count
+
+
+# name -> (script, unit, counter, sends LLM requests)
+STAGES = {
+    'parser': ('./1-SemanticParser/parser.py', 'rules',
+               count_json_list('./1-SemanticParser/output/*/parsed_rules.json'), True),
+    'channels': ('./2-ChannelInference_TopoFilter/ChannelInference.py', 'rules',
+                 count_json_list('./2-ChannelInference_TopoFilter/output/*_slices/*_merged_output.json'), True),
+    'discover': ('./2-ChannelInference_TopoFilter/InteractionDiscover.py', 'interactions',
+                 count_lines('./2-ChannelInference_TopoFilter/output/interaction/interactions.ndjson'), False),
+    'filter': ('./2-ChannelInference_TopoFilter/InteractionFilter.py', 'interactions',
+               count_lines('./2-ChannelInference_TopoFilter/output/topologyFilter/interactions_filtered.ndjson'), False),
+    'graph': ('./3-GraphGenerator/src/GraphGenerator.py', 'edges',
+              count_edges('./3-GraphGenerator/output/DOT/*.dot'), False),
+    'extract': ('./4-GraphAnalyzer/src/extract_dot_nodes.py', 'nodes',
+                count_json_list('./4-GraphAnalyzer/output/node/*.json', key='nodes'), False),
+    'score': ('./4-GraphAnalyzer/src/CalculateScore.py', 'rows',
+              count_lines('./4-GraphAnalyzer/output/score/*.csv'), False),
+    'draw': ('./4-GraphAnalyzer/src/DrawGraph.py', 'edges',
+             count_edges('./4-GraphAnalyzer/output/subgraph/*.dot'), False),
+}
+
+# stage -> (its output, the file the next stages read it from)
+HANDOFFS = {
+    'channels': ('./2-ChannelInference_TopoFilter/output/*_slices/*_merged_output.json',
+                 './2-ChannelInference_TopoFilter/output/virtualBuilding_gemini-2.5-pro_slices/virtualBuilding_gemini-2.5.json'),
+}
+
+
+# ==============================================================================
+# 2. Stage runner
+# ==============================================================================
+def peak_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_child(script, result_path):
+    """inside the stage process: run the script as __main__, then record its peak memory"""
+    status = 0
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        with open(result_path, 'w', encoding='utf-8') as f:
+            json.dump({'peak_rss_bytes': peak_rss_bytes()}, f)
+    sys.exit(status)
+
+
+def server_stats(base_url):
+    with urllib.request.urlopen(f'{base_url}/stats', timeout=10) as response:
+        return json.load(response)
+
+
+def run_stage(name, env, log_dir, base_url):
+    script, unit, counter, uses_llm = STAGES[name]
+    result_path = os.path.join(log_dir, f'{name}.rss.json')
+    log_path = os.path.join(log_dir, f'{name}.log')
+    before = server_stats(base_url) if uses_llm else None
+    # mtime resolution: outputs written in the first instant of the stage still count
+    since = time.time() - 1
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        completed = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', script, result_path],
+                                   env=env, stdout=log, stderr=subprocess.STDOUT)
+    wall = time.perf_counter() - start
+
+    record = {'stage': name, 'script': script, 'exit_code': completed.returncode,
+              'wall_seconds': round(wall, 3), 'log': log_path}
+    try:
+        with open(result_path, 'r', encoding='utf-8') as f:
+            record['peak_rss_mb'] = round(json.load(f)['peak_rss_bytes'] / 2 ** 20, 1)
+        os.remove(result_path)
+    except (OSError, ValueError, KeyError):
+        record['peak_rss_mb'] = None
+    try:
+        items = counter(since)
+    except (OSError, ValueError):
+        items = None
+    if name in HANDOFFS and completed.returncode == 0:
+        source = _newest(HANDOFFS[name][0], since)
+        if source is not None:
+            shutil.copyfile(source, HANDOFFS[name][1])
+    record['items'] = items
+    record['unit'] = unit
+    record['items_per_second'] = round(items / wall, 2) if items is not None and wall > 0 else None
+    if uses_llm:
+        after = server_stats(base_url)
+        delta = {k: after[k] - before[k] for k in after}
+        record['llm'] = delta
+        record['llm_requests_per_second'] = round(delta['requests'] / wall, 2) if wall > 0 else None
+    return record
+
+
+def report(records):
+    lines = [f"{'stage':<10} {'exit':>4} {'wall s':>9} {'peak MB':>8} {'items':>8} {'items/s':>10} {'LLM req':>8}"]
+    for r in records:
+        llm = r.get('llm', {}).get('requests', '')
+        lines.append(f"{r['stage']:<10} {r['exit_code']:>4} {r['wall_seconds']:>9.2f} "
+                     f"{r['peak_rss_mb'] if r['peak_rss_mb'] is not None else '-':>8} "
+                     f"{r['items'] if r['items'] is not None else '-':>8} "
+                     f"{r['items_per_second'] if r['items_per_second'] is not None else '-':>10} {llm:>8}")
+    return '\n'.join(lines)
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        run_child(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline offline on recorded LLM answers')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--recording', default=DEFAULT_CACHE_DIR, help='LLMCache directory replayed by the server')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--tokens-per-second', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    args = parser.parse_args()
+
+    state = ReplayState(args.recording, args.latency, args.jitter, args.tokens_per_second,
+                        args.failure_rate, seed=args.seed)
+    server = serve(state, port=0)
+    base_url = f'http://127.0.0.1:{server.server_port}/v1'
+    print(f"Replay server on {base_url} with {len(state.cache)} recorded completions")
+
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    log_dir = os.path.join(args.output_dir, f'benchmark_{stamp}')
+    os.makedirs(log_dir, exist_ok=True)
+    records = []
+    with tempfile.TemporaryDirectory(prefix='llm_cache_') as empty_cache:
+        env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY='replay', LLM_CACHE_DIR=empty_cache)
+        for name in args.stages:
+            print(f"Running {name} ({STAGES[name][0]})...")
+            record = run_stage(name, env, log_dir, base_url)
+            records.append(record)
+            if record['exit_code'] != 0:
+                print(f"Warning: {name} exited with {record['exit_code']}, see {record['log']}")
+    server.shutdown()
+
+    result_path = os.path.join(args.output_dir, f'benchmark_{stamp}.json')
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump({'settings': vars(args), 'server': state.stats, 'stages': records}, f, ensure_ascii=False, indent=2)
+    print(report(records))
+    print(f"Results saved to {result_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+'''
+Token-budget-aware chunking for LLM requests.
+
+Instead of a fixed number of items per request, items are packed in order until the estimated
+prompt size (shared context + items) reaches the input budget or the expected answer would
+exceed the completion budget. A chunk whose answer comes back truncated or invalid is halved
+with split_chunk and asked again.
+
+Usage:
+    chunks = plan_chunks(rules, fixed_tokens=estimate_tokens(build_prompt('')),
+                         input_budget=context_window - max_output_tokens,
+                         max_items=max_output_tokens // output_tokens_per_rule)
+'''
+
+from llm_scheduler import estimate_tokens
+
+
+def plan_chunks(items, fixed_tokens, input_budget, max_items=None, count_tokens=estimate_tokens):
+    """
+    greedily pack items (kept in order) into chunks of at most max_items whose estimated size
+    fixed_tokens + sum(count_tokens(item)) stays within input_budget.
+    an item that does not fit on its own still gets a chunk of its own.
+    """
+    chunks = []
+    current = []
+    used = fixed_tokens
+    for item in items:
+        cost = count_tokens(item)
+        if current and (used + cost > input_budget or (max_items and len(current) >= max_items)):
+            chunks.append(current)
+            current = []
+            used = fixed_tokens
+        current.append(item)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_chunk(chunk):
+    """halve a chunk whose response was truncated or invalid"""
+    middle = len(chunk) // 2
+    return chunk[:middle], chunk[middle:]
@@ -0,0 +1,248 @@
+'''
+Typed rule-interaction graph shared by 3-GraphGenerator and 4-GraphAnalyzer.
+
+GraphGenerator builds the graph straight from the rules; the analyzer takes it from memory or from
+the compact .graph.json written next to the DOT export, instead of re-parsing DOT text with regexes
+(extract_dot_nodes.parse_dot) or pygraphviz (DrawGraph). DOT is only an export (to_graphviz).
+
+    node kinds   trigger, action, physical_channel, system_channel, channel, AND, OR,
+                 partition (a node of a partition summary graph, GraphPartition.py)
+    edge kinds   emits (action -> channel), senses (channel -> trigger),
+                 joins (condition -> AND / OR), fires (condition or AND / OR -> action),
+                 crosses (partition -> partition, labelled with what crosses)
+
+Analysis attributes are the ones extract_dot_nodes assigns:
+    edge out of an AND / OR node         explicit           cost 1  stealth 1
+    edge into an AND / OR node           explicit           cost -  stealth -
+    edge touching a physical channel     physical_implicit  cost 5  stealth 3
+    edge touching a system channel       system_implicit    cost 3  stealth 2
+    any other edge                       explicit           cost 1  stealth 1
+
+File layout (.graph.json):
+    {"version": 1, "nodes": [[id, kind, label, rule, device, implicit], ...],
+     "edges": [[source index, target index, edge kind(, label)], ...],
+     "dot_sha256": SHA-256 of the DOT export saved with the graph (optional)}
+The analyzer only uses the graph file instead of its DOT file if that hash matches the DOT file (or,
+for a file without the hash, if the DOT file is not newer), so a regenerated DOT file is never ignored.
+
+Usage:
+    graph = InteractionGraph()
+    graph.add_node('A_Rule_1_0', 'action', 'Action_Rule_1:VAV_1A.set_damper_position(100)', rule='Rule_1', device='VAV_1A')
+    graph.add_edge('A_Rule_1_0', 'CH_temperature', 'emits')
+    graph.save(path, dot_path)                        # dot_path: its DOT export, saved before
+    graph_info = load_graph(path).to_graphinfo()      # {"nodes": [...], "edges": [...]} as read by SearchPath
+    graph = load_graph_for_dot(dot_path)              # None if the graph file does not belong to this DOT file
+'''
+
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+GRAPH_FILE_VERSION = 1
+GRAPH_FILE_SUFFIX = '.graph.json'
+
+# implicit: an AND node added for several conditions without a logical_operator
+Node = namedtuple('Node', ['id', 'kind', 'label', 'rule', 'device', 'implicit'], defaults=[None, None, False])
+Edge = namedtuple('Edge', ['source', 'target', 'kind', 'label'], defaults=[None])
+
+CHANNEL_KINDS = {'physical_channel', 'system_channel', 'channel'}
+LOGIC_KINDS = {'AND', 'OR'}
+CHANNEL_METRICS = {'physical_channel': ('physical_implicit', 5, 3), 'system_channel': ('system_implicit', 3, 2)}
+
+# ==============================================================================
+# 1. DOT export styles
+# ==============================================================================
+GRAPH_ATTRS = dict(rankdir='LR', splines='spline', nodesep='0.7', ranksep='1.5', overlap='prism',
+                   concentrate='false', compound='true', charset='UTF-8')
+CHANNEL_STYLE = dict(shape='ellipse', style='filled', fillcolor='#FFC0CB', fontcolor='black', color='red', penwidth='1.5')
+NODE_STYLES = {
+    'action': dict(shape='box', style='filled,rounded', fillcolor='#FFFACD', color='#BDB76B', fontcolor='#4A4A4A'),
+    'trigger': dict(shape='box', style='filled,rounded', fillcolor='#E0FFFF', color='#4682B4', fontcolor='#3A3A3A'),
+    'logic': dict(shape='diamond', style='filled', fillcolor='#D3D3D3', color='#808080', fontcolor='black'),
+    'implicit_logic': dict(shape='diamond', style='filled', fillcolor='#E8E8E8', color='#B0B0B0', fontsize='10',
+                           fontcolor='black'),
+    'partition': dict(shape='box3d', style='filled', fillcolor='#E6E6FA', color='#6A5ACD', fontcolor='black'),
+}
+EDGE_STYLES = {
+    'emits': dict(color='red', penwidth='1.5'),
+    'senses': dict(color='red', penwidth='1.5'),
+    'joins': dict(color='#AAAAAA', penwidth='1.0'),
+    'implicit_joins': dict(color='#C0C0C0', penwidth='1.0'),
+    'fires': dict(color='#999999', style='dashed', penwidth='1.0'),
+    'crosses': dict(color='#6A5ACD', penwidth='1.5', fontsize='10'),
+}
+# elements off the highlighted paths
+DIMMED_NODE = {'color': '#d3d3d3', 'fontcolor': '#d3d3d3', 'style': 'filled', 'fillcolor': '#f5f5f5'}
+DIMMED_EDGE = {'color': '#d3d3d3'}
+
+
+def _node_style(node):
+    if node.kind in CHANNEL_KINDS:
+        return CHANNEL_STYLE
+    if node.kind in LOGIC_KINDS:
+        return NODE_STYLES['implicit_logic' if node.implicit else 'logic']
+    return NODE_STYLES[node.kind]
+
+# ==============================================================================
+# 2. Graph
+# ==============================================================================
+class InteractionGraph:
+    def __init__(self, name='SmartBuildingRules'):
+        self.name = name
+        # node id -> Node, in insertion order
+        self.nodes = {}
+        self.edges = []
+
+    def add_node(self, node_id, kind, label, rule=None, device=None, implicit=False):
+        self.nodes[node_id] = Node(node_id, kind, label, rule, device, implicit)
+        return node_id
+
+    def add_edge(self, source, target, kind, label=None):
+        self.edges.append(Edge(source, target, kind, label))
+
+    def edge_metrics(self, edge):
+        """(analysis type, cost, stealth) of an edge"""
+        source, target = self.nodes.get(edge.source), self.nodes.get(edge.target)
+        if source is not None and source.kind in LOGIC_KINDS:
+            return 'explicit', 1, 1
+        if target is not None and target.kind in LOGIC_KINDS:
+            return 'explicit', None, None
+        kinds = {node.kind for node in (source, target) if node is not None}
+        for kind in ('physical_channel', 'system_channel'):
+            if kind in kinds:
+                return CHANNEL_METRICS[kind]
+        return 'explicit', 1, 1
+
+    def subgraph(self, node_ids, edge_pairs):
+        """the nodes in node_ids and the edges (source, target) in edge_pairs, in graph order"""
+        sub = InteractionGraph(f'subgraph_{self.name}')
+        for node_id, node in self.nodes.items():
+            if node_id in node_ids:
+                sub.nodes[node_id] = node
+        sub.edges = [edge for edge in self.edges if (edge.source, edge.target) in edge_pairs]
+        return sub
+
+    def centrality(self):
+        """
+        normalized betweenness centrality of the triggers and actions (AND nodes excluded from the
+        graph, channels and logic nodes reported as 0.0), as extract_dot_nodes computes it
+        """
+        import networkx as nx
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.nodes)
+        graph.add_edges_from((edge.source, edge.target) for edge in self.edges)
+        kept = [node_id for node_id, node in self.nodes.items() if node.kind != 'AND']
+        values = nx.betweenness_centrality(graph.subgraph(kept), normalized=True)
+        return {node_id: values.get(node_id, 0) if node.kind != 'AND' and node.kind not in CHANNEL_KINDS else 0.0
+                for node_id, node in self.nodes.items()}
+
+    def to_graphinfo(self, with_centrality=True):
+        """
+        {"nodes": [...], "edges": [...]} in the layout extract_dot_nodes writes and SearchPath /
+        CalculateScore read, plus the rule and device of each node
+        """
+        centrality = self.centrality() if with_centrality else {}
+        nodes = {node_id: {'ID': node_id, 'Label': node.label, 'Type': node.kind, 'Target': [], 'Source': [],
+                           'centrality': centrality.get(node_id, 0.0), 'Rule': node.rule, 'Device': node.device}
+                 for node_id, node in self.nodes.items()}
+        edges = []
+        for edge in self.edges:
+            edge_type, cost, stealth = self.edge_metrics(edge)
+            edges.append({'source': edge.source, 'target': edge.target, 'type': edge_type,
+                          'cost': cost, 'stealth': stealth})
+            if edge.source in nodes:
+                nodes[edge.source]['Target'].append(edge.target)
+            if edge.target in nodes:
+                nodes[edge.target]['Source'].append(edge.source)
+        return {'nodes': list(nodes.values()), 'edges': edges}
+
+    def to_graphviz(self, highlight=None, comment='Smart Building Control Rule Interaction Graph'):
+        """
+        graphviz.Digraph of the graph. highlight: (node ids, (source, target) pairs) to keep in
+        colour, every other element is dimmed.
+        """
+        import graphviz
+        dot = graphviz.Digraph(self.name, comment=comment)
+        dot.attr(**GRAPH_ATTRS)
+        path_nodes, path_edges = highlight if highlight is not None else (None, None)
+        for node_id, node in self.nodes.items():
+            style = dict(_node_style(node))
+            if path_nodes is not None and node_id not in path_nodes:
+                style.update(DIMMED_NODE)
+            dot.node(node_id, label=node.label, **style)
+        for edge in self.edges:
+            style = dict(EDGE_STYLES['implicit_joins' if edge.kind == 'joins' and self.nodes[edge.target].implicit
+                                     else edge.kind])
+            if path_edges is not None and (edge.source, edge.target) not in path_edges:
+                style.update(DIMMED_EDGE)
+            if edge.label is not None:
+                style['label'] = edge.label
+            dot.edge(edge.source, edge.target, **style)
+        return dot
+
+    def save(self, path, dot_path=None):
+        """write the graph file; dot_path: the DOT export of this graph, whose hash is stored with it"""
+        index = {node_id: i for i, node_id in enumerate(self.nodes)}
+        for e in self.edges:
+            for end in (e.source, e.target):
+                if end not in index:
+                    raise ValueError(f"{path}: edge {e.source} -> {e.target} ({e.kind}) ends at {end!r}, "
+                                     f"which was never added with add_node")
+        data = {'version': GRAPH_FILE_VERSION, 'name': self.name,
+                'nodes': [[n.id, n.kind, n.label, n.rule, n.device, int(n.implicit)] for n in self.nodes.values()],
+                'edges': [[index[e.source], index[e.target], e.kind] + ([e.label] if e.label is not None else [])
+                          for e in self.edges]}
+        if dot_path is not None:
+            data['dot_sha256'] = file_digest(dot_path)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_graph(path):
+    """InteractionGraph from a .graph.json file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != GRAPH_FILE_VERSION:
+        raise ValueError(f"{path}: unsupported graph file version {data.get('version')}")
+    graph = InteractionGraph(data.get('name', 'SmartBuildingRules'))
+    ids = []
+    for node_id, kind, label, rule, device, implicit in data['nodes']:
+        graph.add_node(node_id, kind, label, rule, device, bool(implicit))
+        ids.append(node_id)
+    graph.edges = [Edge(ids[source], ids[target], kind, *label) for source, target, kind, *label in data['edges']]
+    return graph
+
+
+def load_graph_for_dot(dot_path):
+    """
+    the typed graph saved next to dot_path (<name>.graph.json) if it was saved with this DOT file,
+    else None (the caller parses the DOT file). prints which source is used and why.
+    """
+    graph_path = os.path.splitext(dot_path)[0] + GRAPH_FILE_SUFFIX
+    if not os.path.exists(graph_path):
+        return None
+    with open(graph_path, 'r', encoding='utf-8') as f:
+        dot_sha256 = json.load(f).get('dot_sha256')
+    if not os.path.exists(dot_path):
+        reason = 'no DOT file next to it'
+    elif dot_sha256 is not None:
+        if dot_sha256 != file_digest(dot_path):
+            print(f"Ignoring typed graph {graph_path}: it was saved with a different version of {dot_path}; parsing the DOT file")
+            return None
+        reason = 'saved with this DOT file'
+    elif os.path.getmtime(dot_path) > os.path.getmtime(graph_path):
+        print(f"Ignoring typed graph {graph_path}: {dot_path} is newer; parsing the DOT file")
+        return None
+    else:
+        reason = 'not older than the DOT file'
+    print(f"Reading typed graph: {graph_path} ({reason})")
+    return load_graph(graph_path)
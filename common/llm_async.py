@@ -0,0 +1,183 @@
+'''
+asyncio execution mode for the LLM stages, built on openai.AsyncOpenAI.
+
+All chunk/slice requests share one event loop: a semaphore bounds how many are in flight,
+async token buckets apply the same requests/tokens-per-minute budgets as llm_scheduler,
+every request has its own timeout, and results are handed to on_result as soon as each
+completion arrives. A hung request times out and is retried (or reported as failed)
+instead of blocking the end of the run.
+
+Usage:
+    runner = AsyncLLMRunner(AsyncOpenAI(...), model_name, cache=llm_cache, max_concurrency=128)
+    asyncio.run(runner.run([(idx, prompt), ...], on_result=save_result, max_completion_tokens=65536))
+    print(runner.report())
+'''
+
+import asyncio
+import random
+import time
+
+from llm_scheduler import estimate_tokens, retry_after_seconds
+from llm_stream import JSONItemStream, replay_items
+
+
+class AsyncTokenBucket:
+    """
+    event-loop version of llm_scheduler.TokenBucket
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class AsyncLLMRunner:
+    def __init__(self, client, model, cache=None, max_concurrency=64, requests_per_minute=None,
+                 tokens_per_minute=None, request_timeout=600, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # job_id -> {'status': 'pending' | 'done' | 'failed', 'attempts': int, 'error': str | None}
+        self.status = {}
+
+    async def _stream(self, prompt, params, on_item):
+        stream = await self.client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=self.model,
+            stream=True,
+            **params
+        )
+        items = JSONItemStream()
+        parts = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                for item in items.feed(delta):
+                    on_item(item)
+        return ''.join(parts)
+
+    async def _complete(self, prompt, params, on_item=None):
+        cached = self.cache.get(self.model, prompt, params) if self.cache else None
+        if cached is not None:
+            if on_item is not None:
+                replay_items(cached, on_item)
+            return cached
+        async with self._semaphore:
+            if self._request_bucket:
+                await self._request_bucket.acquire(1)
+            if self._token_bucket:
+                await self._token_bucket.acquire(estimate_tokens(prompt))
+            if on_item is not None:
+                # the timeout covers the whole streamed answer
+                result = await asyncio.wait_for(self._stream(prompt, params, on_item), timeout=self.request_timeout)
+            else:
+                chat_completion = await asyncio.wait_for(
+                    self.client.chat.completions.create(
+                        messages=[{"role": "user", "content": prompt}],
+                        model=self.model,
+                        stream=False,
+                        **params
+                    ),
+                    timeout=self.request_timeout
+                )
+                result = chat_completion.choices[0].message.content
+        if self.cache:
+            self.cache.put(self.model, prompt, result, params)
+        return result
+
+    async def _run_job(self, job_id, prompt, params, on_item):
+        state = self.status[job_id]
+        item_callback = (lambda item: on_item(job_id, item)) if on_item is not None else None
+        while True:
+            state['attempts'] += 1
+            try:
+                result = await self._complete(prompt, params, item_callback)
+            except asyncio.CancelledError:
+                state['status'] = 'failed'
+                state['error'] = 'cancelled'
+                raise
+            except Exception as e:
+                error = 'timeout' if isinstance(e, asyncio.TimeoutError) else f'{type(e).__name__}: {e}'
+                state['error'] = error
+                if state['attempts'] > self.max_retries:
+                    state['status'] = 'failed'
+                    print(f'Job {job_id} failed after {state["attempts"]} attempts: {error}')
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = min(self.max_delay, self.base_delay * (2 ** (state['attempts'] - 1)))
+                    delay *= random.uniform(0.5, 1.0)
+                print(f'Job {job_id} attempt {state["attempts"]} failed ({error}), retrying in {delay:.1f}s...')
+                await asyncio.sleep(delay)
+                continue
+            state['status'] = 'done'
+            state['error'] = None
+            return job_id, result
+
+    async def run(self, jobs, on_result, on_item=None, **params):
+        """
+        jobs: iterable of (job_id, prompt). on_result(job_id, result) is called in completion order.
+        with on_item, answers are streamed and on_item(job_id, item) is called for every top-level
+        JSON element as it closes (a retried job may repeat items).
+        pending requests are cancelled if the run is interrupted.
+        """
+        # loop-bound primitives are created inside the running loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._request_bucket = AsyncTokenBucket(self.requests_per_minute) if self.requests_per_minute else None
+        self._token_bucket = AsyncTokenBucket(self.tokens_per_minute) if self.tokens_per_minute else None
+
+        tasks = []
+        for job_id, prompt in jobs:
+            self.status[job_id] = {'status': 'pending', 'attempts': 0, 'error': None}
+            tasks.append(asyncio.create_task(self._run_job(job_id, prompt, params, on_item)))
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    job_id, result = await next_done
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    continue
+                on_result(job_id, result)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.status
+
+    def failed(self):
+        return [job_id for job_id, state in self.status.items() if state['status'] == 'failed']
+
+    def report(self):
+        done = sum(1 for state in self.status.values() if state['status'] == 'done')
+        retried = sum(1 for state in self.status.values() if state['attempts'] > 1)
+        failed = self.failed()
+        lines = [f"Async LLM runner: {done}/{len(self.status)} jobs completed, {retried} needed retries, {len(failed)} failed"]
+        for job_id in failed:
+            lines.append(f"  FAILED {job_id}: {self.status[job_id]['error']}")
+        return '\n'.join(lines)
@@ -0,0 +1,172 @@
+'''
+Content-addressed on-disk cache for LLM completions, shared by 1-SemanticParser and 2-ChannelInference.
+
+The key is the SHA-256 of (model, full prompt, request parameters), so a chunk whose prompt,
+rule text, device list and ontology are unchanged is answered from disk instead of the model.
+Entries are evicted least-recently-used once the cache grows past max_entries or max_bytes.
+A read_only cache (e.g. a recording served by mock_llm_server) only answers lookups: it creates
+no directory, does not touch access times and never stores, discards or evicts.
+
+Usage:
+    llm_cache = LLMCache()
+    result = llm_cache.complete(client, model_name, full_prompt, max_completion_tokens=65536)
+    print(llm_cache.report())
+'''
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+# LLM_CACHE_DIR points a run at another cache (e.g. an empty one, to send every request to the replay server)
+DEFAULT_CACHE_DIR = os.environ.get('LLM_CACHE_DIR', './.llm_cache')
+
+
+class LLMCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_entries=10000, max_bytes=1024 * 1024 * 1024, enabled=True,
+                 read_only=False):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> [size in bytes, last access time]
+        self._entries = {}
+        # sum of the entry sizes, kept up to date by put / discard / eviction
+        self._total_bytes = 0
+        if enabled and not read_only:
+            os.makedirs(cache_dir, exist_ok=True)
+        if enabled and os.path.isdir(cache_dir):
+            self._scan()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(model, prompt, params=None):
+        payload = json.dumps({'model': model, 'prompt': prompt, 'params': params or {}},
+                             ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f'{key}.json')
+
+    def _scan(self):
+        for sub in os.listdir(self.cache_dir):
+            sub_dir = os.path.join(self.cache_dir, sub)
+            if not os.path.isdir(sub_dir):
+                continue
+            for name in os.listdir(sub_dir):
+                if name.endswith('.json'):
+                    st = os.stat(os.path.join(sub_dir, name))
+                    self._entries[name[:-len('.json')]] = [st.st_size, st.st_mtime]
+                    self._total_bytes += st.st_size
+
+    def get(self, model, prompt, params=None):
+        """cached response text, or None on a miss"""
+        if not self.enabled:
+            return None
+        key = self.make_key(model, prompt, params)
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        if self.read_only:
+            return entry['response']
+        now = time.time()
+        # the file mtime doubles as the LRU timestamp, so recency survives between runs
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            if key in self._entries:
+                self._entries[key][1] = now
+        return entry['response']
+
+    def put(self, model, prompt, response, params=None):
+        if not self.enabled or self.read_only or response is None:
+            return
+        key = self.make_key(model, prompt, params)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({'model': model, 'params': params or {}, 'created': time.time(), 'response': response},
+                          ensure_ascii=False)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.stores += 1
+            size = os.path.getsize(path)
+            previous = self._entries.get(key)
+            if previous is not None:
+                self._total_bytes -= previous[0]
+            self._entries[key] = [size, time.time()]
+            self._total_bytes += size
+            self._evict()
+
+    def discard(self, model, prompt, params=None):
+        """drop one entry, e.g. a truncated answer that must not be replayed on the next run"""
+        if not self.enabled or self.read_only:
+            return
+        key = self.make_key(model, prompt, params)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._total_bytes -= entry[0]
+
+    def _evict(self):
+        if len(self._entries) <= self.max_entries and self._total_bytes <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if len(self._entries) <= self.max_entries and self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            del self._entries[key]
+            self._total_bytes -= size
+            self.evictions += 1
+
+    def complete(self, client, model, prompt, **params):
+        """
+        chat completion through the cache: returns the message content, calling the model only on a miss
+        """
+        cached = self.get(model, prompt, params)
+        if cached is not None:
+            return cached
+        chat_completion = client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=model,
+            stream=False,
+            **params
+        )
+        result = chat_completion.choices[0].message.content
+        self.put(model, prompt, result, params)
+        return result
+
+    def report(self):
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+        total = self._total_bytes
+        return (f"LLM cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), "
+                f"{self.stores} stored, {self.evictions} evicted, "
+                f"{len(self._entries)} entries / {total / 1024:.1f} KB in {self.cache_dir}")
@@ -0,0 +1,125 @@
+'''
+Decode the JSON payload of an LLM answer, shared by 1-SemanticParser and 2-ChannelInference.
+
+Answers wrap the JSON in <think> blocks, ```json fences or a line of prose, and answers cut off
+by max_completion_tokens end in the middle of a rule. decode_response
+    - skips a leading <think>...</think> block and an opening code fence, then parses from the
+      first '[' / '{' with the C decoder (trailing fences and prose are ignored)
+    - if that fails, rescans the payload once, remembering the last point at which every open
+      array / object could be closed, cuts there and closes them. For a top-level array the cut
+      is at the last complete element, so a truncated answer keeps its complete rules.
+
+Usage:
+    decoded = decode_response(answer)
+    if decoded.repaired:
+        print(f"recovered {decoded.items} rules from a cut-off answer")
+'''
+
+import json
+import re
+from collections import namedtuple
+
+# data: decoded JSON; repaired: the payload was cut off / malformed and closed by the recovery parser;
+# items: top-level elements recovered (1 for an object); dropped_chars: payload characters discarded
+DecodedResponse = namedtuple('DecodedResponse', ['data', 'repaired', 'items', 'dropped_chars'])
+
+PAYLOAD_START = re.compile(r'[\[{]')
+CLOSING = {'[': ']', '{': '}'}
+_decoder = json.JSONDecoder()
+
+
+def payload_start(text):
+    """index of the first '[' or '{' after any <think> block and opening code fence, or -1"""
+    pos = 0
+    think_end = text.find('</think>')
+    if think_end != -1:
+        pos = think_end + len('</think>')
+    fence = text.find('```', pos)
+    # the payload is inside the fence unless a bracket comes before it
+    if fence != -1 and PAYLOAD_START.search(text, pos, fence) is None:
+        pos = fence + 3
+    match = PAYLOAD_START.search(text, pos)
+    return match.start() if match else -1
+
+
+def _count(data):
+    return len(data) if isinstance(data, list) else 1
+
+
+def repair_json(payload):
+    """
+    close a truncated / malformed JSON payload at its last safe point.
+    returns (data, dropped_chars); raises ValueError if nothing can be recovered.
+    """
+    stack = []
+    # (cut position, containers open at that point) after each complete element
+    last_safe = None
+    last_top_safe = None
+    in_string = False
+    escaped = False
+    end = None
+    for pos, ch in enumerate(payload):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in CLOSING:
+            stack.append(ch)
+            last_safe = (pos + 1, tuple(stack))
+            if len(stack) == 1:
+                last_top_safe = last_safe
+        elif ch in ']}':
+            if not stack or CLOSING[stack[-1]] != ch:
+                break
+            stack.pop()
+            if not stack:
+                end = pos + 1
+                break
+            last_safe = (pos + 1, tuple(stack))
+            if len(stack) == 1:
+                last_top_safe = last_safe
+        elif ch == ',' and stack:
+            last_safe = (pos, tuple(stack))
+            if len(stack) == 1:
+                last_top_safe = last_safe
+
+    candidates = []
+    if end is not None:
+        candidates.append((end, ()))
+    # a top-level array is cut after its last complete element, anything else as deep as possible
+    if payload[:1] == '[' and last_top_safe:
+        candidates.append(last_top_safe)
+    if last_safe:
+        candidates.append(last_safe)
+    for cut, open_containers in candidates:
+        text = payload[:cut].rstrip().rstrip(',') + ''.join(CLOSING[c] for c in reversed(open_containers))
+        try:
+            return json.loads(text), len(payload) - cut
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("no JSON payload could be recovered")
+
+
+def decode_response(text):
+    """
+    DecodedResponse for an LLM answer; raises ValueError if it holds no recoverable JSON
+    """
+    start = payload_start(text)
+    if start == -1:
+        raise ValueError("no JSON payload in the response")
+    try:
+        data, _ = _decoder.raw_decode(text, start)
+        return DecodedResponse(data, False, _count(data), 0)
+    except json.JSONDecodeError:
+        pass
+    payload = text[start:].rstrip()
+    if payload.endswith('```'):
+        payload = payload[:-3].rstrip()
+    data, dropped = repair_json(payload)
+    return DecodedResponse(data, True, _count(data), dropped)
@@ -0,0 +1,144 @@
+'''
+Bounded, rate-limited fan-out for LLM requests, shared by 1-SemanticParser and 2-ChannelInference.
+
+    - at most max_concurrency requests are in flight (thread pool instead of one thread per chunk)
+    - token buckets enforce requests-per-minute and (estimated) tokens-per-minute budgets
+    - failed requests are retried with exponential backoff and jitter; Retry-After is honoured on 429s
+    - every job's outcome is tracked, so a slice that still fails after all retries is reported,
+      not silently missing from the merged output
+
+Usage:
+    scheduler = LLMScheduler(max_concurrency=8, requests_per_minute=60, tokens_per_minute=1_000_000)
+    for idx, chunk in enumerate(chunks, 1):
+        scheduler.submit(idx, process_chunk, idx, chunk, estimated_tokens=estimate_tokens(prompt))
+    results = scheduler.run()
+    print(scheduler.report())
+'''
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def estimate_tokens(text):
+    """rough token estimate (~4 characters per token) used for the tokens-per-minute budget"""
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """
+    thread-safe token bucket refilled continuously at rate_per_minute, holding at most capacity tokens
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # a single request larger than the whole bucket would wait forever, cap it at capacity
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_after_seconds(error):
+    """Retry-After hint from an HTTP error (e.g. openai.RateLimitError), if the server sent one"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency=8, requests_per_minute=None, tokens_per_minute=None,
+                 max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.max_concurrency = max_concurrency
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jobs = []
+        # job_id -> {'status': 'pending' | 'done' | 'failed', 'attempts': int, 'error': str | None}
+        self.status = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, fn, *args, estimated_tokens=1, **kwargs):
+        self.jobs.append((job_id, fn, args, kwargs, estimated_tokens))
+        self.status[job_id] = {'status': 'pending', 'attempts': 0, 'error': None}
+
+    def _run_job(self, job_id, fn, args, kwargs, estimated_tokens):
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.request_bucket:
+                self.request_bucket.acquire(1)
+            if self.token_bucket:
+                self.token_bucket.acquire(estimated_tokens)
+            with self._lock:
+                self.status[job_id]['attempts'] = attempt
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                with self._lock:
+                    self.status[job_id]['error'] = f'{type(e).__name__}: {e}'
+                if attempt > self.max_retries:
+                    with self._lock:
+                        self.status[job_id]['status'] = 'failed'
+                    print(f'Job {job_id} failed after {attempt} attempts: {e}')
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+                    delay *= random.uniform(0.5, 1.0)
+                print(f'Job {job_id} attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.1f}s...')
+                time.sleep(delay)
+                continue
+            with self._lock:
+                self.status[job_id]['status'] = 'done'
+                self.status[job_id]['error'] = None
+            return result
+
+    def run(self, on_result=None):
+        """
+        run all submitted jobs; returns {job_id: result} for the jobs that succeeded.
+        on_result(job_id, result) is called in the calling thread as each job finishes.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {pool.submit(self._run_job, *job): job[0] for job in self.jobs}
+            for future in as_completed(futures):
+                job_id = futures[future]
+                try:
+                    results[job_id] = future.result()
+                except Exception:
+                    continue
+                if on_result is not None:
+                    on_result(job_id, results[job_id])
+        self.jobs = []
+        return results
+
+    def failed(self):
+        return [job_id for job_id, state in self.status.items() if state['status'] == 'failed']
+
+    def report(self):
+        done = sum(1 for state in self.status.values() if state['status'] == 'done')
+        retried = sum(1 for state in self.status.values() if state['attempts'] > 1)
+        failed = self.failed()
+        lines = [f"LLM scheduler: {done}/{len(self.status)} jobs completed, {retried} needed retries, {len(failed)} failed"]
+        for job_id in failed:
+            lines.append(f"  FAILED {job_id}: {self.status[job_id]['error']}")
+        return '\n'.join(lines)
@@ -0,0 +1,145 @@
+'''
+Streaming LLM answers with incremental JSON emission, shared by 1-SemanticParser and 2-ChannelInference.
+
+The answer is requested with stream=True and fed through JSONItemStream, which hands back every
+element of the top-level JSON array (a parsed rule, an annotated rule) as soon as its closing
+bracket arrives, so consumers can act on the first rules long before the slowest answer ends.
+The full text is still assembled and cached like LLMCache.complete; a cache hit replays its items.
+
+Usage:
+    text = stream_completion(client, model_name, prompt, on_item=handle_rule, cache=llm_cache,
+                             max_completion_tokens=65536)
+'''
+
+import json
+
+from llm_json import decode_response
+
+
+class JSONItemStream:
+    """
+    incremental parser: feed() text deltas, get back the top-level array elements completed by them
+    (or the top-level object once it closes). A <think> block before the payload is skipped.
+    """
+    def __init__(self):
+        # unconsumed text: everything before the payload starts, then only the element being read
+        self.text = ''
+        self.pos = 0
+        self.started = False
+        self.done = False
+        self.top = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+        self.items = 0
+
+    def _find_start(self):
+        head = self.text.lstrip()
+        search_from = 0
+        if head.startswith('<think>'):
+            think_end = self.text.find('</think>')
+            if think_end == -1:
+                return False
+            search_from = think_end + len('</think>')
+        elif '<think>'.startswith(head):
+            # empty so far, or a <think> tag that has not fully arrived
+            return False
+        for i in range(search_from, len(self.text)):
+            if self.text[i] in '[{':
+                self.started = True
+                self.top = self.text[i]
+                self.depth = 1
+                self.item_start = i if self.top == '{' else None
+                self.pos = i + 1
+                return True
+        return False
+
+    def feed(self, delta):
+        completed = []
+        if self.done:
+            return completed
+        self.text += delta
+        if not self.started and not self._find_start():
+            return completed
+        text = self.text
+        for i in range(self.pos, len(text)):
+            ch = text[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in '[{':
+                self.depth += 1
+                if self.depth == 2 and self.top == '[':
+                    self.item_start = i
+            elif ch in ']}':
+                self.depth -= 1
+                # an array element closes at depth 1, a top-level object at depth 0
+                if self.depth == (1 if self.top == '[' else 0) and self.item_start is not None:
+                    try:
+                        completed.append(json.loads(text[self.item_start:i + 1]))
+                        self.items += 1
+                    except json.JSONDecodeError:
+                        pass
+                    self.item_start = None
+                if self.depth == 0:
+                    # payload finished; whatever follows (closing fence, prose) is ignored
+                    self.done = True
+                    self.text = ''
+                    return completed
+        # keep only the element still being read, so appending stays cheap on long answers
+        if self.item_start is None:
+            self.text = ''
+            self.pos = 0
+        else:
+            self.text = text[self.item_start:]
+            self.pos = len(text) - self.item_start
+            self.item_start = 0
+        return completed
+
+
+def replay_items(text, on_item):
+    """hand the items of a complete (e.g. cached) answer to on_item"""
+    try:
+        data = decode_response(text).data
+    except ValueError:
+        return
+    for item in data if isinstance(data, list) else [data]:
+        on_item(item)
+
+
+def stream_completion(client, model, prompt, on_item, cache=None, **params):
+    """
+    streamed chat completion: on_item(item) is called for each top-level JSON element as it closes.
+    returns the full answer text; cache (an LLMCache) is shared with non-streamed requests.
+    """
+    cached = cache.get(model, prompt, params) if cache else None
+    if cached is not None:
+        replay_items(cached, on_item)
+        return cached
+    stream = client.chat.completions.create(
+        messages=[{"role": "user", "content": prompt}],
+        model=model,
+        stream=True,
+        **params
+    )
+    items = JSONItemStream()
+    parts = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            for item in items.feed(delta):
+                on_item(item)
+    result = ''.join(parts)
+    if cache:
+        cache.put(model, prompt, result, params)
+    return result
@@ -0,0 +1,215 @@
+'''
+Replay server for recorded LLM completions: an OpenAI-compatible /v1/chat/completions endpoint
+that answers from an LLMCache directory, so stages 1-2 run offline and reproducibly.
+
+Every live run records its answers in ./.llm_cache (LLMCache). The server looks a request up
+under the same key (model, user prompt, request parameters other than stream) and replays the
+answer, as one message or as an SSE stream (stream=True). A request without a recording gets a
+404. Latency and failures are injected on purpose:
+    --latency / --jitter        seconds before the first byte (uniform jitter added)
+    --tokens-per-second         pace of the answer, streamed or not (0 = as fast as possible)
+    --failure-rate              share of requests answered with one of --failure-status (429 / 500 / 503)
+
+Point a stage at it through the environment read by parser.py / ChannelInference.py:
+    python common/mock_llm_server.py --port 8765 --latency 0.5 --failure-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 LLM_CACHE_DIR=/tmp/empty_cache python 1-SemanticParser/parser.py
+(an empty LLM_CACHE_DIR makes the stage send its requests instead of answering from its own cache)
+'''
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from llm_cache import LLMCache, DEFAULT_CACHE_DIR
+from llm_scheduler import estimate_tokens
+
+# request fields that are not part of the cache key
+TRANSPORT_FIELDS = {'model', 'messages', 'stream', 'stream_options', 'user', 'n'}
+STREAM_CHUNK_CHARS = 64
+
+
+def request_prompt(messages):
+    """the prompt text the stages cache under: their single user message (joined if there are several)"""
+    return '\n'.join(m.get('content') or '' for m in messages if m.get('role', 'user') == 'user')
+
+
+class ReplayState:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, latency=0.0, jitter=0.0, tokens_per_second=0.0,
+                 failure_rate=0.0, failure_status=(429, 500, 503), seed=None):
+        # read-only: replaying never evicts, extends or touches (LRU mtimes) the recording
+        self.cache = LLMCache(cache_dir, read_only=True)
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.failure_status = list(failure_status)
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'replayed': 0, 'streamed': 0, 'missing': 0, 'injected_failures': 0}
+
+    def count(self, field):
+        with self._lock:
+            self.stats[field] += 1
+
+    def draw(self):
+        """(delay before answering, injected status or None) for one request"""
+        with self._lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.failure_rate
+            status = self.random.choice(self.failure_status) if failed else None
+        return delay, status
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # set by serve()
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message, error_type, headers=None):
+        self._send_json(status, {'error': {'message': message, 'type': error_type, 'code': status}}, headers)
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/stats'):
+            with self.state._lock:
+                self._send_json(200, dict(self.state.stats))
+        else:
+            self._error(404, f'unknown path {self.path}', 'not_found')
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._error(404, f'unknown path {self.path}', 'not_found')
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError):
+            self._error(400, 'request body is not JSON', 'invalid_request_error')
+            return
+        state = self.state
+        state.count('requests')
+        delay, injected = state.draw()
+        time.sleep(delay)
+        if injected is not None:
+            state.count('injected_failures')
+            headers = {'Retry-After': '1'} if injected == 429 else None
+            self._error(injected, f'injected failure ({injected})', 'server_error', headers)
+            return
+
+        model = body.get('model')
+        prompt = request_prompt(body.get('messages') or [])
+        params = {k: v for k, v in body.items() if k not in TRANSPORT_FIELDS}
+        text = state.cache.get(model, prompt, params)
+        if text is None:
+            state.count('missing')
+            self._error(404, 'no recorded completion for this request', 'not_found')
+            return
+        state.count('replayed')
+        if body.get('stream'):
+            state.count('streamed')
+            self._stream(model, text)
+        else:
+            self._pace(text)
+            self._send_json(200, self._completion(model, text, prompt))
+
+    def _pace(self, text):
+        if self.state.tokens_per_second > 0:
+            time.sleep(estimate_tokens(text) / self.state.tokens_per_second)
+
+    @staticmethod
+    def _completion(model, text, prompt):
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        return {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        }
+
+    def _stream(self, model, text):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+
+        def event(delta, finish_reason=None):
+            chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': model, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+            self.wfile.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            event({'role': 'assistant', 'content': ''})
+            for i in range(0, len(text), STREAM_CHUNK_CHARS):
+                piece = text[i:i + STREAM_CHUNK_CHARS]
+                self._pace(piece)
+                event({'content': piece})
+            event({}, 'stop')
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def serve(state, host='127.0.0.1', port=8765):
+    """start the replay server in a background thread; returns the server (server.server_port, server.shutdown())"""
+    handler = type('BoundReplayHandler', (ReplayHandler,), {'state': state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded LLM completions over an OpenAI-compatible API')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='LLMCache directory holding the recording')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds before the first byte')
+    parser.add_argument('--jitter', type=float, default=0.0, help='uniform extra latency, seconds')
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help='answer pace, 0 = unthrottled')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of requests that fail')
+    parser.add_argument('--failure-status', type=int, nargs='+', default=[429, 500, 503])
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    state = ReplayState(args.cache_dir, args.latency, args.jitter, args.tokens_per_second,
+                        args.failure_rate, args.failure_status, args.seed)
+    server = serve(state, args.host, args.port)
+    print(f"Replaying {len(state.cache)} recorded completions from {args.cache_dir} "
+          f"at http://{args.host}:{server.server_port}/v1 (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(state.stats))
+
+
+if __name__ == '__main__':
+    main()
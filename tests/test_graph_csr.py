@@ -0,0 +1,61 @@
+'''
+A graph written to .gcsr (4-GraphAnalyzer/src/GraphCSR.py) must read back as the graphinfo it was
+written from, and SearchPath must find the same paths on it as on the JSON graphinfo.
+
+Usage:
+    python -m pytest -q tests
+'''
+
+import json
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'common'))
+sys.path.append(os.path.join(ROOT, '3-GraphGenerator', 'src'))
+sys.path.append(os.path.join(ROOT, '4-GraphAnalyzer', 'src'))
+from GraphCSR import write_graph_csr, load_graph_csr
+from SearchPath import DirectedGraphPathFinder
+
+RULES_PATH = os.path.join(ROOT, '3-GraphGenerator', 'input', 'virtualBuilding_filter.json')
+TARGET_ID = 'A_Rule_58_0'
+
+
+def graph_info():
+    """graphinfo of the committed filtered rules, with distinct centrality values instead of networkx's"""
+    from GraphGenerator import build_interaction_graph
+    with open(RULES_PATH, 'r', encoding='utf-8') as f:
+        info = build_interaction_graph(json.load(f)).to_graphinfo(with_centrality=False)
+    for i, node in enumerate(info['nodes']):
+        node['centrality'] = i / 7
+    return info
+
+
+def test_round_trip(tmp_path):
+    info = graph_info()
+    path = str(tmp_path / 'graph_graphinfo.gcsr')
+    write_graph_csr(info, path)
+    with load_graph_csr(path) as csr:
+        assert csr.to_graphinfo() == info
+
+        nodes, edges = csr.node_dict(), csr.edge_dict()
+        assert list(nodes) == [n['ID'] for n in info['nodes']]
+        for node in info['nodes']:
+            assert nodes[node['ID']] == node
+        # the last edge between two nodes wins, as in CalculateScore's {(source, target): edge}
+        expected_edges = {(e['source'], e['target']): e for e in info['edges']}
+        assert len(edges) == len(info['edges'])
+        for key, edge in expected_edges.items():
+            assert edges[key] == edge
+        assert 'no such node' not in nodes
+
+
+def test_search_path_same_on_csr_and_json(tmp_path):
+    info = graph_info()
+    path = str(tmp_path / 'graph_graphinfo.gcsr')
+    write_graph_csr(info, path)
+    with load_graph_csr(path) as csr:
+        from_csr = DirectedGraphPathFinder(csr, 'graph').get_paths_as_lists(TARGET_ID)
+    from_json = DirectedGraphPathFinder(info, 'graph').get_paths_as_lists(TARGET_ID)
+    assert from_json
+    assert from_csr == from_json
@@ -0,0 +1,87 @@
+'''
+The typed graph (common/graph_model.py) must give 4-GraphAnalyzer the same graphinfo that
+extract_dot_nodes.parse_dot reads back from its DOT export.
+
+Usage:
+    python -m pytest -q tests
+'''
+
+import json
+import os
+import sys
+from collections import Counter
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'common'))
+sys.path.append(os.path.join(ROOT, '3-GraphGenerator', 'src'))
+sys.path.append(os.path.join(ROOT, '4-GraphAnalyzer', 'src'))
+from graph_model import InteractionGraph, load_graph, load_graph_for_dot
+
+RULES_PATH = os.path.join(ROOT, '3-GraphGenerator', 'input', 'virtualBuilding_filter.json')
+
+
+def build_graph():
+    from GraphGenerator import build_interaction_graph
+    with open(RULES_PATH, 'r', encoding='utf-8') as f:
+        return build_interaction_graph(json.load(f))
+
+
+def test_graphinfo_matches_parse_dot(tmp_path):
+    pytest.importorskip('graphviz')
+    pytest.importorskip('networkx')
+    from extract_dot_nodes import parse_dot
+    graph = build_graph()
+    dot_path = str(tmp_path / 'graph.dot')
+    graph.to_graphviz().save(dot_path)
+
+    expected = parse_dot(dot_path)
+    actual = graph.to_graphinfo()
+    expected_nodes = {n['ID']: n for n in expected['nodes']}
+    actual_nodes = {n['ID']: n for n in actual['nodes']}
+    assert actual_nodes.keys() == expected_nodes.keys()
+    for node_id, node in actual_nodes.items():
+        dot_node = expected_nodes[node_id]
+        assert node['Type'] == dot_node['Type'], node_id
+        assert node['Target'] == dot_node['Target'], node_id
+        assert node['Source'] == dot_node['Source'], node_id
+        assert node['centrality'] == pytest.approx(dot_node['centrality']), node_id
+        # parse_dot stops a label at its first quote; the typed graph keeps it whole
+        if '"' not in node['Label']:
+            assert node['Label'] == dot_node['Label'], node_id
+    edge_key = lambda e: (e['source'], e['target'], e['type'], e['cost'], e['stealth'])
+    assert Counter(map(edge_key, actual['edges'])) == Counter(map(edge_key, expected['edges']))
+
+
+def test_save_load_round_trip(tmp_path):
+    graph = build_graph()
+    path = str(tmp_path / 'graph.graph.json')
+    graph.save(path)
+    loaded = load_graph(path)
+    assert loaded.nodes == graph.nodes
+    assert loaded.edges == graph.edges
+
+
+def test_graph_file_only_used_with_its_dot_file(tmp_path):
+    graph = InteractionGraph()
+    graph.add_node('T_Rule_1_0', 'trigger', 'Trigger_Rule_1', rule='Rule_1')
+    graph.add_node('A_Rule_1_0', 'action', 'Action_Rule_1', rule='Rule_1')
+    graph.add_edge('T_Rule_1_0', 'A_Rule_1_0', 'fires')
+    dot_path = str(tmp_path / 'g.dot')
+    with open(dot_path, 'w', encoding='utf-8') as f:
+        f.write('digraph g { T_Rule_1_0 -> A_Rule_1_0 }\n')
+    graph.save(str(tmp_path / 'g.graph.json'), dot_path)
+    assert load_graph_for_dot(dot_path).nodes == graph.nodes
+
+    with open(dot_path, 'a', encoding='utf-8') as f:
+        f.write('// regenerated\n')
+    assert load_graph_for_dot(dot_path) is None
+
+
+def test_save_rejects_dangling_edge(tmp_path):
+    graph = InteractionGraph()
+    graph.add_node('T_Rule_1_0', 'trigger', 'Trigger_Rule_1')
+    graph.add_edge('T_Rule_1_0', 'A_Rule_1_0', 'fires')
+    with pytest.raises(ValueError, match='A_Rule_1_0'):
+        graph.save(str(tmp_path / 'g.graph.json'))
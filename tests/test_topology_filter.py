@@ -0,0 +1,75 @@
+'''
+TopologyIndex (table lookup) and TopologyIndex.judge_batch / filter_interaction_table (NumPy masks)
+must give exactly the verdict and reason of the scalar is_reachable rules they replace.
+
+Usage:
+    python -m pytest -q tests
+'''
+
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, '2-ChannelInference_TopoFilter'))
+import InteractionFilter as F
+from InteractionTable import InteractionTable
+
+INTERACTIONS_PATH = os.path.join(ROOT, '2-ChannelInference_TopoFilter', 'output', 'interaction', 'interactions.json')
+
+
+def committed_interactions():
+    with open(INTERACTIONS_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def scalar(channel):
+    return F.is_reachable(channel, F.device_locations, F.space_floors, F.hvac_service_zones, F.space_adjacencies)
+
+
+def channel_of(details):
+    return {'source': details['actions']['device_location'], 'target': details['triggers']['device_location'],
+            'type': details['actions']['implicit_channel']}
+
+
+def all_pairs():
+    # every location pair (plus an unknown one) for channels of every class: R1-R4 and both unknown cases
+    locations = list(F.space_floors) + ['Nowhere']
+    for channel_type in ('temperature', 'sound', 'luminance', 'smoke'):
+        for source in locations:
+            for target in locations:
+                yield {'source': source, 'target': target, 'type': channel_type}
+
+
+def test_index_matches_is_reachable():
+    index = F.TopologyIndex(F.space_floors, F.hvac_service_zones, F.space_adjacencies)
+    channels = [channel_of(d) for d in committed_interactions().values()] + list(all_pairs())
+    for channel in channels:
+        assert index.is_reachable(channel) == scalar(channel), channel
+
+
+def test_judge_batch_matches_is_reachable():
+    pytest.importorskip('numpy')
+    index = F.TopologyIndex(F.space_floors, F.hvac_service_zones, F.space_adjacencies)
+    channels = [channel_of(d) for d in committed_interactions().values()] + list(all_pairs())
+    verdicts, codes = index.judge_batch(*index.encode_batch([c['source'] for c in channels],
+                                                            [c['target'] for c in channels],
+                                                            [c['type'] for c in channels]))
+    for channel, verdict, code in zip(channels, verdicts, codes):
+        assert (bool(verdict), index.reasons[code]) == scalar(channel), channel
+
+
+def test_filter_interaction_table_matches_is_reachable(tmp_path):
+    pytest.importorskip('numpy')
+    interactions = committed_interactions()
+    table = InteractionTable()
+    table.extend(interactions.values())
+    table_path = str(tmp_path / 'interactions.itab')
+    table.save(table_path)
+
+    result = F.filter_interaction_table(table_path)
+    assert len(result['verdicts']) == len(interactions)
+    for details, verdict, code in zip(interactions.values(), result['verdicts'], result['reasons']):
+        assert (bool(verdict), result['topology'].reasons[code]) == scalar(channel_of(details))